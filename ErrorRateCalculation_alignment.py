@@ -0,0 +1,174 @@
+import re
+from collections import Counter
+from ErrorRateCalculation_levenshtein import (
+    Vocabulary, EQUAL, SUB, DEL, INS, OP_NAMES, new_alignment, push_run, iter_opcodes
+)
+from report_sink import register_text_format
+
+# Per-file alignments and corpus confusion statistics, taken from the alignment the WER computation
+# already made. In reports an alignment is one compact string, run length then op per run,
+# e.g. "12=1S3=2D1I40=" (see ErrorRateCalculation_levenshtein for the ops).
+
+# hotspot key of insertions before the first GT word
+START = "<start>"
+
+
+def format_alignment(ops, runs):
+    return "".join(f"{length}{OP_NAMES[op]}" for op, length in zip(ops, runs))
+
+
+def parse_alignment(text: str):
+    ops, runs = new_alignment()
+    for length, op in re.findall(r"(\d+)([=SDI])", text):
+        push_run(ops, runs, OP_NAMES.index(op), int(length))
+    return ops, runs
+
+
+def alignment_counts(ops, runs):
+    counts = [0, 0, 0, 0]
+    for op, length in zip(ops, runs):
+        counts[op] += length
+    return counts[SUB], counts[DEL], counts[INS]
+
+
+# SequenceMatcher opcodes as an alignment, split like the difflib counts:
+# a replace is substitutions for the shorter side, the rest deletions or insertions
+def alignment_from_difflib(opcodes):
+    ops, runs = new_alignment()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            push_run(ops, runs, EQUAL, i2 - i1)
+        elif tag == "replace":
+            subs = min(i2 - i1, j2 - j1)
+            push_run(ops, runs, SUB, subs)
+            push_run(ops, runs, DEL, (i2 - i1) - subs)
+            push_run(ops, runs, INS, (j2 - j1) - subs)
+        elif tag == "delete":
+            push_run(ops, runs, DEL, i2 - i1)
+        elif tag == "insert":
+            push_run(ops, runs, INS, j2 - j1)
+    return ops, runs
+
+
+# Substitution pairs, deleted words, inserted words and insertion hotspots (the GT word an insertion
+# follows), counted over token IDs of the stats' own vocabulary. Worker processes have their own
+# vocabularies, so they send export() (words) and the parent merge()s it.
+class ConfusionStats:
+
+    def __init__(self, vocabulary: Vocabulary = None):
+        self.vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        self.substituted = Counter()  # (gt id, transcription id) -> count
+        self.deleted = Counter()  # gt id -> count
+        self.inserted = Counter()  # transcription id -> count
+        self.inserted_after = Counter()  # gt id before the insertion (None at the start) -> inserted words
+
+    # gt/tr: the aligned sequences; word(item) gives the word of an item when they hold IDs of another
+    # vocabulary. before: the GT word preceding gt[0], for alignments of a segment. Only edit runs are read.
+    def add(self, gt, tr, ops, runs, word=None, before: str = None):
+        word_id = self.vocabulary.id
+        if word is None:
+            def word(item):
+                return item
+
+        for op, i1, i2, j1, j2 in iter_opcodes(ops, runs):
+            if op == SUB:
+                for k in range(i2 - i1):
+                    self.substituted[word_id(word(gt[i1 + k])), word_id(word(tr[j1 + k]))] += 1
+            elif op == DEL:
+                for i in range(i1, i2):
+                    self.deleted[word_id(word(gt[i]))] += 1
+            elif op == INS:
+                for j in range(j1, j2):
+                    self.inserted[word_id(word(tr[j]))] += 1
+                if i1 > 0:
+                    self.inserted_after[word_id(word(gt[i1 - 1]))] += j2 - j1
+                else:
+                    self.inserted_after[None if before is None else word_id(before)] += j2 - j1
+
+    def _word(self, token_id):
+        return START if token_id is None else self.vocabulary.word(token_id)
+
+    def export(self):
+        return {
+            "substituted": [(self._word(a), self._word(b), n) for (a, b), n in self.substituted.items()],
+            "deleted": [(self._word(token_id), n) for token_id, n in self.deleted.items()],
+            "inserted": [(self._word(token_id), n) for token_id, n in self.inserted.items()],
+            "inserted_after": [(self._word(token_id), n) for token_id, n in self.inserted_after.items()],
+        }
+
+    def merge(self, exported):
+        word_id = self.vocabulary.id
+
+        def key(word):
+            return None if word == START else word_id(word)
+
+        for gt_word, tr_word, n in exported["substituted"]:
+            self.substituted[word_id(gt_word), word_id(tr_word)] += n
+        for name in ("deleted", "inserted", "inserted_after"):
+            counter = getattr(self, name)
+            for word, n in exported[name]:
+                counter[key(word)] += n
+
+    def _ranked(self, counter, n):
+        ranked = sorted(counter.items(), key=lambda item: (-item[1], self._label(item[0])))
+        return ranked if n is None else ranked[:n]
+
+    def _label(self, key):
+        if isinstance(key, tuple):
+            return tuple(self._word(token_id) for token_id in key)
+        return self._word(key)
+
+    # (gt word, transcription word, count), most frequent first
+    def top_substitutions(self, n: int = None):
+        return [(self._word(a), self._word(b), count) for (a, b), count in self._ranked(self.substituted, n)]
+
+    # (word, count) tables, most frequent first
+    def most_deleted(self, n: int = None):
+        return [(self._word(token_id), count) for token_id, count in self._ranked(self.deleted, n)]
+
+    def most_inserted(self, n: int = None):
+        return [(self._word(token_id), count) for token_id, count in self._ranked(self.inserted, n)]
+
+    def insertion_hotspots(self, n: int = None):
+        return [(self._word(token_id), count) for token_id, count in self._ranked(self.inserted_after, n)]
+
+    # one record per table row; CSV/Parquet reports get one table per kind
+    def records(self, n: int = 50):
+        records = []
+        for rank, (gt_word, tr_word, count) in enumerate(self.top_substitutions(n), 1):
+            records.append({"kind": "confusion_substitution", "rank": rank, "gt_word": gt_word,
+                            "transcription_word": tr_word, "count": count})
+        for rank, (word, count) in enumerate(self.most_deleted(n), 1):
+            records.append({"kind": "confusion_deletion", "rank": rank, "word": word, "count": count})
+        for rank, (word, count) in enumerate(self.most_inserted(n), 1):
+            records.append({"kind": "confusion_insertion", "rank": rank, "word": word, "count": count})
+        for rank, (word, count) in enumerate(self.insertion_hotspots(n), 1):
+            records.append({"kind": "confusion_insertion_hotspot", "rank": rank, "after_word": word,
+                            "inserted_words": count})
+        return records
+
+
+def formatSubstitution(record):
+    header = "MOST FREQUENT SUBSTITUTIONS (GT -> transcription)\n" if record["rank"] == 1 else ""
+    return header + f"{record['rank']:>4}. {record['gt_word']} -> {record['transcription_word']}: {record['count']}\n"
+
+
+def formatDeletion(record):
+    header = "MOST DELETED WORDS\n" if record["rank"] == 1 else ""
+    return header + f"{record['rank']:>4}. {record['word']}: {record['count']}\n"
+
+
+def formatInsertion(record):
+    header = "MOST INSERTED WORDS\n" if record["rank"] == 1 else ""
+    return header + f"{record['rank']:>4}. {record['word']}: {record['count']}\n"
+
+
+def formatInsertionHotspot(record):
+    header = "INSERTION HOTSPOTS (GT word before the inserted words)\n" if record["rank"] == 1 else ""
+    return header + f"{record['rank']:>4}. {record['after_word']}: {record['inserted_words']}\n"
+
+
+register_text_format("confusion_substitution", formatSubstitution)
+register_text_format("confusion_deletion", formatDeletion)
+register_text_format("confusion_insertion", formatInsertion)
+register_text_format("confusion_insertion_hotspot", formatInsertionHotspot)
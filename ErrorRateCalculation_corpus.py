@@ -0,0 +1,193 @@
+import numpy as np
+from ErrorRateCalculation_tokenizer import tokenize
+from ErrorRateCalculation_levenshtein import Vocabulary, levenshtein_counts
+
+# max DP cells (pairs x GT words rounded up to 64 x transcription words) held in one batch
+MAX_BATCH_CELLS = 2 ** 26
+
+ONE = np.uint64(1)
+TOP_BIT = np.uint64(63)
+
+
+# The bit-parallel (Myers/Hyyrö) DP of levenshtein_counts, run on a whole batch of padded ID arrays at once:
+# GT words are the bits of 64-bit words, and each transcription word is one NumPy step over all pairs.
+# The walk back is vectorized the same way, with the same tie-break as levenshtein_counts:
+# match/substitution, then deletion, then insertion.
+
+def _batch_counts(gt_ids, tr_ids):
+
+    batch = len(gt_ids)
+    gt_lens = np.array([len(ids) for ids in gt_ids], dtype=np.int64)
+    tr_lens = np.array([len(ids) for ids in tr_ids], dtype=np.int64)
+    words = (int(gt_lens.max()) + 63) // 64
+    m = int(tr_lens.max())
+
+    # different padding values so padding never counts as a match
+    gt = np.full((batch, words * 64), -1, dtype=np.int64)
+    tr = np.full((batch, m), -2, dtype=np.int64)
+    for b in range(batch):
+        gt[b, :gt_lens[b]] = gt_ids[b]
+        tr[b, :tr_lens[b]] = tr_ids[b]
+
+    # vertical and horizontal delta vectors of every column, as (column, 64-bit word, pair);
+    # rows past a pair's GT length hold garbage, but no row depends on the rows below it
+    vps = np.empty((m + 1, words, batch), dtype=np.uint64)
+    vns = np.empty_like(vps)
+    hps = np.zeros_like(vps)
+    hns = np.zeros_like(vps)
+    vps[0] = ~np.uint64(0)
+    vns[0] = 0
+
+    for j in range(m):
+        # bit i set where GT word i equals transcription word j
+        x = np.packbits(gt == tr[:, j:j + 1], axis=1, bitorder="little").view("<u8").T
+        vp, vn = vps[j], vns[j]
+        carry = np.zeros(batch, dtype=np.uint64)
+        hp_in = np.ones(batch, dtype=np.uint64)
+        hn_in = np.zeros(batch, dtype=np.uint64)
+        for w in range(words):
+            # (x & vp) + vp, with the carry running across the 64-bit words
+            t = x[w] & vp[w]
+            total = t + vp[w]
+            with_carry = total + carry
+            carry = ((total < t) | (with_carry < total)).astype(np.uint64)
+            d0 = (with_carry ^ vp[w]) | x[w] | vn[w]
+            hp = vn[w] | ~(d0 | vp[w])
+            hn = d0 & vp[w]
+            hps[j + 1, w] = hp
+            hns[j + 1, w] = hn
+            hp_shift = (hp << ONE) | hp_in
+            hn_shift = (hn << ONE) | hn_in
+            hp_in, hn_in = hp >> TOP_BIT, hn >> TOP_BIT
+            vps[j + 1, w] = hn_shift | ~(d0 | hp_shift)
+            vns[j + 1, w] = hp_shift & d0
+
+    # walk all alignments back together; with d = D[i][j], h = d - D[i][j - 1] and
+    # v_left = D[i][j - 1] - D[i - 1][j - 1], the diagonal step fits when h + v_left == cost
+    i, j = gt_lens.copy(), tr_lens.copy()
+    subs = np.zeros(batch, dtype=np.int64)
+    dels = np.zeros(batch, dtype=np.int64)
+    ins = np.zeros(batch, dtype=np.int64)
+    active = np.flatnonzero((i > 0) & (j > 0))
+    while active.size:
+        ia, ja = i[active], j[active]
+        word, bit = (ia - 1) >> 6, ((ia - 1) & 63).astype(np.uint64)
+
+        def delta(positive, negative, column):
+            return (((positive[column, word, active] >> bit) & ONE).astype(np.int64)
+                    - ((negative[column, word, active] >> bit) & ONE).astype(np.int64))
+
+        cost = gt[active, ia - 1] != tr[active, ja - 1]
+        diag = delta(hps, hns, ja) + delta(vps, vns, ja - 1) == cost
+        delete = ~diag & (delta(vps, vns, ja) == 1)
+        insert = ~(diag | delete)
+        subs[active] += diag & cost
+        dels[active] += delete
+        ins[active] += insert
+        i[active] -= diag | delete
+        j[active] -= diag | insert
+        active = active[(i[active] > 0) & (j[active] > 0)]
+
+    dels += i
+    ins += j
+    return subs, dels, ins
+
+
+def error_rates(num_words, num_subs, num_del, num_ins):
+    wer = ((num_subs + num_del + num_ins) / num_words * 100) if num_words > 0 else 0
+    deleted_rate = (num_del / num_words * 100) if num_words > 0 else 0
+    added_rate = (num_ins / num_words * 100) if num_words > 0 else 0
+    return wer, deleted_rate, added_rate
+
+
+# (substitutions, deletions, insertions) per (gt ids, transcription ids) pair, in the same order
+
+def corpus_counts(encoded, max_batch_cells: int = MAX_BATCH_CELLS):
+
+    counts = [None] * len(encoded)
+
+    # empty sides need no alignment, oversized pairs go to the bit-parallel engine
+    pending = []
+    for k, (gt_ids, tr_ids) in enumerate(encoded):
+        if not gt_ids or not tr_ids or -(-len(gt_ids) // 64) * 64 * len(tr_ids) > max_batch_cells:
+            counts[k] = levenshtein_counts(gt_ids, tr_ids)
+        else:
+            pending.append(k)
+
+    # similar lengths together keeps the padding small
+    pending.sort(key=lambda k: (len(encoded[k][0]), len(encoded[k][1])))
+    start = 0
+    while start < len(pending):
+        end = start + 1
+        n = -(-len(encoded[pending[start]][0]) // 64) * 64
+        m = len(encoded[pending[start]][1])
+        while end < len(pending):
+            n_next = max(n, -(-len(encoded[pending[end]][0]) // 64) * 64)
+            m_next = max(m, len(encoded[pending[end]][1]))
+            if (end - start + 1) * n_next * m_next > max_batch_cells:
+                break
+            n, m = n_next, m_next
+            end += 1
+
+        chunk = pending[start:end]
+        subs, dels, ins = _batch_counts(
+            [encoded[k][0] for k in chunk],
+            [encoded[k][1] for k in chunk],
+        )
+        for b, k in enumerate(chunk):
+            counts[k] = (int(subs[b]), int(dels[b]), int(ins[b]))
+        start = end
+
+    return counts
+
+
+# pairs: (groundtruth_text, transcription_text), results keep the same order
+
+def compute_corpus_wer(pairs, vocabulary: Vocabulary = None, max_batch_cells: int = MAX_BATCH_CELLS,
+                       language: str = "fi"):
+
+    vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+
+    encoded = []
+    for gt_text, tr_text in pairs:
+        encoded.append((
+            vocabulary.encode(tokenize(gt_text, language)),
+            vocabulary.encode(tokenize(tr_text, language)),
+        ))
+
+    counts = corpus_counts(encoded, max_batch_cells)
+
+    per_file = []
+    total_GTwords = total_Transcriptionwords = 0
+    total_subs = total_del = total_ins = 0
+    for (gt_ids, tr_ids), (num_subs, num_del, num_ins) in zip(encoded, counts):
+        wer, deleted_rate, added_rate = error_rates(len(gt_ids), num_subs, num_del, num_ins)
+        per_file.append({
+            "gt_words": len(gt_ids),
+            "transcription_words": len(tr_ids),
+            "substitutions": num_subs,
+            "deletions": num_del,
+            "insertions": num_ins,
+            "wer": wer,
+            "deleted_rate": deleted_rate,
+            "added_rate": added_rate,
+        })
+        total_GTwords += len(gt_ids)
+        total_Transcriptionwords += len(tr_ids)
+        total_subs += num_subs
+        total_del += num_del
+        total_ins += num_ins
+
+    wer, deleted_rate, added_rate = error_rates(total_GTwords, total_subs, total_del, total_ins)
+    totals = {
+        "gt_words": total_GTwords,
+        "transcription_words": total_Transcriptionwords,
+        "substitutions": total_subs,
+        "deletions": total_del,
+        "insertions": total_ins,
+        "wer": wer,
+        "deleted_rate": deleted_rate,
+        "added_rate": added_rate,
+    }
+
+    return per_file, totals
@@ -0,0 +1,234 @@
+from array import array
+from math import isqrt
+
+
+# Shared word -> integer ID table, so every file of a run is aligned over compact ID arrays
+
+class Vocabulary:
+
+    def __init__(self):
+        self.word_to_id = {}
+        self.id_to_word = []
+
+    def __len__(self):
+        return len(self.id_to_word)
+
+    def id(self, word):
+        token_id = self.word_to_id.get(word)
+        if token_id is None:
+            token_id = len(self.id_to_word)
+            self.word_to_id[word] = token_id
+            self.id_to_word.append(word)
+        return token_id
+
+    def encode(self, words):
+        word_to_id = self.word_to_id
+        try:
+            return array("I", map(word_to_id.__getitem__, words))
+        except KeyError:
+            pass
+        for word in words:
+            if word not in word_to_id:
+                self.id(word)
+        return array("I", map(word_to_id.__getitem__, words))
+
+    def word(self, token_id):
+        return self.id_to_word[token_id]
+
+
+shared_vocabulary = Vocabulary()
+
+
+# Alignments are kept run-length encoded as two parallel arrays: ops (one byte per run) and runs (run lengths).
+# EQUAL and SUB runs consume a word on both sides, DEL a GT word only, INS a transcription word only.
+EQUAL, SUB, DEL, INS = 0, 1, 2, 3
+OP_NAMES = "=SDI"
+
+
+def new_alignment():
+    return array("B"), array("I")
+
+
+def push_run(ops, runs, op, length: int = 1):
+    if length <= 0:
+        return
+    if ops and ops[-1] == op:
+        runs[-1] += length
+    else:
+        ops.append(op)
+        runs.append(length)
+
+
+# appends one alignment to another, merging the runs where they meet
+def extend_alignment(ops, runs, other_ops, other_runs):
+    for op, length in zip(other_ops, other_runs):
+        push_run(ops, runs, op, length)
+
+
+# (op, i1, i2, j1, j2) per run, with word positions as in SequenceMatcher.get_opcodes()
+def iter_opcodes(ops, runs):
+    i = j = 0
+    for op, length in zip(ops, runs):
+        i2 = i if op == INS else i + length
+        j2 = j if op == DEL else j + length
+        yield op, i, i2, j, j2
+        i, j = i2, j2
+
+
+# lengths of the matching prefix and suffix (the suffix never overlaps the prefix);
+# they never change the distance or the S/D/I counts
+def _common_affixes(ids1, ids2):
+    n, m = len(ids1), len(ids2)
+    start = 0
+    while start < n and start < m and ids1[start] == ids2[start]:
+        start += 1
+    end1, end2 = n, m
+    while end1 > start and end2 > start and ids1[end1 - 1] == ids2[end2 - 1]:
+        end1 -= 1
+        end2 -= 1
+    return start, n - end1
+
+
+# delta vector bits of one traceback block (see levenshtein_counts), 4 MB per vector list
+BLOCK_BITS = 2 ** 25
+
+
+# transcription words per traceback block: the whole transcription while it fits in BLOCK_BITS,
+# at least sqrt(m) so the checkpoints stay as small as the block
+def _block_columns(n, m):
+    return max(isqrt(m), BLOCK_BITS // n)
+
+
+# Columns start..end of the bit-parallel DP, from the vertical deltas (vp, vn) of column start.
+# Per column: its vertical (vps, vns) and horizontal (hps, hns) delta vectors, index 0 being column start.
+# Row i only depends on the rows above it, so full = (1 << i) - 1 gives the first i rows only.
+def _delta_columns(ids2, peq, full, vp, vn, start, end):
+
+    vps, vns, hps, hns = [vp & full], [vn & full], [0], [0]
+    vp, vn = vps[0], vns[0]
+    for j in range(start, end):
+        x = peq.get(ids2[j], 0) & full
+        d0 = ((((x & vp) + vp) ^ vp) | x | vn) & full
+        hp = (vn | ~(d0 | vp)) & full
+        hn = d0 & vp
+        hps.append(hp)
+        hns.append(hn)
+        hp = ((hp << 1) | 1) & full
+        hn = (hn << 1) & full
+        vp = (hn | ~(d0 | hp)) & full
+        vn = hp & d0
+        vps.append(vp)
+        vns.append(vn)
+    return vps, vns, hps, hns
+
+
+# Bit-parallel (Myers/Hyyrö) edit distance with alignment recovery.
+# GT words are the bit axis, transcription words are processed one per step.
+# Returns exact (substitutions, deletions, insertions); opcodes=True also returns the
+# alignment the counts came from, as (ops, runs).
+# The traceback needs the delta vectors of every column. On long inputs only the vertical deltas at the start
+# of each block of columns are kept, and a block is recomputed from them when the walk reaches it,
+# so memory grows with n * sqrt(m) bits instead of n * m. The recomputed block only covers the rows
+# the walk can still reach.
+
+def levenshtein_counts(ids1, ids2, opcodes: bool = False):
+
+    start, suffix = _common_affixes(ids1, ids2)
+    ids1, ids2 = ids1[start:len(ids1) - suffix], ids2[start:len(ids2) - suffix]
+    n, m = len(ids1), len(ids2)
+    if n == 0 or m == 0:
+        if not opcodes:
+            return 0, n, m
+        ops, runs = new_alignment()
+        for op, length in ((EQUAL, start), (DEL, n), (INS, m), (EQUAL, suffix)):
+            push_run(ops, runs, op, length)
+        return 0, n, m, (ops, runs)
+
+    # pattern match masks: bit i set where GT word i has this ID
+    peq = {}
+    for i, token_id in enumerate(ids1):
+        peq[token_id] = peq.get(token_id, 0) | (1 << i)
+
+    full = (1 << n) - 1
+
+    # column 0 has vertical delta +1 everywhere; the last block's columns are kept for the walk
+    block = _block_columns(n, m)
+    vp, vn = full, 0
+    checkpoints = []
+    for block_start in range(0, m, block):
+        checkpoints.append((vp, vn))
+        vps, vns, hps, hns = _delta_columns(ids2, peq, full, vp, vn, block_start, min(block_start + block, m))
+        vp, vn = vps[-1], vns[-1]
+    dist = m + bin(vp).count("1") - bin(vn).count("1")
+
+    # walk back from (n, m), preferring match/substitution, then deletion, then insertion
+    # the alignment is collected back to front and reversed at the end
+    num_subs = num_del = num_ins = 0
+    if opcodes:
+        ops, runs = new_alignment()
+        push_run(ops, runs, EQUAL, suffix)
+    i, j, d = n, m, dist
+    while i > 0 and j > 0:
+        if j == block_start:
+            block_start -= block
+            vps, vns, hps, hns = _delta_columns(ids2, peq, (1 << i) - 1, *checkpoints[block_start // block],
+                                                block_start, j)
+        k = j - block_start
+        bit = i - 1
+        v = ((vps[k] >> bit) & 1) - ((vns[k] >> bit) & 1)
+        h = ((hps[k] >> bit) & 1) - ((hns[k] >> bit) & 1)
+        v_left = ((vps[k - 1] >> bit) & 1) - ((vns[k - 1] >> bit) & 1)
+        d_left = d - h
+        d_diag = d_left - v_left
+        cost = 0 if ids1[i - 1] == ids2[j - 1] else 1
+        if d_diag + cost == d:
+            num_subs += cost
+            i -= 1
+            j -= 1
+            d = d_diag
+            if opcodes:
+                push_run(ops, runs, SUB if cost else EQUAL)
+        elif v == 1:
+            num_del += 1
+            i -= 1
+            d -= 1
+            if opcodes:
+                push_run(ops, runs, DEL)
+        else:
+            num_ins += 1
+            j -= 1
+            d = d_left
+            if opcodes:
+                push_run(ops, runs, INS)
+
+    num_del += i
+    num_ins += j
+    if not opcodes:
+        return num_subs, num_del, num_ins
+
+    push_run(ops, runs, DEL, i)
+    push_run(ops, runs, INS, j)
+    push_run(ops, runs, EQUAL, start)
+    ops.reverse()
+    runs.reverse()
+    return num_subs, num_del, num_ins, (ops, runs)
+
+
+# opcodes=True adds the (ops, runs) alignment after the counts
+def calLevenshteinErros(words1, words2, vocabulary: Vocabulary = None, opcodes: bool = False):
+
+    vocabulary = vocabulary if vocabulary is not None else shared_vocabulary
+    ids1 = vocabulary.encode(words1)
+    ids2 = vocabulary.encode(words2)
+
+    result = levenshtein_counts(ids1, ids2, opcodes)
+    num_subs, num_del, num_ins = result[:3]
+    num_words = len(words1)
+
+    wer = ((num_subs + num_del + num_ins) / num_words * 100) if num_words > 0 else 0
+    deleted_rate = (num_del / num_words * 100) if num_words > 0 else 0
+    added_rate = (num_ins / num_words * 100) if num_words > 0 else 0
+
+    if opcodes:
+        return wer, deleted_rate, added_rate, (num_subs, num_del, num_ins), result[3]
+    return wer, deleted_rate, added_rate, (num_subs, num_del, num_ins)
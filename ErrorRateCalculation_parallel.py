@@ -0,0 +1,180 @@
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from ErrorRateCalculation_sequenceMatching import evaluateDiffErros, evaluateDiffErrosBatch, evaluateSpellErros
+from ErrorRateCalculation_alignment import ConfusionStats
+from report_sink import ReportSink
+from ErrorRateCalculation_spelling import configure_spell_cache, get_spellchecker_en
+import ErrorRateCalculation_spelling
+import instrumentation
+
+
+# each worker keeps its own spell checker and verdict LRU, the SQLite file (if any) is shared
+# WER-only runs leave the spell cache alone. Serial runs call this in the main process for every stage,
+# so the cache is only replaced when it points at another file, and its verdicts stay warm between calls.
+def _init_worker(language: str, spell_cache_path: Path = None, spelling: bool = True, instrument: bool = False):
+    if instrument:
+        instrumentation.enable()
+    if not spelling:
+        return
+    if ErrorRateCalculation_spelling.spell_cache.path != (Path(spell_cache_path) if spell_cache_path else None):
+        configure_spell_cache(spell_cache_path)
+    if language == "en":
+        get_spellchecker_en()
+
+
+def _evaluate_chunk(chunk, language: str, matcher: str, streaming: bool = False, spelling: bool = True,
+                    alignment: bool = False):
+
+    results = []
+    for name, gtFile, transcriptionFile in chunk:
+        try:
+            with instrumentation.file_scope(name):
+                results.append(evaluateDiffErros(gtFile, transcriptionFile, language, matcher,
+                                                 streaming=streaming, spelling=spelling, alignment=alignment))
+        except Exception as e:
+            results.append({"file": name, "error": str(e)})
+    return results
+
+
+# the whole chunk aligned in batches; if a file fails, the chunk is evaluated file by file instead,
+# so only that file gets an error record
+def _evaluate_batch_chunk(chunk, language: str, spelling: bool = True):
+
+    try:
+        return evaluateDiffErrosBatch([(gtFile, transcriptionFile) for _name, gtFile, transcriptionFile in chunk],
+                                      language, spelling=spelling)
+    except Exception:
+        return _evaluate_chunk(chunk, language, "levenshtein", spelling=spelling)
+
+
+def _spell_chunk(chunk, language: str, streaming: bool = False):
+
+    results = []
+    for name, transcriptionFile in chunk:
+        try:
+            with instrumentation.file_scope(name):
+                results.append(evaluateSpellErros(transcriptionFile, language, streaming=streaming))
+        except Exception as e:
+            results.append({"file": name, "error": str(e)})
+    return results
+
+
+# runs in a worker: the chunk's results and the metrics the worker collected for it
+def _instrumented_chunk(evaluate, chunk, *args):
+    return evaluate(chunk, *args), instrumentation.metrics.drain()
+
+
+def _map_chunks(evaluate, items, args, language: str, workers: int, chunksize: int,
+                spell_cache_path: Path = None, spelling: bool = True):
+
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    if workers > 1:
+        instrument = instrumentation.enabled()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(language, spell_cache_path, spelling, instrument)) as executor:
+            if not instrument:
+                return list(executor.map(evaluate, chunks, *(repeat(arg) for arg in args)))
+            chunk_results = []
+            for results, metrics in executor.map(_instrumented_chunk, repeat(evaluate), chunks,
+                                                 *(repeat(arg) for arg in args)):
+                instrumentation.metrics.merge(metrics)
+                chunk_results.append(results)
+            return chunk_results
+    _init_worker(language, spell_cache_path, spelling)
+    return [evaluate(chunk, *args) for chunk in chunks]
+
+
+# file_pairs: (name, gt file, transcription file)
+# workers do the alignment and spelling, the parent adds the records to the report in sorted file order
+# spelling=False computes WER only (spellingError stays 0)
+# alignment=True also adds an "alignment" record per file and returns the corpus ConfusionStats
+# as totals["confusions"]; the report gets its tables from confusions.records()
+# batched=True gives each worker one share of the files and aligns it in NumPy batches
+# (levenshtein only, without streaming or alignment; chunksize is not used); the counts are the same
+
+def runDiffErros(file_pairs, report: ReportSink, language: str = "fi", matcher: str = "levenshtein",
+                 workers: int = 1, chunksize: int = 16, spell_cache_path: Path = None,
+                 streaming: bool = False, spelling: bool = True, alignment: bool = False, batched: bool = False):
+
+    if batched:
+        if matcher != "levenshtein" or streaming or alignment:
+            raise ValueError("batched WER needs the levenshtein matcher, without streaming or alignment")
+        evaluate, args = _evaluate_batch_chunk, (language, spelling)
+        chunksize = max(1, -(-len(file_pairs) // max(workers, 1)))
+    else:
+        evaluate, args = _evaluate_chunk, (language, matcher, streaming, spelling, alignment)
+    chunk_results = _map_chunks(
+        evaluate, sorted(file_pairs), args, language, workers, chunksize, spell_cache_path, spelling
+    )
+
+    totals = {
+        "gt_words": 0,
+        "transcription_words": 0,
+        "wer": 0,
+        "deleted": 0,
+        "added": 0,
+        "spellingError": 0,
+    }
+    if alignment:
+        totals["confusions"] = ConfusionStats()
+
+    # merged in sorted file order, so the float sums are the same for any worker count
+    for results in chunk_results:
+        for record in results:
+            if "error" in record:
+                print(f"Error processing {record['file']}: {record['error']}")
+                continue
+
+            print(record["file"], record["wer"])
+            if alignment:
+                totals["confusions"].merge(record.pop("confusions"))
+                file_alignment = record.pop("alignment")
+            report.add(record)
+            if alignment:
+                report.add({
+                    "kind": "alignment",
+                    "file": record["file"],
+                    "gt_words": record["gt_words"],
+                    "transcription_words": record["transcription_words"],
+                    "alignment": file_alignment,
+                })
+
+            _GT_words = record["gt_words"]
+            _Transcription_words = record["transcription_words"]
+            totals["gt_words"] += _GT_words
+            totals["transcription_words"] += _Transcription_words
+            totals["wer"] += record["wer"] * _GT_words / 100
+            totals["deleted"] += record["deleted_rate"] * _GT_words / 100
+            totals["added"] += record["added_rate"] * _GT_words / 100
+            if spelling:
+                totals["spellingError"] += record["spelling_rate"] * _Transcription_words / 100
+
+    return totals
+
+
+# files: (name, transcription file); spelling without alignment, for transcripts with or without a GT
+
+def runSpellErros(files, report: ReportSink, language: str = "fi", workers: int = 1, chunksize: int = 16,
+                  spell_cache_path: Path = None, streaming: bool = False):
+
+    chunk_results = _map_chunks(
+        _spell_chunk, sorted(files), (language, streaming), language, workers, chunksize, spell_cache_path
+    )
+
+    totals = {
+        "transcription_words": 0,
+        "spellingError": 0,
+    }
+    for results in chunk_results:
+        for record in results:
+            if "error" in record:
+                print(f"Error processing {record['file']}: {record['error']}")
+                continue
+
+            print(record["file"], record["spelling_rate"])
+            report.add(record)
+            totals["transcription_words"] += record["transcription_words"]
+            totals["spellingError"] += record["spelling_rate"] * record["transcription_words"] / 100
+
+    return totals
@@ -1,69 +1,129 @@
 from pathlib import Path
 from difflib import SequenceMatcher
-import pyvoikko as v
-from spellchecker import SpellChecker
-import re
+from ErrorRateCalculation_tokenizer import tokenize, iter_token_chunks
+from ErrorRateCalculation_levenshtein import calLevenshteinErros, shared_vocabulary
+from ErrorRateCalculation_terms import TermDictionary
+from ErrorRateCalculation_streaming import calStreamingErros
+from ErrorRateCalculation_alignment import ConfusionStats, alignment_from_difflib, format_alignment
+from ErrorRateCalculation_spelling import known_words_fi, known_words_en
+from report_sink import register_text_format, append_record
+import instrumentation
 
 
-def clean_text_transcription(text):
-    text = text.lower()
-    text = re.sub(r"[^a-zåäö0-9]+", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text.split()
+def clean_text_transcription(text, language: str = "fi"):
+    return tokenize(text, language)
 
 
 # 1 TECHNICAL TERMS ERROR
 
-def calTechTermsError(groundtruth_file, transcription_file, errorReport: Path):
-    
-    with open(groundtruth_file, "r", encoding="utf-8") as f:
-        gt_terms = [
-            clean_text_transcription(line.replace("-", " "))
-            for line in f if line.strip()
-        ]
-        
+# return_matches=True also returns {term: start word positions} for every GT term
+# term_dictionary: shared TermDictionary of the run, so term files are parsed once and misses are counted corpus-wide
+def evaluateTechTermsError(groundtruth_file, transcription_file, return_matches: bool = False,
+                           term_dictionary: TermDictionary = None):
+
+    if term_dictionary is None:
+        term_dictionary = TermDictionary(clean_text_transcription, shared_vocabulary)
+    term_ids = term_dictionary.load_file(groundtruth_file)
+
+    instrumentation.record_read(transcription_file)
     with open(transcription_file, "r", encoding="utf-8") as f:
         trans_text = " ".join(line.strip() for line in f if line.strip())
         trans_words = clean_text_transcription(trans_text.replace("-", " ")) 
 
-    not_found_terms = []
-    for term_words in gt_terms:
-        found = False
-        for i in range(len(trans_words) - len(term_words) + 1):
-            if trans_words[i:i + len(term_words)] == term_words:
-                found = True
-                break
-        if not found:
-            not_found_terms.append(" ".join(term_words))
-
-    total_terms = len(gt_terms)
+    # every term is searched in a single pass over the transcription
+    counts, starts = term_dictionary.index().find(
+        term_dictionary.vocabulary.encode(trans_words), positions=return_matches
+    )
+    term_dictionary.record(term_ids, counts)
+
+    not_found_terms = [term_dictionary.term(term_id) for term_id in term_ids if counts[term_id] == 0]
+
+    total_terms = len(term_ids)
     not_found_count = len(not_found_terms)
     percentage_not_found = (not_found_count / total_terms * 100) if total_terms > 0 else 0
 
-    file_name = Path(groundtruth_file).name
-    with open(errorReport, "a", encoding="utf-8") as f:
-        f.write(f"File: {file_name}\n")
-        f.write(f"Total GT terms: {total_terms}\n")
-        f.write(f"Not found rate: {percentage_not_found:.2f}%\n")
-        if not_found_terms:
-            f.write(f"Terms not found: {', '.join(sorted(not_found_terms))}\n")
-        f.write("=" * 40 + "\n")
+    record = {
+        "kind": "techterms",
+        "file": Path(groundtruth_file).name,
+        "total_terms": total_terms,
+        "not_found_count": not_found_count,
+        "not_found_rate": percentage_not_found,
+        "terms_not_found": sorted(not_found_terms),
+    }
+    if return_matches:
+        record["matches"] = {term_dictionary.term(term_id): starts[term_id] for term_id in term_ids}
+    return record
+
+
+def formatTechTermsReport(record):
+
+    text = (
+        f"File: {record['file']}\n"
+        f"Total GT terms: {record['total_terms']}\n"
+        f"Not found rate: {record['not_found_rate']:.2f}%\n"
+    )
+    if record["terms_not_found"]:
+        text += f"Terms not found: {', '.join(record['terms_not_found'])}\n"
+    return text + "=" * 40 + "\n"
+
+
+def formatTechTermsAverage(record):
+
+    if record["total_terms"] > 0:
+        text = (
+            f"Total Technical Term: {record['total_terms']}\n"
+            f"Average Not found Technical Terms Error Rate: {record['not_found_rate']:.2f}%\n"
+        )
+    else:
+        text = "Average Not found Technical Terms Error Rate: N/A\n"
+    if record.get("most_missed"):
+        text += f"Most missed terms ({record['distinct_terms']} distinct terms):\n"
+        for term, missed, occurrences in record["most_missed"]:
+            text += f"{term}: missed {missed}/{occurrences}\n"
+    return text + "=" * 40 + "\n"
+
+
+register_text_format("techterms", formatTechTermsReport)
+register_text_format("techterms_average", formatTechTermsAverage)
+
 
-    return total_terms, not_found_count
+def calTechTermsError(groundtruth_file, transcription_file, errorReport: Path, return_matches: bool = False,
+                      term_dictionary: TermDictionary = None):
+
+    record = evaluateTechTermsError(groundtruth_file, transcription_file, return_matches, term_dictionary)
+    append_record(record, errorReport)
+
+    if return_matches:
+        return record["total_terms"], record["not_found_count"], record["matches"]
+    return record["total_terms"], record["not_found_count"]
 
 
 # 2 WER / Delete error / Added error
 
-def calSMatcherErros(words1, words2):
+# matcher="levenshtein" gives the true minimal edit distance; "difflib" keeps the old SequenceMatcher counts
+# return_alignment=True adds the alignment the counts came from, as run-length encoded (ops, runs)
+@instrumentation.timed("align")
+def calSMatcherErros(words1, words2, matcher: str = "levenshtein", return_counts: bool = False,
+                     return_alignment: bool = False):
+
+    if matcher == "levenshtein":
+        wer, deleted_rate, added_rate, counts, *alignment = calLevenshteinErros(
+            words1, words2, opcodes=return_alignment
+        )
+        return (wer, deleted_rate, added_rate) + ((counts,) if return_counts else ()) + tuple(alignment)
+
+    if matcher != "difflib":
+        raise ValueError(f"Unknown matcher: {matcher}")
 
     s = SequenceMatcher(None, words1, words2)
+    opcodes = s.get_opcodes()
 
     num_subs = 0
     num_del = 0
     num_ins = 0
     num_words = len(words1)
 
-    for tag, i1, i2, j1, j2 in s.get_opcodes():
+    for tag, i1, i2, j1, j2 in opcodes:
 
         if tag == 'replace':
             # substitutions = minimum number of words replaced
@@ -86,7 +146,9 @@ def calSMatcherErros(words1, words2):
     deleted_rate = (num_del / num_words * 100) if num_words > 0 else 0
     added_rate = (num_ins / num_words * 100) if num_words > 0 else 0
 
-    return wer, deleted_rate, added_rate
+    alignment = (alignment_from_difflib(opcodes),) if return_alignment else ()
+    counts = ((num_subs, num_del, num_ins),) if return_counts else ()
+    return (wer, deleted_rate, added_rate) + counts + alignment
 
 
 
@@ -94,10 +156,9 @@ def calSMatcherErros(words1, words2):
 
 def calSpellErros(words):
 
-    errors = []
-    for word in words:
-        if not v.analyse(word):  # No analysis → likely misspelled
-            errors.append(word)
+    # each distinct word is analysed once, verdicts are cached across files
+    known = known_words_fi(words)
+    errors = [word for word in words if not known[word]]  # No analysis → likely misspelled
 
     total_words = len(words)
     num_errors = len(errors)
@@ -105,10 +166,10 @@ def calSpellErros(words):
 
     return error_rate, errors
 
-def calSpellErros_En(words): 
+def calSpellErros_En(words, spell=None): 
     
-    spell = SpellChecker()
-    misspelled = spell.unknown(words)
+    known = known_words_en(words, spell)
+    misspelled = {word for word in known if not known[word]}
     total_words = len(words)
     num_errors = len(misspelled)
     error_rate = (num_errors / total_words * 100) if total_words > 0 else 0
@@ -118,38 +179,231 @@ def calSpellErros_En(words):
 
 # main Error cal. method
 
-def calDiffErros(groundtruth_file, transcription_file, errorReport: Path, language: str = "fi"):
+# computes one file's WER and spelling record without touching the report
+# streaming=True reads both files in chunks and aligns them segment by segment (levenshtein only)
+# spelling=False leaves out the spelling fields, for runs that check spelling as a separate stage
+# alignment=True adds the file's alignment (as a format_alignment string) and its confusions
+# (ConfusionStats.export()) to the record, from the same alignment the WER is counted on
+def evaluateDiffErros(groundtruth_file, transcription_file, language: str = "fi", matcher: str = "levenshtein",
+                      spell=None, streaming: bool = False, spelling: bool = True, alignment: bool = False):
 
+    if streaming:
+        return _evaluateDiffErrosStreaming(groundtruth_file, transcription_file, language, spell, spelling,
+                                           alignment)
+
+    instrumentation.record_read(groundtruth_file)
+    instrumentation.record_read(transcription_file)
     text1 = Path(groundtruth_file).read_text(encoding="utf-8")
     text2 = Path(transcription_file).read_text(encoding="utf-8")
 
-    words1 = clean_text_transcription(text1)
-    words2 = clean_text_transcription(text2)
+    words1 = clean_text_transcription(text1, language)
+    words2 = clean_text_transcription(text2, language)
 
-    totalGT_words = len(words1)
-    totalTranscription_words = len(words2)
+    wer, deleted_rate, added_rate, *file_alignment = calSMatcherErros(
+        words1, words2, matcher, return_alignment=alignment
+    )
 
-    wer, deleted_rate, added_rate = calSMatcherErros(words1, words2)
+    record = {
+        "kind": "wer",
+        "file": Path(groundtruth_file).name,
+        "gt_words": len(words1),
+        "transcription_words": len(words2),
+        "wer": wer,
+        "deleted_rate": deleted_rate,
+        "added_rate": added_rate,
+    }
+    if alignment:
+        ops, runs = file_alignment[0]
+        confusions = ConfusionStats()
+        confusions.add(words1, words2, ops, runs)
+        record["alignment"] = format_alignment(ops, runs)
+        record["confusions"] = confusions.export()
+    if spelling:
+        record["spelling_rate"], record["spelling_errors"] = _spellingErros(words2, language, spell)
+    return record
+
+
+def _evaluateDiffErrosStreaming(groundtruth_file, transcription_file, language, spell, spelling: bool = True,
+                                alignment: bool = False):
+
+    confusions = ConfusionStats() if alignment else None
+    totalGT_words, totalTranscription_words, wer, deleted_rate, added_rate, _counts, *file_alignment = (
+        calStreamingErros(groundtruth_file, transcription_file, language, alignment=alignment, confusions=confusions)
+    )
+
+    record = {
+        "kind": "wer",
+        "file": Path(groundtruth_file).name,
+        "gt_words": totalGT_words,
+        "transcription_words": totalTranscription_words,
+        "wer": wer,
+        "deleted_rate": deleted_rate,
+        "added_rate": added_rate,
+    }
+    if alignment:
+        record["alignment"] = format_alignment(*file_alignment[0])
+        record["confusions"] = confusions.export()
+    if spelling:
+        _words, record["spelling_rate"], record["spelling_errors"] = _streamingSpellErros(
+            transcription_file, language, spell
+        )
+    return record
+
+
+# the records of evaluateDiffErros (levenshtein) for many files at once: every pair is tokenized first and
+# the alignments run in NumPy batches (ErrorRateCalculation_corpus), so the counts are the same
+# file_pairs: (groundtruth file, transcription file)
+def evaluateDiffErrosBatch(file_pairs, language: str = "fi", spell=None, spelling: bool = True):
+    from ErrorRateCalculation_corpus import corpus_counts, error_rates
+
+    words = []
+    for groundtruth_file, transcription_file in file_pairs:
+        instrumentation.record_read(groundtruth_file)
+        instrumentation.record_read(transcription_file)
+        words.append((
+            clean_text_transcription(Path(groundtruth_file).read_text(encoding="utf-8"), language),
+            clean_text_transcription(Path(transcription_file).read_text(encoding="utf-8"), language),
+        ))
+
+    with instrumentation.timer("align"):
+        counts = corpus_counts([
+            (shared_vocabulary.encode(words1), shared_vocabulary.encode(words2)) for words1, words2 in words
+        ])
+
+    records = []
+    for (groundtruth_file, _), (words1, words2), (num_subs, num_del, num_ins) in zip(file_pairs, words, counts):
+        wer, deleted_rate, added_rate = error_rates(len(words1), num_subs, num_del, num_ins)
+        record = {
+            "kind": "wer",
+            "file": Path(groundtruth_file).name,
+            "gt_words": len(words1),
+            "transcription_words": len(words2),
+            "wer": wer,
+            "deleted_rate": deleted_rate,
+            "added_rate": added_rate,
+        }
+        if spelling:
+            record["spelling_rate"], record["spelling_errors"] = _spellingErros(words2, language, spell)
+        records.append(record)
+    return records
+
+
+def _spellingErros(words, language, spell=None):
     if language == "fi":
-        spelling_rate, spelling_errors = calSpellErros(words2)
+        return calSpellErros(words)
+    if language == "en":
+        return calSpellErros_En(words, spell)
+
+
+# spelling over the token chunks of a long transcript; English counts each misspelled word once,
+# as calSpellErros_En does
+def _streamingSpellErros(transcription_file, language, spell=None):
+
+    total_words = 0
+    spelling_errors = []
+    misspelled = set()
+    for words in iter_token_chunks(transcription_file, language):
+        total_words += len(words)
+        if language == "fi":
+            spelling_errors.extend(calSpellErros(words)[1])
+        if language == "en":
+            misspelled.update(calSpellErros_En(words, spell)[1])
     if language == "en":
-        spelling_rate, spelling_errors = calSpellErros_En(words2)
-    file_name = Path(groundtruth_file).name
-    print(file_name, wer)
-    with open(errorReport, "a", encoding="utf-8") as f:
-        f.write(f"File: {file_name}\n")
-        f.write(f"Total words in GT: {totalGT_words}\n")
-        f.write(f"Total words in Transcription: {totalTranscription_words}\n")
-        f.write(f"WER: {wer:.2f}% | Deleted: {deleted_rate:.2f}% | Added: {added_rate:.2f}%\n")
-        f.write(f"Spelling Error Rate: {spelling_rate:.2f}%\n")
-        f.write(f"Misspelled words: {', '.join(spelling_errors)}\n")
-        f.write("=" * 40 + "\n")
+        spelling_errors = list(misspelled)
+    spelling_rate = (len(spelling_errors) / total_words * 100) if total_words > 0 else 0
+    return total_words, spelling_rate, spelling_errors
+
+
+def formatDiffErrosReport(record):
+
+    text = (
+        f"File: {record['file']}\n"
+        f"Total words in GT: {record['gt_words']}\n"
+        f"Total words in Transcription: {record['transcription_words']}\n"
+        f"WER: {record['wer']:.2f}% | Deleted: {record['deleted_rate']:.2f}% | Added: {record['added_rate']:.2f}%\n"
+    )
+    if "spelling_rate" in record:
+        text += (
+            f"Spelling Error Rate: {record['spelling_rate']:.2f}%\n"
+            f"Misspelled words: {', '.join(record['spelling_errors'])}\n"
+        )
+    return text + "=" * 40 + "\n"
+
+
+def formatDiffErrosAverage(record):
+
+    text = (
+        ("AVERAGES FOR WER & SPELLING\n" if "spelling_rate" in record else "AVERAGES FOR WER\n")
+        + f"Average WER: {record['wer']:.2f}%\n"
+        f"Average Deleted Rate: {record['deleted_rate']:.2f}%\n"
+        f"Average Added Rate: {record['added_rate']:.2f}%\n"
+    )
+    if "spelling_rate" in record:
+        text += f"Average Spelling Errors: {record['spelling_rate']:.2f}%\n"
+    return text + "=" * 40 + "\n"
+
+
+register_text_format("wer", formatDiffErrosReport)
+register_text_format("wer_average", formatDiffErrosAverage)
+
+
+# 4 Spelling mistakes without a ground truth (spelling as its own stage)
+
+def evaluateSpellErros(transcription_file, language: str = "fi", spell=None, streaming: bool = False):
+
+    if streaming:
+        total_words, spelling_rate, spelling_errors = _streamingSpellErros(transcription_file, language, spell)
+    else:
+        instrumentation.record_read(transcription_file)
+        words = clean_text_transcription(Path(transcription_file).read_text(encoding="utf-8"), language)
+        total_words = len(words)
+        spelling_rate, spelling_errors = _spellingErros(words, language, spell)
+
+    return {
+        "kind": "spelling",
+        "file": Path(transcription_file).name,
+        "transcription_words": total_words,
+        "spelling_rate": spelling_rate,
+        "spelling_errors": spelling_errors,
+    }
+
+
+def formatSpellErrosReport(record):
+
+    return (
+        f"File: {record['file']}\n"
+        f"Total words in Transcription: {record['transcription_words']}\n"
+        f"Spelling Error Rate: {record['spelling_rate']:.2f}%\n"
+        f"Misspelled words: {', '.join(record['spelling_errors'])}\n"
+        + "=" * 40 + "\n"
+    )
+
+
+def formatSpellErrosAverage(record):
+
+    return (
+        "AVERAGES FOR SPELLING\n"
+        f"Total words in Transcriptions: {record['transcription_words']}\n"
+        f"Average Spelling Errors: {record['spelling_rate']:.2f}%\n"
+        + "=" * 40 + "\n"
+    )
+
+
+register_text_format("spelling", formatSpellErrosReport)
+register_text_format("spelling_average", formatSpellErrosAverage)
+
+
+def calDiffErros(groundtruth_file, transcription_file, errorReport: Path, language: str = "fi", matcher: str = "levenshtein"):
+
+    record = evaluateDiffErros(groundtruth_file, transcription_file, language, matcher)
+    print(record["file"], record["wer"])
+    append_record(record, errorReport)
    
     return (
-        totalGT_words,
-        totalTranscription_words,
-        wer,
-        deleted_rate,
-        added_rate,
-        spelling_rate,
+        record["gt_words"],
+        record["transcription_words"],
+        record["wer"],
+        record["deleted_rate"],
+        record["added_rate"],
+        record["spelling_rate"],
     )
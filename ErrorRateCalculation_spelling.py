@@ -0,0 +1,157 @@
+from pathlib import Path
+from collections import OrderedDict
+from importlib import metadata
+import sqlite3
+import weakref
+from itertools import count
+import instrumentation
+
+
+# Spell verdicts keyed by (language, dictionary version, word).
+# In-process LRU first, then an optional SQLite file shared across runs and worker processes.
+
+class SpellVerdictCache:
+
+    def __init__(self, maxsize: int = 200_000, path: Path = None):
+        self.maxsize = maxsize
+        self.path = Path(path) if path is not None else None
+        self.memory = OrderedDict()
+        self.db = None
+        if self.path is not None:
+            self.db = sqlite3.connect(self.path, timeout=60)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "language TEXT, version TEXT, word TEXT, known INTEGER, "
+                "PRIMARY KEY (language, version, word))"
+            )
+            self.db.commit()
+
+    def _remember(self, key, known):
+        self.memory[key] = known
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def _load(self, language, version, words):
+        found = {}
+        for i in range(0, len(words), 500):
+            batch = words[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT word, known FROM verdicts WHERE language = ? AND version = ? "
+                f"AND word IN ({','.join('?' * len(batch))})",
+                [language, version, *batch],
+            )
+            for word, known in rows:
+                found[word] = bool(known)
+        return found
+
+    def _store(self, language, version, verdicts):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)",
+            [(language, version, word, int(known)) for word, known in verdicts.items()],
+        )
+        self.db.commit()
+
+    # check(words) -> {word: known} is only called for words never seen before
+    # persistent=False keeps the verdicts out of the SQLite file (for dictionaries other runs can't identify)
+    def verdicts(self, language, version, words, check, persistent: bool = True):
+
+        result = {}
+        missing = []
+        for word in set(words):
+            key = (language, version, word)
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                result[word] = self.memory[key]
+            else:
+                missing.append(word)
+
+        if missing and self.db is not None and persistent:
+            stored = self._load(language, version, missing)
+            for word, known in stored.items():
+                result[word] = known
+                self._remember((language, version, word), known)
+            missing = [word for word in missing if word not in stored]
+
+        if missing:
+            checked = check(missing)
+            for word, known in checked.items():
+                result[word] = known
+                self._remember((language, version, word), known)
+            if self.db is not None and persistent:
+                self._store(language, version, checked)
+
+        # distinct words per call vs spelling_words_analysed gives the cache hit rate
+        instrumentation.count("spelling_words_looked_up", len(result))
+        return result
+
+
+spell_cache = SpellVerdictCache()
+
+
+# call once per process (e.g. in a worker initializer) to share verdicts through a SQLite file
+def configure_spell_cache(path: Path = None, maxsize: int = 200_000):
+    global spell_cache
+    spell_cache = SpellVerdictCache(maxsize=maxsize, path=path)
+    return spell_cache
+
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+FI_DICTIONARY_VERSION = _package_version("pyvoikko")
+EN_DICTIONARY_VERSION = _package_version("pyspellchecker")
+
+# the English frequency dictionary is loaded once per process
+# (pyvoikko and pyspellchecker are imported on first use, so WER-only runs never load them)
+_spellchecker_en = None
+
+
+def get_spellchecker_en():
+    global _spellchecker_en
+    if _spellchecker_en is None:
+        from spellchecker import SpellChecker
+        _spellchecker_en = SpellChecker()
+    return _spellchecker_en
+
+
+@instrumentation.timed("spelling_voikko")
+def _check_fi(words):
+    import pyvoikko as v
+    instrumentation.count("spelling_words_analysed", len(words))
+    return {word: bool(v.analyse(word)) for word in words}
+
+
+def known_words_fi(words):
+    return spell_cache.verdicts("fi", FI_DICTIONARY_VERSION, words, _check_fi)
+
+
+# a SpellChecker passed by the caller may have its own word list or language, so its verdicts are kept
+# apart (per instance, in memory only) instead of under the package version
+_custom_spellcheckers = weakref.WeakKeyDictionary()
+_custom_numbers = count()
+
+
+def _custom_dictionary_version(spell):
+    if spell not in _custom_spellcheckers:
+        _custom_spellcheckers[spell] = f"custom-{next(_custom_numbers)}"
+    return _custom_spellcheckers[spell]
+
+
+def known_words_en(words, spell=None):
+    custom = spell is not None and spell is not _spellchecker_en
+    spell = spell if custom else get_spellchecker_en()
+
+    def check(batch):
+        instrumentation.count("spelling_words_analysed", len(batch))
+        with instrumentation.timer("spelling_pyspellchecker"):
+            unknown = spell.unknown(batch)
+        return {word: word not in unknown for word in batch}
+
+    if custom:
+        return spell_cache.verdicts("en", _custom_dictionary_version(spell), words, check, persistent=False)
+    return spell_cache.verdicts("en", EN_DICTIONARY_VERSION, words, check)
@@ -0,0 +1,141 @@
+from pathlib import Path
+from array import array
+from bisect import bisect_left
+from ErrorRateCalculation_tokenizer import iter_token_chunks
+from ErrorRateCalculation_levenshtein import Vocabulary, levenshtein_counts, EQUAL, new_alignment, push_run, extend_alignment
+import instrumentation
+
+# words buffered per side before looking for a cut point, and the hard cap if none is found
+SEGMENT_WORDS = 4000
+MAX_SEGMENT_WORDS = 16000
+# length of an exact-match run that may be used as an anchor
+ANCHOR_LENGTH = 6
+
+
+class _IdStream:
+
+    def __init__(self, path: Path, vocabulary: Vocabulary, language: str, chunk_size: int):
+        self.chunks = iter_token_chunks(path, language, chunk_size)
+        self.vocabulary = vocabulary
+        self.buffer = array("I")
+        self.total = 0
+        self.done = False
+
+    def fill(self, size):
+        while not self.done and len(self.buffer) < size:
+            tokens = next(self.chunks, None)
+            if tokens is None:
+                self.done = True
+                break
+            self.buffer.extend(self.vocabulary.encode(tokens))
+            self.total += len(tokens)
+
+    def drop(self, count):
+        del self.buffer[:count]
+
+
+def _ngrams_seen_once(ids, n):
+    first, repeated = {}, set()
+    for i in range(len(ids) - n + 1):
+        key = tuple(ids[i:i + n])
+        if key in first:
+            repeated.add(key)
+        else:
+            first[key] = i
+    return {key: i for key, i in first.items() if key not in repeated}
+
+
+# Last anchor (i, j) of the longest chain of anchors that moves forward in both files.
+# An anchor is a run of n words that occurs exactly once in each buffer.
+
+def find_anchor(gt, tr, n: int = ANCHOR_LENGTH):
+
+    gt_once = _ngrams_seen_once(gt, n)
+    tr_once = _ngrams_seen_once(tr, n)
+    anchors = sorted((i, tr_once[key]) for key, i in gt_once.items() if key in tr_once)
+    if not anchors:
+        return None
+
+    # longest increasing run of j (patience sorting)
+    tails, tail_index = [], []
+    for k, (i, j) in enumerate(anchors):
+        pos = bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+
+    return anchors[tail_index[-1]]
+
+
+# Reads both files incrementally and cuts them at anchors (long exact-match runs),
+# so only one segment per side is held and aligned at a time. Counts are summed over segments.
+# Segments are exact; a cut only costs accuracy if the anchor itself is a false match.
+
+@instrumentation.timed("align_streaming")
+def calStreamingErros(groundtruth_file, transcription_file, language: str = "fi", vocabulary: Vocabulary = None,
+                      segment_words: int = SEGMENT_WORDS, max_segment_words: int = MAX_SEGMENT_WORDS,
+                      anchor_length: int = ANCHOR_LENGTH, chunk_size: int = 1 << 16,
+                      alignment: bool = False, confusions=None):
+
+    vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+    gt = _IdStream(groundtruth_file, vocabulary, language, chunk_size)
+    tr = _IdStream(transcription_file, vocabulary, language, chunk_size)
+
+    num_subs = num_del = num_ins = 0
+    # alignment=True joins the segment alignments (and the anchors between them) into one for the file;
+    # confusions (a ConfusionStats) gets each segment's edits while the segment is still buffered
+    ops, runs = new_alignment()
+    previous = None
+
+    def align(i, j):
+        nonlocal num_subs, num_del, num_ins
+        result = levenshtein_counts(gt.buffer[:i], tr.buffer[:j], alignment)
+        num_subs += result[0]
+        num_del += result[1]
+        num_ins += result[2]
+        if alignment:
+            if confusions is not None:
+                confusions.add(gt.buffer, tr.buffer, *result[3], word=vocabulary.word, before=previous)
+            extend_alignment(ops, runs, *result[3])
+
+    size = segment_words
+    while True:
+        gt.fill(size)
+        tr.fill(size)
+        if gt.done and tr.done:
+            break
+
+        anchor = find_anchor(gt.buffer, tr.buffer, anchor_length)
+        if anchor is None and size < max_segment_words:
+            size = min(size * 2, max_segment_words)
+            continue
+
+        if anchor is None:
+            # nothing reliable to cut at, align the full buffers as one segment
+            i, j, matched = len(gt.buffer), len(tr.buffer), 0
+        else:
+            i, j = anchor
+            matched = anchor_length
+
+        align(i, j)
+        if alignment:
+            push_run(ops, runs, EQUAL, matched)
+            if i + matched > 0:
+                previous = vocabulary.word(gt.buffer[i + matched - 1])
+        gt.drop(i + matched)
+        tr.drop(j + matched)
+        size = segment_words
+
+    align(len(gt.buffer), len(tr.buffer))
+
+    num_words = gt.total
+    wer = ((num_subs + num_del + num_ins) / num_words * 100) if num_words > 0 else 0
+    deleted_rate = (num_del / num_words * 100) if num_words > 0 else 0
+    added_rate = (num_ins / num_words * 100) if num_words > 0 else 0
+
+    if alignment:
+        return gt.total, tr.total, wer, deleted_rate, added_rate, (num_subs, num_del, num_ins), (ops, runs)
+    return gt.total, tr.total, wer, deleted_rate, added_rate, (num_subs, num_del, num_ins)
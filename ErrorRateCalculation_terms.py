@@ -0,0 +1,151 @@
+from pathlib import Path
+from collections import Counter, deque
+import instrumentation
+
+
+# Aho-Corasick automaton over token ID sequences.
+# All terms are found in one pass over the transcription, overlapping matches included.
+
+class TermIndex:
+
+    def __init__(self, terms):
+        self.lengths = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for term_ids in terms:
+            self.add(term_ids)
+        self.build()
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, term_ids):
+        term = len(self.lengths)
+        self.lengths.append(len(term_ids))
+        if not term_ids:
+            return term
+
+        node = 0
+        for token_id in term_ids:
+            nxt = self.goto[node].get(token_id)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][token_id] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = nxt
+        self.output[node].append(term)
+        return term
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token_id, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token_id not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token_id, 0)
+                # shorter terms ending here too
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    # returns match counts per term, and start positions per term when positions=True
+    @instrumentation.timed("techterms_scan")
+    def find(self, ids, positions: bool = False):
+
+        goto, fail, output, lengths = self.goto, self.fail, self.output, self.lengths
+        counts = [0] * len(lengths)
+        starts = [[] for _ in lengths] if positions else None
+
+        state = 0
+        for k, token_id in enumerate(ids):
+            while state and token_id not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token_id, 0)
+            for term in output[state]:
+                counts[term] += 1
+                if positions:
+                    starts[term].append(k - lengths[term] + 1)
+
+        # an empty term matches trivially, as in the old sliding-window search
+        for term, length in enumerate(lengths):
+            if length == 0:
+                counts[term] = len(ids) + 1
+
+        return counts, starts
+
+
+# Corpus-wide term list: every distinct term is tokenized once and gets a stable ID (order of first appearance).
+# Files refer to their terms by ID and one automaton over all terms serves the whole run.
+# tokenize is the text cleaner used for GT term lines (clean_text_transcription).
+
+class TermDictionary:
+
+    def __init__(self, tokenize, vocabulary):
+        self.tokenize = tokenize
+        self.vocabulary = vocabulary
+        self.terms = []
+        self.term_to_id = {}
+        self.file_terms = {}
+        self.occurrences = Counter()
+        self.misses = Counter()
+        self._index = None
+
+    def __len__(self):
+        return len(self.terms)
+
+    @classmethod
+    def from_folder(cls, folder: Path, tokenize, vocabulary):
+        term_dictionary = cls(tokenize, vocabulary)
+        for path in sorted(Path(folder).glob("*.txt")):
+            term_dictionary.load_file(path)
+        return term_dictionary
+
+    def add_term(self, term_words):
+        term = " ".join(term_words)
+        term_id = self.term_to_id.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.term_to_id[term] = term_id
+            self.terms.append(term_words)
+            self._index = None
+        return term_id
+
+    # term IDs of one GT term file, repeats kept like the lines in the file
+    def load_file(self, groundtruth_file):
+        name = Path(groundtruth_file).name
+        term_ids = self.file_terms.get(name)
+        if term_ids is None:
+            instrumentation.record_read(groundtruth_file)
+            with open(groundtruth_file, "r", encoding="utf-8") as f:
+                term_ids = [
+                    self.add_term(self.tokenize(line.replace("-", " ")))
+                    for line in f if line.strip()
+                ]
+            self.file_terms[name] = term_ids
+        return term_ids
+
+    def index(self):
+        if self._index is None:
+            self._index = TermIndex(self.vocabulary.encode(term_words) for term_words in self.terms)
+        return self._index
+
+    def term(self, term_id):
+        return " ".join(self.terms[term_id])
+
+    def record(self, term_ids, counts):
+        for term_id in term_ids:
+            self.occurrences[term_id] += 1
+            if counts[term_id] == 0:
+                self.misses[term_id] += 1
+
+    # (term, times missed, times in GT), most missed first
+    def most_missed(self, n: int = None):
+        ranked = sorted(self.misses.items(), key=lambda item: (-item[1], self.term(item[0])))
+        if n is not None:
+            ranked = ranked[:n]
+        return [(self.term(term_id), missed, self.occurrences[term_id]) for term_id, missed in ranked]
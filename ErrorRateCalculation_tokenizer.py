@@ -0,0 +1,77 @@
+from pathlib import Path
+from array import array
+import re
+import instrumentation
+
+# characters kept inside a word, per language; everything else separates words
+# "fi" is the original clean_text_transcription alphabet
+ALPHABETS = {
+    "fi": "a-zåäö0-9",
+    "en": "a-z0-9à-öø-ÿœ",
+    "latin": "a-z0-9à-öø-ÿĀ-ſ",
+    "unicode": r"^\W_",
+}
+
+_patterns = {}
+
+
+def token_pattern(language: str = "fi"):
+    pattern = _patterns.get(language)
+    if pattern is None:
+        if language not in ALPHABETS:
+            raise ValueError(f"No alphabet for language: {language}")
+        pattern = re.compile(f"[{ALPHABETS[language]}]+")
+        _patterns[language] = pattern
+    return pattern
+
+
+def register_alphabet(language: str, char_class: str):
+    ALPHABETS[language] = char_class
+    _patterns.pop(language, None)
+
+
+# lowercases and returns the runs of alphabet characters in one regex pass
+@instrumentation.timed("tokenize")
+def tokenize(text, language: str = "fi"):
+    return token_pattern(language).findall(text.lower())
+
+
+def tokenize_ids(text, vocabulary, language: str = "fi"):
+    return vocabulary.encode(tokenize(text, language))
+
+
+# Streams tokens from a file in chunks, so big files never have to be read whole.
+# A word cut at a chunk border is carried over to the next chunk.
+
+def iter_token_chunks(path: Path, language: str = "fi", chunk_size: int = 1 << 20):
+
+    pattern = token_pattern(language)
+    carry = ""
+    instrumentation.record_read(path)
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            with instrumentation.timer("tokenize"):
+                text = carry + chunk.lower()
+                tokens = pattern.findall(text)
+            carry = ""
+            if tokens and text.endswith(tokens[-1]):
+                carry = tokens.pop()
+            if tokens:
+                yield tokens
+    if carry:
+        yield [carry]
+
+
+def iter_tokens(path: Path, language: str = "fi", chunk_size: int = 1 << 20):
+    for tokens in iter_token_chunks(path, language, chunk_size):
+        yield from tokens
+
+
+def stream_token_ids(path: Path, vocabulary, language: str = "fi", chunk_size: int = 1 << 20):
+    ids = array("I")
+    for tokens in iter_token_chunks(path, language, chunk_size):
+        ids.extend(vocabulary.encode(tokens))
+    return ids
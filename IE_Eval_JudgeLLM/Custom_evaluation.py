@@ -1,16 +1,59 @@
 import json
 import numpy as np
 from pathlib import Path
-from collections import defaultdict
-from sklearn.metrics.pairwise import cosine_similarity
-from openai import OpenAI
+from report_sink import register_text_format, append_record
+from embedding_store import EmbeddingStore
+from embedding_backends import OpenAIEmbeddingBackend, make_embedding_backend
+from run_manifest import RunManifest, file_hash
+from field_comparators import score_field_pairs, comparator_name, comparator_signature
+import instrumentation
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_BATCH_SIZE = 256  # inputs per embeddings request
+
+# default: OpenAI embeddings API; configure_embedding_backend("local-cpu", threads=8) for offline nodes
+embedding_backend = OpenAIEmbeddingBackend(EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE)
+
+# optional persistent store; repeated values ("--tyhjä", "Kyllä", ...) and earlier GT are never re-embedded
+embedding_store = None
+
+
+def configure_embedding_backend(name: str = "openai", **options):
+    global embedding_backend
+    embedding_backend = make_embedding_backend(name, **options)
+    return embedding_backend
+
+
+# keyed by the backend name, so call configure_embedding_backend first
+def configure_embedding_store(directory: Path, model: str = None, max_entries: int = 200_000):
+    global embedding_store
+    model = model or embedding_backend.name
+    embedding_store = EmbeddingStore(directory, model, max_entries) if directory is not None else None
+    return embedding_store
+
+
+# one vector per text, each distinct text encoded once (and only if it is not in the store)
+def get_embeddings(texts, backend=None):
+    backend = backend or embedding_backend
+    texts = list(texts)
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    if embedding_store is not None and embedding_store.model_name == backend.name:
+        return embedding_store.embed(texts, backend.encode)
+    unique_texts = list(dict.fromkeys(texts))
+    vectors = dict(zip(unique_texts, backend.encode(unique_texts)))
+    return np.array([vectors[text] for text in texts], dtype=np.float32)
+
+
+def get_openai_embeddings(texts, model=EMBEDDING_MODEL):
+    backend = embedding_backend if embedding_backend.name == model else OpenAIEmbeddingBackend(model, EMBEDDING_BATCH_SIZE)
+    return get_embeddings(texts, backend)
+
+
+def get_openai_embedding(text, model=EMBEDDING_MODEL):
+    return get_openai_embeddings([text], model)[0]
 
-client = OpenAI(api_key="sk-proj")
 
-def get_openai_embedding(text, model="text-embedding-ada-002"):
-    response = client.embeddings.create(model=model, input=text)
-    return response.data[0].embedding
-    
 EXACT_FIELDS = [
     "Raportin tyyppi", "Tarkkailijan nimi", "Tarkkailijaorganisaatio",
     "Tarkkailija on kesätyöntekijä", "Tapahtuma-aika",
@@ -28,86 +71,178 @@ EXACT_THRESHOLD = 0.9
 SEMANTIC_THRESHOLD = 0.8
 
 
-def C_evaluate_single_file(
-    gt_file: Path,
-    pred_file: Path,
-    detailed_report_path: Path,
-    summary_report_path: Path,
-    threshold: float = 0.85
-):
-    gt = json.loads(gt_file.read_text(encoding="utf-8"))
-    pred = json.loads(pred_file.read_text(encoding="utf-8"))
+def _cosine_rows(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    return np.einsum("ij,ij->i", a, b) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def _embedding_similarities(pairs):
+    embeddings = get_embeddings([text for pair in pairs for text in pair])
+    return _cosine_rows(embeddings[0::2], embeddings[1::2])
+
+
+# evaluates many (gt_file, pred_file) pairs; each field is compared with its comparator (field_comparators.py),
+# and the values of the embedding fields go out in batched embedding requests
+# with a manifest, pairs whose files are unchanged reuse their stored record
+def C_evaluate_records(file_pairs, threshold: float = 0.85, manifest: RunManifest = None,
+                       field_comparators: dict = None):
+
+    version = f"{threshold}/{EXACT_THRESHOLD}/{SEMANTIC_THRESHOLD}/{comparator_signature(field_comparators)}"
+    stored = {}
+    loaded = []
+    pairs = []
+    for gt_file, pred_file in file_pairs:
+        input_hash = file_hash(gt_file, pred_file)
+        if manifest is not None:
+            record = manifest.reusable("custom_eval", pred_file.name, input_hash, embedding_backend.name, version)
+            if record is not None:
+                stored[pred_file] = record
+                continue
+
+        instrumentation.record_read(gt_file)
+        instrumentation.record_read(pred_file)
+        gt = json.loads(gt_file.read_text(encoding="utf-8"))
+        pred = json.loads(pred_file.read_text(encoding="utf-8"))
+        fields = []
+        for field in ALL_FIELDS:
+            gt_val = str(gt.get(field, "")).strip()
+            pred_val = str(pred.get(field, "")).strip()
+            pair_index = None
+            if gt_val and pred_val:
+                pair_index = len(pairs)
+                pairs.append((field, gt_val, pred_val))
+            fields.append((field, gt_val, pred_val, pair_index))
+        loaded.append((gt_file, pred_file, fields, input_hash))
+
+    similarities = score_field_pairs(pairs, _embedding_similarities, field_comparators)
+
+    for gt_file, pred_file, fields, input_hash in loaded:
+        record = _custom_record(gt_file, pred_file, fields, similarities, threshold, field_comparators)
+        stored[pred_file] = record
+        if manifest is not None:
+            manifest.record("custom_eval", pred_file.name, input_hash, embedding_backend.name, version, output=record)
+
+    return [stored[pred_file] for _, pred_file in file_pairs]
+
 
-    field_similarity_scores = defaultdict(list)
+def _custom_record(gt_file, pred_file, fields, similarities, threshold, field_comparators=None):
+
+    field_results = []
     tp = fp = fn = tn = 0
     matched_fields = evaluated_fields = 0
     exact_matched = exact_evaluated = 0
     semantic_matched = semantic_evaluated = 0
 
-    # detailed report
-    with detailed_report_path.open("a", encoding="utf-8") as detailed_report:
-        detailed_report.write(f"FILE: {gt_file.name} vs {pred_file.name}\n")
-        detailed_report.write("-" * 60 + "\n")
+    for field, gt_val, pred_val, pair_index in fields:
 
-        for field in ALL_FIELDS:
-            gt_val = str(gt.get(field, "")).strip()
-            pred_val = str(pred.get(field, "")).strip()
+        if gt_val and pred_val:
+            tp += 1
+            sim = float(similarities[pair_index])
 
-            if gt_val and pred_val:
-                tp += 1
-                emb_gt = get_openai_embedding(gt_val)
-                emb_pred = get_openai_embedding(pred_val)
-                sim = cosine_similarity([emb_gt], [emb_pred])[0][0]
-                field_similarity_scores[field].append(sim)
-
-                standard_threshold = EXACT_THRESHOLD if field in EXACT_FIELDS else SEMANTIC_THRESHOLD
-                status = "PASS" if sim >= standard_threshold else "ERROR"
-
-                if status == "PASS":
-                    matched_fields += 1
-                    if field in EXACT_FIELDS:
-                        exact_matched += 1
-                    else:
-                        semantic_matched += 1
-
-                evaluated_fields += 1
+            standard_threshold = EXACT_THRESHOLD if field in EXACT_FIELDS else SEMANTIC_THRESHOLD
+            status = "PASS" if sim >= standard_threshold else "ERROR"
+
+            if status == "PASS":
+                matched_fields += 1
                 if field in EXACT_FIELDS:
-                    exact_evaluated += 1
+                    exact_matched += 1
                 else:
-                    semantic_evaluated += 1
+                    semantic_matched += 1
+
+            evaluated_fields += 1
+            if field in EXACT_FIELDS:
+                exact_evaluated += 1
+            else:
+                semantic_evaluated += 1
+
+            field_results.append({
+                "field": field, "status": status, "similarity": sim, "threshold": standard_threshold,
+                "comparator": comparator_name(field, field_comparators),
+            })
+
+        elif not gt_val and pred_val:
+            fp += 1
+            field_results.append({"field": field, "status": "FP"})
+
+        elif gt_val and not pred_val:
+            fn += 1
+            field_results.append({"field": field, "status": "FN"})
+
+        else:
+            tn += 1
+            field_results.append({"field": field, "status": "TN"})
+
+    # summary
+    total_relevant = tp + fn + fp
+    overall_match = (tp / total_relevant) if total_relevant else 0
+
+    exact_match = (exact_matched / exact_evaluated) if exact_evaluated else 0
+    semantic_match = (semantic_matched / semantic_evaluated) if semantic_evaluated else 0
+
+    return {
+        "kind": "custom_eval",
+        "file": gt_file.name,
+        "pred_file": pred_file.name,
+        "fields": field_results,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "overall_match": overall_match,
+        "exact_match": exact_match,
+        "semantic_match": semantic_match,
+        "threshold": threshold,
+        "result": "PASS" if overall_match >= threshold else "FAIL",
+    }
+
+
+def C_evaluate_record(
+    gt_file: Path,
+    pred_file: Path,
+    threshold: float = 0.85
+):
+    return C_evaluate_records([(gt_file, pred_file)], threshold)[0]
 
-                detailed_report.write(f"{field} | similarity={sim:.3f} | threshold={standard_threshold} | {status}\n")
 
-            elif not gt_val and pred_val:
-                fp += 1
-                detailed_report.write(f"{field} | FP (pred present, GT missing)\n")
+FIELD_STATUS_TEXT = {
+    "FP": "FP (pred present, GT missing)",
+    "FN": "FN (GT present, pred missing)",
+    "TN": "TN (both missing/empty)",
+}
 
-            elif gt_val and not pred_val:
-                fn += 1
-                detailed_report.write(f"{field} | FN (GT present, pred missing)\n")
 
-            else:
-                tn += 1
-                detailed_report.write(f"{field} | TN (both missing/empty)\n")
-
-        # summary
-        total_relevant = tp + fn + fp
-        overall_match = (tp / total_relevant) if total_relevant else 0
-
-        exact_match = (exact_matched / exact_evaluated) if exact_evaluated else 0
-        semantic_match = (semantic_matched / semantic_evaluated) if semantic_evaluated else 0
-
-        detailed_report.write("\nSUMMARY PER FILE\n")
-        detailed_report.write(f"TP: {tp}, FP: {fp}, FN: {fn}, TN: {tn}\n")
-        detailed_report.write(f"Overall Match: {overall_match:.2%}\n")
-        detailed_report.write(f"Exact Fields Match: {exact_match:.2%}\n")
-        detailed_report.write(f"Semantic Fields Match: {semantic_match:.2%}\n\n")
-
-    # overall summary
-    with summary_report_path.open("a", encoding="utf-8") as summary_report:
-        result = "PASS" if overall_match >= threshold else "FAIL"
-        summary_report.write("From Custom Evaluation" + "\n")
-        summary_report.write(f"{gt_file.name}: {result}\n")
-        
-        
-        
+def format_custom_detail(record):
+
+    text = f"FILE: {record['file']} vs {record['pred_file']}\n" + "-" * 60 + "\n"
+    for result in record["fields"]:
+        if result["status"] in FIELD_STATUS_TEXT:
+            text += f"{result['field']} | {FIELD_STATUS_TEXT[result['status']]}\n"
+        else:
+            text += f"{result['field']} | similarity={result['similarity']:.3f} | threshold={result['threshold']} | {result['status']}\n"
+
+    text += "\nSUMMARY PER FILE\n"
+    text += f"TP: {record['tp']}, FP: {record['fp']}, FN: {record['fn']}, TN: {record['tn']}\n"
+    text += f"Overall Match: {record['overall_match']:.2%}\n"
+    text += f"Exact Fields Match: {record['exact_match']:.2%}\n"
+    text += f"Semantic Fields Match: {record['semantic_match']:.2%}\n\n"
+    return text
+
+
+def format_custom_summary(record):
+    return "From Custom Evaluation" + "\n" + f"{record['file']}: {record['result']}\n"
+
+
+# pass/fail reports show the summary line, detailed reports use CUSTOM_DETAIL_FORMAT
+register_text_format("custom_eval", format_custom_summary)
+CUSTOM_DETAIL_FORMAT = {"custom_eval": format_custom_detail}
+
+
+def C_evaluate_single_file(
+    gt_file: Path,
+    pred_file: Path,
+    detailed_report_path: Path,
+    summary_report_path: Path,
+    threshold: float = 0.85
+):
+    record = C_evaluate_record(gt_file, pred_file, threshold)
+    append_record(record, detailed_report_path, CUSTOM_DETAIL_FORMAT)
+    append_record(record, summary_report_path)
+    return record
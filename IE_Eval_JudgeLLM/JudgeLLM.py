@@ -1,10 +1,12 @@
 import json
+import asyncio
+import hashlib
 import argparse
 from pathlib import Path
-from deepeval.metrics import GEval
-from deepeval.test_case import LLMTestCase, LLMTestCaseParams
-from custom_llm import CustomGeminiFlash
-from custom_llm2 import CustomOpenAI
+from report_sink import register_text_format, append_record
+from run_manifest import RunManifest, file_hash
+from response_cache import DiskResponseCache
+import instrumentation
 
 # Fields to validate
 FIELDS_TO_CHECK = [
@@ -22,14 +24,36 @@ FIELDS_TO_CHECK = [
     "Ehdotus"
 ]
 
+JUDGE_CRITERIA = """
+    Evaluate whether the extracted JSON faithfully represents the source text.
+    - All required fields must be present
+    - Values must be present in the source text
+    - No hallucinations. Halucinations should be penalized
+    - Partial correctness is okay if not hallucinated
+    - Complete ansers should be rewarded
+    """
+
+
+# get_model_name() of the adapter judge_model() builds. Verdicts and manifest entries are keyed on it,
+# so stored results are found without building the adapter; change both together.
+JUDGE_MODEL_NAME = "gpt-4o-mini"  # "Gemini 1.5 Flash" for CustomGeminiFlash
+
+_judge_model = {}
+
+
+# one model adapter for every file; its API clients are shared as well
+# deepeval, instructor and the model SDKs are only imported once something is actually judged
+def judge_model():
+    if "model" not in _judge_model:
+        from custom_llm2 import CustomOpenAI
+        model = CustomOpenAI() # Or CustomGeminiFlash()
+        if model.get_model_name() != JUDGE_MODEL_NAME:
+            raise ValueError(f"JUDGE_MODEL_NAME is {JUDGE_MODEL_NAME!r}, the judge model is {model.get_model_name()!r}")
+        _judge_model["model"] = model
+    return _judge_model["model"]
 
-# Single-file evaluation
-def G_evaluate_single_file(
-    gt_file_path: Path,
-    transcription_file_path: Path,
-    report_file_path: Path,
-    threshold: float,
-):
+
+def _judge_inputs(gt_file_path: Path, transcription_file_path: Path):
 
     if not gt_file_path.exists():
         raise FileNotFoundError(f"Ground truth file not found: {gt_file_path}")
@@ -44,6 +68,11 @@ def G_evaluate_single_file(
         pred_data = json.load(f)
 
     filtered_extracted = {k: pred_data.get(k, None) for k in FIELDS_TO_CHECK}
+    return gt_data, filtered_extracted
+
+
+def _judge_test_case(gt_data, filtered_extracted):
+    from deepeval.test_case import LLMTestCase
 
     # prompt
     prompt = f"""
@@ -55,42 +84,231 @@ GROUND TRUTH JSON:
 EXTRACTED JSON:
 {json.dumps(filtered_extracted, indent=2)}
 """
-    custom_aiModel = CustomOpenAI() # Or CustomGeminiFlash()
 
-    geval_metric = GEval(
+    # test case
+    return LLMTestCase(
+        input=prompt,
+        actual_output=json.dumps(filtered_extracted, indent=2)
+    )
+
+
+# GEval keeps score and reason on the metric object, so every evaluation gets its own
+def _judge_metric(model, threshold: float):
+    from deepeval.metrics import GEval
+    from deepeval.test_case import LLMTestCaseParams
+    return GEval(
         name="JSON Extraction Quality",
-        criteria="""
-    Evaluate whether the extracted JSON faithfully represents the source text.
-    - All required fields must be present
-    - Values must be present in the source text
-    - No hallucinations. Halucinations should be penalized
-    - Partial correctness is okay if not hallucinated
-    - Complete ansers should be rewarded
-    """,
+        criteria=JUDGE_CRITERIA,
         evaluation_params=[
             LLMTestCaseParams.INPUT,
             LLMTestCaseParams.ACTUAL_OUTPUT
         ],
-        model=custom_aiModel,
+        model=model,
         threshold=threshold,
     )
 
-    # test case
-    test_case = LLMTestCase(
-        input=prompt,
-        actual_output=json.dumps(filtered_extracted, indent=2)
+
+def _judge_version(threshold: float):
+    return hashlib.sha256(f"{JUDGE_CRITERIA}|{threshold}".encode("utf-8")).hexdigest()[:16]
+
+
+def _judge_record(gt_file_path: Path, score, reason, threshold: float):
+    return {
+        "kind": "judge",
+        "file": gt_file_path.name,
+        "score": score,
+        "threshold": threshold,
+        "passed": score >= threshold,
+        "reason": reason,
+    }
+
+
+# a file the judge could not evaluate; it is not stored, so the next run judges it again
+def _judge_error_record(gt_file_path: Path, error: Exception):
+    return {
+        "kind": "judge_error",
+        "file": gt_file_path.name,
+        "error": f"{type(error).__name__}: {error}",
+    }
+
+
+# Stored GEval verdicts (score and reason), keyed by a canonical hash of GT JSON, extracted JSON, criteria and model.
+# The threshold is not part of the key; PASSED is recomputed from the stored score.
+# mode "use": reuse stored verdicts and judge misses; "replay": never call the model, a miss raises;
+# "refresh": always judge again and overwrite the stored verdict.
+VERDICT_MODES = ("use", "replay", "refresh")
+
+
+class VerdictStore:
+
+    def __init__(self, directory: Path, mode: str = "use", max_bytes: int = 64 * 2**20, backend=None):
+        if mode not in VERDICT_MODES:
+            raise ValueError(f"Unknown verdict mode: {mode}")
+        self.mode = mode
+        self.backend = backend if backend is not None else DiskResponseCache(directory, max_bytes)
+
+    @staticmethod
+    def key(gt_data, filtered_extracted, model_name: str):
+        canonical = json.dumps(
+            {"gt": gt_data, "extracted": filtered_extracted, "criteria": JUDGE_CRITERIA, "model": model_name},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str, name: str):
+        if self.mode == "refresh":
+            return None
+        verdict = self.backend.get(key)
+        if verdict is None and self.mode == "replay":
+            raise LookupError(f"No stored judge verdict for {name} (replay mode)")
+        return verdict
+
+    def store(self, key: str, score, reason, model_name: str):
+        self.backend.put(key, {"score": score, "reason": reason, "model": model_name})
+
+
+# everything before the GEval call: manifest and verdict store lookups
+# returns (record, None) when a stored result can be used, otherwise (None, job)
+# the model adapter is only built for a file that has to be judged, never in replay mode
+def _prepare_judge(gt_file_path, transcription_file_path, threshold, manifest, verdicts):
+
+    gt_data, filtered_extracted = _judge_inputs(gt_file_path, transcription_file_path)
+    model_name = JUDGE_MODEL_NAME
+
+    # unchanged GT/prediction pairs keep their earlier verdict (unless the verdicts are being refreshed)
+    input_hash = file_hash(gt_file_path, transcription_file_path)
+    version = _judge_version(threshold)
+    if manifest is not None and not (verdicts is not None and verdicts.mode == "refresh"):
+        stored = manifest.reusable("judge", transcription_file_path.name, input_hash, model_name, version)
+        if stored is not None:
+            return stored, None
+
+    job = {
+        "gt_file_path": gt_file_path, "transcription_file_path": transcription_file_path,
+        "threshold": threshold, "model_name": model_name, "model": None, "input_hash": input_hash,
+        "version": version, "verdict_key": None, "test_case": None,
+    }
+    if verdicts is not None:
+        job["verdict_key"] = verdicts.key(gt_data, filtered_extracted, model_name)
+        verdict = verdicts.lookup(job["verdict_key"], transcription_file_path.name)
+        if verdict is not None:
+            return _finish_judge(job, verdict["score"], verdict["reason"], manifest, None), None
+
+    job["model"] = judge_model()
+    job["test_case"] = _judge_test_case(gt_data, filtered_extracted)
+    return None, job
+
+
+def _finish_judge(job, score, reason, manifest, verdicts):
+
+    record = _judge_record(job["gt_file_path"], score, reason, job["threshold"])
+    model_name = job["model_name"]
+    if verdicts is not None:
+        verdicts.store(job["verdict_key"], score, reason, model_name)
+    if manifest is not None:
+        manifest.record("judge", job["transcription_file_path"].name, job["input_hash"], model_name, job["version"],
+                        output=record)
+    return record
+
+
+# Single-file evaluation
+def G_evaluate_record(
+    gt_file_path: Path,
+    transcription_file_path: Path,
+    threshold: float,
+    manifest: RunManifest = None,
+    verdicts: VerdictStore = None,
+):
+
+    record, job = _prepare_judge(gt_file_path, transcription_file_path, threshold, manifest, verdicts)
+    if record is not None:
+        return record
+
+    geval_metric = _judge_metric(job["model"], threshold)
+    with instrumentation.file_scope(transcription_file_path.name), instrumentation.timer("llm_judge"):
+        score = geval_metric.measure(job["test_case"])
+    return _finish_judge(job, score, geval_metric.reason, manifest, verdicts)
+
+
+async def a_G_evaluate_record(
+    gt_file_path: Path,
+    transcription_file_path: Path,
+    threshold: float,
+    semaphore: asyncio.Semaphore,
+    manifest: RunManifest = None,
+    verdicts: VerdictStore = None,
+):
+
+    # a failing file gets an error record instead of failing the batch; a replay miss still stops the run
+    try:
+        record, job = _prepare_judge(gt_file_path, transcription_file_path, threshold, manifest, verdicts)
+        if record is not None:
+            return record
+
+        geval_metric = _judge_metric(job["model"], threshold)
+        async with semaphore:
+            with instrumentation.file_scope(transcription_file_path.name), instrumentation.timer("llm_judge"):
+                score = await geval_metric.a_measure(job["test_case"])
+        return _finish_judge(job, score, geval_metric.reason, manifest, verdicts)
+    except LookupError:
+        raise
+    except Exception as e:
+        print(f"!Error judging {transcription_file_path.name}: {e}")
+        return _judge_error_record(gt_file_path, e)
+
+
+# Batch evaluation: judges many (gt_file, pred_file) pairs concurrently, at most `concurrency` at a time.
+# Records come back in the order of file_pairs; a file that failed gets a "judge_error" record.
+# The model's async client belongs to this call's event loop and is closed with it.
+def G_evaluate_records(file_pairs, threshold: float, concurrency: int = 8, manifest: RunManifest = None,
+                       verdicts: VerdictStore = None):
+
+    async def evaluate_all():
+        semaphore = asyncio.Semaphore(concurrency)
+        try:
+            return await asyncio.gather(*(
+                a_G_evaluate_record(gt_file, pred_file, threshold, semaphore, manifest, verdicts)
+                for gt_file, pred_file in file_pairs
+            ))
+        finally:
+            if "model" in _judge_model:
+                await _judge_model["model"].a_close()
+
+    return list(asyncio.run(evaluate_all()))
+
+
+def format_judge(record):
+    return (
+        "From Judge LLM" + "\n"
+        f"SCORE: {record['score']}\n"
+        f"THRESHOLD: {record['threshold']}\n"
+        f"PASSED: {record['passed']}\n"
+        "REASONING: "
+        + record["reason"] + "\n\n"
+        + "=" * 80 + "\n"
     )
 
-    score = geval_metric.measure(test_case)
-    reason = geval_metric.reason
 
-    with report_file_path.open("a", encoding="utf-8") as report:
-        report.write("From Judge LLM" + "\n")
-        report.write(f"SCORE: {score}\n")
-        report.write(f"THRESHOLD: {threshold}\n")
-        report.write(f"PASSED: {score >= threshold}\n")
-        report.write("REASONING: ")
-        report.write(reason + "\n\n")
-        report.write("=" * 80 + "\n")
+def format_judge_error(record):
+    return (
+        "From Judge LLM" + "\n"
+        f"ERROR: {record['error']}\n\n"
+        + "=" * 80 + "\n"
+    )
+
+
+register_text_format("judge", format_judge)
+register_text_format("judge_error", format_judge_error)
+
+
+def G_evaluate_single_file(
+    gt_file_path: Path,
+    transcription_file_path: Path,
+    report_file_path: Path,
+    threshold: float,
+):
+    record = G_evaluate_record(gt_file_path, transcription_file_path, threshold)
+    append_record(record, report_file_path)
 
     print(f"Evaluation complete. Report saved to: {report_file_path}")
+    return record
@@ -1,23 +1,59 @@
+import asyncio
+import weakref
 from pydantic import BaseModel
 import google.generativeai as genai
 import instructor
 from deepeval.models import DeepEvalBaseLLM
+import instrumentation
+
+# The Gemini model and its sync instructor wrapper are created once and shared by every CustomGeminiFlash.
+# The async wrapper's client is bound to the event loop it was first used in, and G_evaluate_records runs
+# a new loop per batch, so async wrappers (on their own model) are kept per running loop and dropped by a_close().
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> instructor client
+
+
+def _model():
+    genai.configure(api_key="")
+    return genai.GenerativeModel(model_name="models/gemini-3-flash-preview")
+
+
+def _shared_clients():
+    if not _clients:
+        model = _model()
+        _clients["model"] = model
+        _clients["sync"] = instructor.from_gemini(
+            client=model,
+            mode=instructor.Mode.GEMINI_JSON,
+        )
+    return _clients["model"], _clients["sync"]
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        _async_clients[loop] = instructor.from_gemini(
+            client=_model(),
+            mode=instructor.Mode.GEMINI_JSON,
+            use_async=True,
+        )
+    return _async_clients[loop]
+
 
 class CustomGeminiFlash(DeepEvalBaseLLM):
     def __init__(self):
-        genai.configure(api_key="")
-        self.model = genai.GenerativeModel(model_name="models/gemini-3-flash-preview")
+        self.model, self.instructor_client = _shared_clients()
+
+    @property
+    def async_instructor_client(self):
+        return _async_client()
 
     def load_model(self):
         return self.model
 
+    @instrumentation.timed("llm_judge_call")
     def generate(self, prompt: str, schema: BaseModel):
-        client = self.load_model()
-        instructor_client = instructor.from_gemini(
-            client=client,
-            mode=instructor.Mode.GEMINI_JSON,
-        )
-        resp = instructor_client.messages.create(
+        resp = self.instructor_client.messages.create(
             messages=[
                 {
                     "role": "user",
@@ -28,8 +64,21 @@ class CustomGeminiFlash(DeepEvalBaseLLM):
         )
         return resp
 
+    @instrumentation.timed("llm_judge_call")
     async def a_generate(self, prompt: str, schema: BaseModel):
-        return self.generate(prompt, schema)
+        resp = await self.async_instructor_client.messages.create(
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            response_model=schema,
+        )
+        return resp
+
+    async def a_close(self):
+        _async_clients.pop(asyncio.get_running_loop(), None)
 
     def get_model_name(self):
-        return "Gemini 1.5 Flash"
\ No newline at end of file
+        return "Gemini 1.5 Flash"
@@ -1,22 +1,51 @@
+import os
+import asyncio
+import weakref
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 import instructor
 from deepeval.models import DeepEvalBaseLLM
+import instrumentation
+
+# The sync client is shared by every CustomOpenAI for the life of the process. An async client is bound
+# to the event loop it was first used in, and G_evaluate_records runs a new loop per batch, so async
+# clients are kept per running loop; a_close() closes the current loop's client when its batch ends.
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> (instructor client, AsyncOpenAI)
+
+
+def _client_options():
+    return {"api_key": os.getenv("OPENAI_API_KEY", "sk-proj"), "base_url": os.getenv("OPENAI_BASE_URL")}
+
+
+def _sync_client():
+    if "sync" not in _clients:
+        _clients["sync"] = instructor.from_openai(OpenAI(**_client_options()), mode=instructor.Mode.JSON)
+    return _clients["sync"]
+
+
+def _async_client():
+    loop = asyncio.get_running_loop()
+    if loop not in _async_clients:
+        client = AsyncOpenAI(**_client_options())
+        _async_clients[loop] = (instructor.from_openai(client, mode=instructor.Mode.JSON), client)
+    return _async_clients[loop][0]
+
 
 class CustomOpenAI(DeepEvalBaseLLM):
     def __init__(self):
-        client = OpenAI(api_key="sk-proj")
-        
-        self.client = instructor.from_openai(
-            client,
-            mode=instructor.Mode.JSON,
-        )
+        self.client = _sync_client()
 
         self.model_name = "gpt-4o-mini"
 
+    @property
+    def async_client(self):
+        return _async_client()
+
     def load_model(self):
         return self.client
 
+    @instrumentation.timed("llm_judge_call")
     def generate(self, prompt: str, schema: BaseModel):
         return self.client.chat.completions.create(
             model=self.model_name,
@@ -26,8 +55,21 @@ class CustomOpenAI(DeepEvalBaseLLM):
             response_model=schema,
         )
 
+    @instrumentation.timed("llm_judge_call")
     async def a_generate(self, prompt: str, schema: BaseModel):
-        return self.generate(prompt, schema)
+        return await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            response_model=schema,
+        )
+
+    # closes the async client of the running loop (its connection pool dies with the loop)
+    async def a_close(self):
+        entry = _async_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].close()
 
     def get_model_name(self):
         return self.model_name
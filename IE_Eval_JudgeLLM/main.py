@@ -1,6 +1,14 @@
+import sys
 from pathlib import Path
-from Custom_evaluation import C_evaluate_single_file
-from JudgeLLM import G_evaluate_single_file 
+
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared modules at the repo root
+
+from report_sink import ReportSink
+from Custom_evaluation import C_evaluate_records, CUSTOM_DETAIL_FORMAT, configure_embedding_store, configure_embedding_backend
+from JudgeLLM import G_evaluate_records, VerdictStore
+from tiered import T_evaluate_records
+from run_manifest import RunManifest
+from field_comparators import DEFAULT_FIELD_COMPARATORS
 
 # Config
 TRANSCRIPTION_FOLDER = Path("/scratch/project_2010972/sabina/judgeLLM/data/transcription")  
@@ -13,9 +21,37 @@ LLM_DETAILED_REPORT = Path("LLM_Detailed_ErrorReport.txt")
 PASS_FAIL_REPORT = Path("IE_PassFail_Report.txt")
 
 THRESHOLD = 0.85
+JUDGE_CONCURRENCY = 8  # judge calls in flight at once
+# "full": custom evaluation and judge for every file
+# "tiered": judge only files whose custom result is within UNCERTAINTY_BAND of THRESHOLD or has disagreeing fields
+EVALUATION_MODE = "full"
+UNCERTAINTY_BAND = 0.10
+FIELD_BAND = 0.03  # a field similarity this close to its own threshold also goes to the judge
+# the stores below are opt-in; a store is only as fresh as its version keys, so clear it after changing the code
+JUDGE_VERDICT_DIR = None  # e.g. Path("judge_verdicts"), reuses stored judge verdicts
+JUDGE_VERDICT_MODE = "use"  # with JUDGE_VERDICT_DIR: "replay" never calls the judge (a miss is an error), "refresh" re-judges everything
+REPORT_FORMATS = ("text",)  # also "jsonl", "csv", "parquet"
+EMBEDDING_CACHE_DIR = None  # e.g. Path("embedding_cache"), reuses embeddings across runs
+# "openai", or "local-cpu" / "sentence-transformers" (e.g. {"model_name": "all-MiniLM-L6-v2", "threads": 8}) offline
+EMBEDDING_BACKEND = "openai"
+EMBEDDING_BACKEND_OPTIONS = {}
+# field -> "exact", "normalized", "fuzzy", "datetime" or "embedding"; only embedding fields call the backend
+FIELD_COMPARATORS = dict(DEFAULT_FIELD_COMPARATORS)
+MANIFEST_PATH = None  # e.g. Path("run_manifest.sqlite"), unchanged GT/prediction pairs reuse their records
 
 if __name__ == "__main__":
 
+    configure_embedding_backend(EMBEDDING_BACKEND, **EMBEDDING_BACKEND_OPTIONS)
+    embedding_store = configure_embedding_store(EMBEDDING_CACHE_DIR)
+    # unchanged GT/prediction pairs reuse their stored records
+    manifest = RunManifest(MANIFEST_PATH) if MANIFEST_PATH is not None else None
+    verdicts = VerdictStore(JUDGE_VERDICT_DIR, JUDGE_VERDICT_MODE) if JUDGE_VERDICT_DIR is not None else None
+
+    # records are buffered and each report is written once at the end
+    detailed_report = ReportSink(IE_DETAILED_REPORT, REPORT_FORMATS, CUSTOM_DETAIL_FORMAT)
+    pass_fail_report = ReportSink(PASS_FAIL_REPORT, REPORT_FORMATS)
+
+    file_pairs = []
     for output_file in OUTPUT_DIR.glob("*.json"):
         base_name = output_file.stem
 
@@ -28,25 +64,49 @@ if __name__ == "__main__":
         if not transcription_file.exists():
             print(f"Transcription file missing for {base_name}")
             continue
+        file_pairs.append((gt_file, output_file))
 
-        print(f"\nProcessing file: {base_name}")
-
-        # Custom evaluation 
-        C_evaluate_single_file(
-            gt_file=gt_file,
-            pred_file=output_file, #json
-            detailed_report_path=IE_DETAILED_REPORT,
-            summary_report_path=PASS_FAIL_REPORT,
-            threshold=THRESHOLD
+    if EVALUATION_MODE == "tiered":
+        custom_records, judge_records, tier_records = T_evaluate_records(
+            file_pairs,
+            threshold=THRESHOLD,
+            band=UNCERTAINTY_BAND,
+            field_band=FIELD_BAND,
+            concurrency=JUDGE_CONCURRENCY,
+            manifest=manifest,
+            verdicts=verdicts,
+            field_comparators=FIELD_COMPARATORS
+        )
+    else:
+        # Custom evaluation for all files at once, field values are embedded in batched requests
+        custom_records = C_evaluate_records(
+            file_pairs, threshold=THRESHOLD, manifest=manifest, field_comparators=FIELD_COMPARATORS
         )
 
-        # JudgeLLM evaluation 
-        G_evaluate_single_file(
-            gt_file_path=gt_file,    
-            transcription_file_path=output_file,
-            report_file_path=PASS_FAIL_REPORT,
-            threshold=THRESHOLD
+        # JudgeLLM evaluation, files are judged concurrently
+        judge_records = G_evaluate_records(
+            file_pairs,
+            threshold=THRESHOLD,
+            concurrency=JUDGE_CONCURRENCY,
+            manifest=manifest,
+            verdicts=verdicts
         )
+        tier_records = [None] * len(file_pairs)
+
+    with detailed_report, pass_fail_report:
+        for (gt_file, output_file), custom_record, judge_record, tier_record in zip(
+                file_pairs, custom_records, judge_records, tier_records):
+            print(f"\nProcessing file: {output_file.stem}")
+
+            detailed_report.add(custom_record)
+            pass_fail_report.add(custom_record)
+            if judge_record is not None:
+                pass_fail_report.add(judge_record)
+            if tier_record is not None:
+                pass_fail_report.add(tier_record)
+
+    if embedding_store is not None:
+        embedding_store.save()
 
     print("\nAll evaluations completed.")
     print(f"IE Detailed Report: {IE_DETAILED_REPORT}")
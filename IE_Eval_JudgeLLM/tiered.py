@@ -0,0 +1,90 @@
+from Custom_evaluation import C_evaluate_records
+from JudgeLLM import G_evaluate_records, VerdictStore
+from report_sink import register_text_format
+from run_manifest import RunManifest
+
+# Tiered evaluation: the embedding-based custom evaluator (tier 1) runs for every file,
+# the GEval judge (tier 2) only where tier 1 is unsure:
+# - overall match within `band` of the threshold
+# - field presence and field similarity point different ways (one passes the threshold, the other does not)
+# - a compared field has a similarity within `field_band` of its own threshold
+
+UNCERTAINTY_BAND = 0.10
+FIELD_BAND = 0.03
+
+
+def tier_decision(custom_record, threshold: float, band: float = UNCERTAINTY_BAND, field_band: float = FIELD_BAND):
+
+    overall = custom_record["overall_match"]
+    if abs(overall - threshold) <= band:
+        return True, f"overall match {overall:.2%} within {band:.0%} of threshold {threshold}"
+
+    compared = [result for result in custom_record["fields"] if "similarity" in result]
+    if compared:
+        similarity_match = sum(result["status"] == "PASS" for result in compared) / len(compared)
+        if (overall >= threshold) != (similarity_match >= threshold):
+            return True, f"fields disagree: presence {overall:.2%}, similarity {similarity_match:.2%}"
+
+        borderline = [
+            result["field"] for result in compared
+            if abs(result["similarity"] - result["threshold"]) <= field_band
+        ]
+        if borderline:
+            return True, "borderline fields: " + ", ".join(borderline)
+
+    return False, f"clear {custom_record['result']}: overall match {overall:.2%}"
+
+
+# returns (custom_records, judge_records, tier_records) in file_pairs order; judge_records[i] is None
+# for files settled at tier 1
+def T_evaluate_records(file_pairs, threshold: float = 0.85, band: float = UNCERTAINTY_BAND,
+                       field_band: float = FIELD_BAND, concurrency: int = 8,
+                       manifest: RunManifest = None, verdicts: VerdictStore = None, field_comparators: dict = None):
+
+    custom_records = C_evaluate_records(file_pairs, threshold=threshold, manifest=manifest,
+                                        field_comparators=field_comparators)
+
+    decisions = [tier_decision(record, threshold, band, field_band) for record in custom_records]
+    escalated = [i for i, (needs_judge, _) in enumerate(decisions) if needs_judge]
+
+    judge_records = [None] * len(file_pairs)
+    if escalated:
+        judged = G_evaluate_records(
+            [file_pairs[i] for i in escalated], threshold=threshold, concurrency=concurrency,
+            manifest=manifest, verdicts=verdicts,
+        )
+        for i, record in zip(escalated, judged):
+            judge_records[i] = record
+
+    tier_records = []
+    for (gt_file, pred_file), custom_record, judge_record, (needs_judge, reason) in zip(
+            file_pairs, custom_records, judge_records, decisions):
+        if judge_record is None:
+            result = custom_record["result"]
+        elif judge_record["kind"] == "judge_error":
+            result = "ERROR"
+        else:
+            result = "PASS" if judge_record["passed"] else "FAIL"
+        tier_records.append({
+            "kind": "tier",
+            "file": gt_file.name,
+            "tier": 2 if needs_judge else 1,
+            "decision": reason,
+            "custom_result": custom_record["result"],
+            "judge_passed": judge_record.get("passed") if judge_record is not None else None,
+            "result": result,
+        })
+
+    return custom_records, judge_records, tier_records
+
+
+def format_tier(record):
+    reached = "judge LLM" if record["tier"] == 2 else "custom evaluation only"
+    return (
+        f"TIER: {record['tier']} ({reached})\n"
+        f"DECISION: {record['decision']}\n"
+        f"FINAL: {record['result']}\n\n"
+    )
+
+
+register_text_format("tier", format_tier)
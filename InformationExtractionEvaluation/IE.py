@@ -1,6 +1,12 @@
 from pathlib import Path
 import json
-from openai import OpenAI
+import time
+import random
+import asyncio
+import hashlib
+from run_manifest import RunManifest, file_hash, STATUS_OK, STATUS_FAILED
+from response_cache import response_key, make_entry
+import instrumentation
 
 # We want these info from LLM
 FIELDS = [
@@ -18,12 +24,11 @@ FIELDS = [
     "Ehdotus",
 ]
 
+MAX_OUTPUT_TOKENS = 1000
 
-def extract_fields_from_text(file_path: Path,client: OpenAI,model_name: str):
 
-    #LLM should return JSON format
-    text = file_path.read_text(encoding="utf-8") 
-    prompt = f"""
+def build_prompt(text: str):
+    return f"""
     You are a strict JSON generator.
     Return ONLY a valid JSON object with these exact keys:
     {FIELDS}
@@ -40,65 +45,320 @@ def extract_fields_from_text(file_path: Path,client: OpenAI,model_name: str):
     \"\"\"
     """
 
+
+# the JSON object of a reply, or None when there is none (no JSON, malformed JSON or not an object);
+# missing fields are filled in by save_extraction
+def parse_reply(raw_reply: str, file_path: Path):
+
+    # cleaning for better JSON format  if required
+    start = raw_reply.find("{")
+    end = raw_reply.rfind("}")
+
+    if start == -1 or end == -1:
+        print(f"!No JSON found in {file_path.name}")
+        return None
+
+    json_text = raw_reply[start:end + 1]
+
     try:
-        response = client.responses.create(
-            model=model_name,
-            input=prompt,
-            max_output_tokens=1000
-        )
+        data = json.loads(json_text)
+    except json.JSONDecodeError:
+        print(f"!Malformed JSON in {file_path.name}")
+        return None
 
-        raw_reply = response.output_text.strip()
+    if not isinstance(data, dict):
+        print(f"!Malformed JSON in {file_path.name}")
+        return None
+    return data
 
-        # cleaning for better JSON format  if required
-        start = raw_reply.find("{")
-        end = raw_reply.rfind("}")
 
-        if start == -1 or end == -1:
-            print(f"!No JSON found in {file_path.name}")
-            return {}
+def with_placeholders(data: dict):
+    # Ensure all fields exist
+    data = dict(data)
+    for field in FIELDS:
+        if field not in data or data[field] is None:
+            data[field] = "--tyhjä"
+    return data
 
-        json_text = raw_reply[start:end + 1]
 
-        try:
-            data = json.loads(json_text)
-        except json.JSONDecodeError:
-            print(f"!Malformed JSON in {file_path.name}")
-            data = {}
+# Response cache (see response_cache.py). Every raw reply is stored so parse_reply can be replayed offline,
+# but only replies that parse_reply could read (recovered) are reused instead of calling the API again.
+
+def cached_reply(cache, model_name: str, prompt: str):
+    if cache is None:
+        return None
+    entry = cache.get(response_key(model_name, prompt, MAX_OUTPUT_TOKENS))
+    if entry is None or not entry.get("recovered"):
+        return None
+    instrumentation.count("llm_cache_hits")
+    return entry["reply"]
 
-        # Ensure all fields exist
-        for field in FIELDS:
-            if field not in data or data[field] is None:
-                data[field] = "--tyhjä"
 
-        return data
+def store_reply(cache, model_name: str, prompt: str, raw_reply: str, extracted):
+    if cache is None:
+        return
+    entry = make_entry(model_name, prompt, MAX_OUTPUT_TOKENS, raw_reply, recovered=extracted is not None)
+    cache.put(response_key(model_name, prompt, MAX_OUTPUT_TOKENS), entry)
+
+
+def extract_fields_from_text(file_path: Path,client,model_name: str, cache=None):
+
+    #LLM should return JSON format
+    instrumentation.record_read(file_path)
+    text = file_path.read_text(encoding="utf-8") 
+    prompt = build_prompt(text)
+
+    raw_reply = cached_reply(cache, model_name, prompt)
+    if raw_reply is not None:
+        return parse_reply(raw_reply, file_path)
+
+    try:
+        with instrumentation.timer("llm_extract"):
+            response = client.responses.create(
+                model=model_name,
+                input=prompt,
+                max_output_tokens=MAX_OUTPUT_TOKENS
+            )
+        record_usage(response)
+
+        raw_reply = response.output_text.strip()
+        extracted = parse_reply(raw_reply, file_path)
+        store_reply(cache, model_name, prompt, raw_reply, extracted)
+        return extracted
 
     except Exception as e:
         print(f"!Error extracting from {file_path.name}: {e}")
         return None
 
 
-def run_field_extraction(input_dir:Path, output_dir: Path, model_name: str, api_key: str):
+# API tokens of a Responses API reply, for the instrumentation counters
+def record_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        instrumentation.count("llm_input_tokens", getattr(usage, "input_tokens", 0) or 0)
+        instrumentation.count("llm_output_tokens", getattr(usage, "output_tokens", 0) or 0)
+
+
+def save_extraction(extracted, output_path: Path, txt_path: Path):
+
+    if extracted is None:
+        output_path.write_text("{}", encoding="utf-8")
+        print(f"!Saved empty JSON for {txt_path.name}")
+        return
+
+    with output_path.open("w", encoding="utf-8") as f:
+        json.dump(with_placeholders(extracted), f, ensure_ascii=False, indent=2)
+
+    print(f"!Saved JSON: {output_path.name}")
+
+
+# changes whenever the prompt template or the field list changes, so the manifest re-extracts everything
+PROMPT_VERSION = hashlib.sha256(build_prompt("").encode("utf-8")).hexdigest()[:16]
+
+
+def output_path_for(txt_path: Path, output_dir: Path):
+    return output_dir / f"{txt_path.stem}_form.json"
+
+
+# transcripts that still need extracting: new, changed, failed earlier or with a missing output file
+def pending_extractions(text_files, output_dir: Path, model_name: str, manifest: RunManifest = None):
+
+    pending = []
+    for txt_path in text_files:
+        input_hash = file_hash(txt_path)
+        if (
+            manifest is not None
+            and output_path_for(txt_path, output_dir).exists()
+            and manifest.is_current("extract", txt_path.name, input_hash, model_name, PROMPT_VERSION)
+        ):
+            continue
+        pending.append((txt_path, input_hash))
+
+    skipped = len(text_files) - len(pending)
+    if skipped:
+        print(f"Skipping {skipped} unchanged transcripts (manifest)")
+    return pending
+
+
+def record_extraction(manifest: RunManifest, txt_path: Path, input_hash: str, model_name: str, extracted):
+    if manifest is None:
+        return
+    # None is an API error or a reply without a readable JSON object; both are retried on the next run
+    status = STATUS_OK if extracted is not None else STATUS_FAILED
+    manifest.record("extract", txt_path.name, input_hash, model_name, PROMPT_VERSION, status)
+
+
+# text_files: transcripts already listed by the caller (default: every *.txt in input_dir)
+def run_field_extraction(input_dir:Path, output_dir: Path, model_name: str, api_key: str, manifest: RunManifest = None,
+                         cache=None, text_files=None):
     
     output_dir.mkdir(parents=True, exist_ok=True)
+    from openai import OpenAI
     client = OpenAI(api_key=api_key)
 
-    text_files = sorted(input_dir.glob("*.txt"))
+    text_files = sorted(text_files if text_files is not None else input_dir.glob("*.txt"))
 
-    for txt_path in text_files:
-        output_path = output_dir / f"{txt_path.stem}_form.json"
+    for txt_path, input_hash in pending_extractions(text_files, output_dir, model_name, manifest):
+        output_path = output_path_for(txt_path, output_dir)
         print(f"Processing {txt_path.name} ...")
-        extracted = extract_fields_from_text(
-            file_path=txt_path,
-            client=client,
-            model_name=model_name
-        )
-
-        if extracted is None:
-            output_path.write_text("{}", encoding="utf-8")
-            print(f"!Saved empty JSON for {txt_path.name}")
+        with instrumentation.file_scope(txt_path.name):
+            extracted = extract_fields_from_text(
+                file_path=txt_path,
+                client=client,
+                model_name=model_name,
+                cache=cache
+            )
+        save_extraction(extracted, output_path, txt_path)
+        record_extraction(manifest, txt_path, input_hash, model_name, extracted)
+
+
+# rebuilds the *_form.json files from cached replies only, without API calls (e.g. after changing parse_reply)
+def replay_field_extraction(input_dir: Path, output_dir: Path, model_name: str, cache, text_files=None):
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    missing = 0
+    for txt_path in sorted(text_files if text_files is not None else input_dir.glob("*.txt")):
+        prompt = build_prompt(txt_path.read_text(encoding="utf-8"))
+        entry = cache.get(response_key(model_name, prompt, MAX_OUTPUT_TOKENS))
+        if entry is None:
+            print(f"!No cached reply for {txt_path.name}")
+            missing += 1
             continue
+        save_extraction(parse_reply(entry["reply"], txt_path), output_path_for(txt_path, output_dir), txt_path)
+    return missing
+
+
+# Async extraction
+
+# openai is imported when extraction runs, not when this module is imported (replay and evaluation don't need it)
+def retryable_errors():
+    from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+    return RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+
+# Token-bucket limits for requests and tokens per minute (None = unlimited)
+class RateLimiter:
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_budget = requests_per_minute or 0
+        self.token_budget = tokens_per_minute or 0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.updated = now
+        if self.requests_per_minute:
+            self.request_budget = min(self.requests_per_minute, self.request_budget + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self.token_budget = min(self.tokens_per_minute, self.token_budget + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens: int):
+        # a single request larger than the whole minute budget still goes through once the bucket is full
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        async with self.lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self.request_budget < 1:
+                    wait = max(wait, (1 - self.request_budget) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self.token_budget < tokens:
+                    wait = max(wait, (tokens - self.token_budget) * 60 / self.tokens_per_minute)
+                if wait == 0.0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests_per_minute:
+                self.request_budget -= 1
+            if self.tokens_per_minute:
+                self.token_budget -= tokens
+
+
+def estimate_tokens(prompt: str):
+    # rough count, about 4 characters per token, plus the reserved output
+    return len(prompt) // 4 + MAX_OUTPUT_TOKENS
+
+
+async def a_extract_fields_from_text(file_path: Path, client, model_name: str,
+                                     semaphore: asyncio.Semaphore, limiter: RateLimiter,
+                                     timeout: float = 120.0, max_retries: int = 5, cache=None):
+
+    instrumentation.record_read(file_path)
+    text = file_path.read_text(encoding="utf-8")
+    prompt = build_prompt(text)
+
+    raw_reply = cached_reply(cache, model_name, prompt)
+    if raw_reply is not None:
+        return parse_reply(raw_reply, file_path)
+
+    # the semaphore only covers the rate limit wait and the request, so a file backing off frees its slot
+    retryable = retryable_errors()
+    for attempt in range(max_retries + 1):
+        try:
+            async with semaphore:
+                with instrumentation.timer("llm_rate_limit_wait"):
+                    await limiter.acquire(estimate_tokens(prompt))
+                with instrumentation.timer("llm_extract"):
+                    response = await client.responses.create(
+                        model=model_name,
+                        input=prompt,
+                        max_output_tokens=MAX_OUTPUT_TOKENS,
+                        timeout=timeout,
+                    )
+            record_usage(response)
+            raw_reply = response.output_text.strip()
+            extracted = parse_reply(raw_reply, file_path)
+            store_reply(cache, model_name, prompt, raw_reply, extracted)
+            return extracted
+
+        except retryable as e:
+            if attempt == max_retries:
+                print(f"!Error extracting from {file_path.name}: {e}")
+                return None
+            delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"!{type(e).__name__} for {file_path.name}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        except Exception as e:
+            print(f"!Error extracting from {file_path.name}: {e}")
+            return None
+
+
+# concurrent version of run_field_extraction; each JSON is written as soon as its reply arrives
+async def a_run_field_extraction(input_dir: Path, output_dir: Path, model_name: str, api_key: str,
+                                 concurrency: int = 8, requests_per_minute: float = None,
+                                 tokens_per_minute: float = None, timeout: float = 120.0,
+                                 max_retries: int = 5, base_url: str = None, manifest: RunManifest = None,
+                                 cache=None, text_files=None):
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    from openai import AsyncOpenAI
+    client = AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+    async def extract(txt_path):
+        with instrumentation.file_scope(txt_path.name):
+            extracted = await a_extract_fields_from_text(
+                txt_path, client, model_name, semaphore, limiter, timeout, max_retries, cache
+            )
+        return txt_path, extracted
+
+    text_files = sorted(text_files if text_files is not None else input_dir.glob("*.txt"))
+    pending = pending_extractions(text_files, output_dir, model_name, manifest)
+    input_hashes = dict(pending)
+    tasks = [asyncio.create_task(extract(txt_path)) for txt_path, _ in pending]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            txt_path, extracted = await finished
+            save_extraction(extracted, output_path_for(txt_path, output_dir), txt_path)
+            record_extraction(manifest, txt_path, input_hashes[txt_path], model_name, extracted)
+    finally:
+        await client.close()
 
-        with output_path.open("w", encoding="utf-8") as f:
-            json.dump(extracted, f, ensure_ascii=False, indent=2)
 
-        print(f"!Saved JSON: {output_path.name}")
+def run_field_extraction_async(input_dir: Path, output_dir: Path, model_name: str, api_key: str, **options):
+    asyncio.run(a_run_field_extraction(input_dir, output_dir, model_name, api_key, **options))
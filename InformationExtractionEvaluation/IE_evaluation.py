@@ -2,8 +2,12 @@ import json
 import numpy as np
 from pathlib import Path
 from collections import defaultdict
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from report_sink import ReportSink, register_text_format
+from embedding_store import EmbeddingStore
+from embedding_backends import SentenceTransformerBackend
+from field_comparators import score_field_pairs, comparator_name, comparator_signature
+from run_manifest import RunManifest, file_hash
+import instrumentation
 
 # these should match exactly or more than 95%
 EXACT_FIELDS = [
@@ -23,123 +27,247 @@ ALL_FIELDS = EXACT_FIELDS + SEMANTIC_FIELDS
 EXACT_THRESHOLD = 0.95
 SEMANTIC_THRESHOLD = 0.80
 
-# we use ground truth here 
-def evaluate_field_matching(ground_truth_dir: Path, prediction_dir: Path, output_file: Path, model_name: str = "all-MiniLM-L6-v2"):
-    
-    model = SentenceTransformer(model_name)
-
-    tp_list, fp_list, fn_list, tn_list = [], [], [], []
-    file_overall_scores = []
-    exact_match_scores = []
-    semantic_match_scores = []
-
-    field_similarity_scores = defaultdict(list)
-
-    with output_file.open("a", encoding="utf-8") as report:
-
-        for gt_path in ground_truth_dir.iterdir():
-            if gt_path.suffix != ".json":
-                continue
+EMBEDDING_BATCH_SIZE = 256
 
-            pred_path = prediction_dir / gt_path.name
-            if not pred_path.exists():
-                continue
+# stored field_match records are reused only while the thresholds and comparators are unchanged
+def evaluator_version(field_comparators: dict = None):
+    return f"{EXACT_THRESHOLD}/{SEMANTIC_THRESHOLD}/{comparator_signature(field_comparators)}"
 
-            gt = json.loads(gt_path.read_text(encoding="utf-8"))
-            pred = json.loads(pred_path.read_text(encoding="utf-8"))
 
-            gt_fields = set(gt.keys())
-            pred_fields = set(pred.keys())
-            field_set = set(ALL_FIELDS)
+# encodes every distinct text once, in batches; rows are L2-normalised float32
+# the backend only loads its model when something has to be encoded, so a warm store never loads it
+def encode_texts(backend, texts, store: EmbeddingStore = None):
 
-            # extracted fields evaluation not field values
-            tp = len(field_set & gt_fields & pred_fields)
-            fn = len((field_set & gt_fields) - pred_fields)
-            fp = len((pred_fields - gt_fields) & field_set)
-            tn = len(field_set - (gt_fields | pred_fields))
+    unique_texts = list(dict.fromkeys(texts))
+    if not unique_texts:
+        return {}, np.zeros((0, 0), dtype=np.float32)
 
-            tp_list.append(tp)
-            fp_list.append(fp)
-            fn_list.append(fn)
-            tn_list.append(tn)
+    embeddings = store.embed(unique_texts, backend.encode) if store is not None else backend.encode(unique_texts)
+    return {text: row for row, text in enumerate(unique_texts)}, embeddings
 
-            report.write(f"\nFILE: {gt_path.name}\n")
-            report.write("-" * 50 + "\n")
 
-            matched_fields = 0
-            evaluated_fields = 0
+# cosine similarity of each (gt, pred) pair as one row-wise dot product
+def pair_similarities(backend, pairs, store: EmbeddingStore = None):
 
-            exact_matched = 0
-            exact_evaluated = 0
-            semantic_matched = 0
-            semantic_evaluated = 0
+    if not pairs:
+        return np.zeros(0, dtype=np.float32)
+    index, embeddings = encode_texts(backend, [text for pair in pairs for text in pair], store)
+    gt_rows = embeddings[[index[gt_val] for gt_val, _ in pairs]]
+    pred_rows = embeddings[[index[pred_val] for _, pred_val in pairs]]
+    return np.einsum("ij,ij->i", gt_rows, pred_rows)
 
-            for field in field_set & gt_fields & pred_fields:
-                gt_val = str(gt[field]).strip()
-                pred_val = str(pred[field]).strip()
 
-                if not gt_val or not pred_val:
-                    continue
+# we use ground truth here 
+# returns one "field_match" record per file and a "field_match_average" record
+# all field values of the directory are collected first and embedded together in batches
+# embedding_cache_dir: persistent EmbeddingStore, so values seen in earlier runs are not embedded again
+# manifest: files whose GT and prediction are unchanged reuse their stored record instead of being re-scored
+# backend: any embedding_backends backend; default is SentenceTransformer(model_name)
+# field_comparators: field -> comparator name (field_comparators.py); only "embedding" fields use the backend
+# file_pairs: (gt_path, pred_path) already paired by the caller; by default every GT JSON is paired
+# with the prediction of the same name
+def field_matching_records(ground_truth_dir: Path, prediction_dir: Path, model_name: str = "all-MiniLM-L6-v2",
+                           batch_size: int = EMBEDDING_BATCH_SIZE, embedding_cache_dir: Path = None,
+                           manifest: RunManifest = None, backend=None, field_comparators: dict = None,
+                           file_pairs=None):
+
+    backend = backend or SentenceTransformerBackend(model_name, batch_size)
+    model_name = backend.name
+    version = evaluator_version(field_comparators)
+
+    # phase 1: field presence per file and the value pairs to compare
+    files = []
+    pairs = []
+    if file_pairs is None:
+        file_pairs = [
+            (gt_path, prediction_dir / gt_path.name) for gt_path in ground_truth_dir.iterdir()
+            if gt_path.suffix == ".json" and (prediction_dir / gt_path.name).exists()
+        ]
+
+    for gt_path, pred_path in file_pairs:
+        input_hash = file_hash(gt_path, pred_path)
+        if manifest is not None:
+            stored = manifest.reusable("field_match", gt_path.name, input_hash, model_name, version)
+            if stored is not None:
+                files.append({"record": stored})
+                continue
 
-                emb_gt = model.encode(gt_val)
-                emb_pred = model.encode(pred_val)
-                sim = cosine_similarity([emb_gt], [emb_pred])[0][0]
+        instrumentation.record_read(gt_path)
+        instrumentation.record_read(pred_path)
+        gt = json.loads(gt_path.read_text(encoding="utf-8"))
+        pred = json.loads(pred_path.read_text(encoding="utf-8"))
 
-                field_similarity_scores[field].append(sim)
+        gt_fields = set(gt.keys())
+        pred_fields = set(pred.keys())
+        field_set = set(ALL_FIELDS)
 
-                threshold = EXACT_THRESHOLD if field in EXACT_FIELDS else SEMANTIC_THRESHOLD
-                status = "PASS" if sim >= threshold else "ERROR"
+        # extracted fields evaluation not field values
+        compared = []
+        for field in ALL_FIELDS:
+            if field not in gt_fields or field not in pred_fields:
+                continue
+            gt_val = str(gt[field]).strip()
+            pred_val = str(pred[field]).strip()
 
-                if status == "PASS":
-                    matched_fields += 1
-                    if field in EXACT_FIELDS:
-                        exact_matched += 1
-                    else:
-                        semantic_matched += 1
+            if not gt_val or not pred_val:
+                continue
 
-                evaluated_fields += 1
+            compared.append((field, len(pairs)))
+            pairs.append((field, gt_val, pred_val))
+
+        files.append({
+            "file": gt_path.name,
+            "tp": len(field_set & gt_fields & pred_fields),
+            "fn": len((field_set & gt_fields) - pred_fields),
+            "fp": len((pred_fields - gt_fields) & field_set),
+            "tn": len(field_set - (gt_fields | pred_fields)),
+            "compared": compared,
+            "input_hash": input_hash,
+        })
+
+    # phase 2: string comparators per field, one batched encode for all embedding fields of the directory
+    store = EmbeddingStore(embedding_cache_dir, model_name) if embedding_cache_dir is not None else None
+    similarities = score_field_pairs(
+        pairs, lambda embedded: pair_similarities(backend, embedded, store), field_comparators
+    )
+    if store is not None:
+        store.save()
+
+    # phase 3: per file scores, then averages over the new and the reused records
+    records = []
+    for entry in files:
+        if "record" in entry:
+            records.append(entry["record"])
+            continue
+
+        field_results = []
+        matched_fields = 0
+        evaluated_fields = 0
+
+        exact_matched = 0
+        exact_evaluated = 0
+        semantic_matched = 0
+        semantic_evaluated = 0
+
+        for field, pair_index in entry["compared"]:
+            sim = float(similarities[pair_index])
+
+            threshold = EXACT_THRESHOLD if field in EXACT_FIELDS else SEMANTIC_THRESHOLD
+            status = "PASS" if sim >= threshold else "ERROR"
+
+            if status == "PASS":
+                matched_fields += 1
                 if field in EXACT_FIELDS:
-                    exact_evaluated += 1
+                    exact_matched += 1
                 else:
-                    semantic_evaluated += 1
-
-                report.write(
-                    f"{field} | similarity={sim:.3f} | threshold={threshold} | {status}\n"
-                )
-
-            overall_match = (matched_fields / evaluated_fields) if evaluated_fields else 0
-            exact_match = (exact_matched / exact_evaluated) if exact_evaluated else 0
-            semantic_match = (semantic_matched / semantic_evaluated) if semantic_evaluated else 0
-
-            file_overall_scores.append(overall_match)
-            exact_match_scores.append(exact_match)
-            semantic_match_scores.append(semantic_match)
-
-            report.write(f"\nFile Overall Matching: {overall_match:.2%}\n")
-            report.write(f"Exact Fields Matching: {exact_match:.2%}\n")
-            report.write(f"Semantic Fields Matching: {semantic_match:.2%}\n")
-
-        # overall averages for all files
-        report.write("\n" + "=" * 60 + "\n")
-        report.write("_*_* MODEL AVERAGES\n\n") #change model name
+                    semantic_matched += 1
 
-        report.write(f"Avg TP: {np.mean(tp_list):.2f}\n")
-        report.write(f"Avg FP: {np.mean(fp_list):.2f}\n")
-        report.write(f"Avg FN: {np.mean(fn_list):.2f}\n")
-        report.write(f"Avg TN: {np.mean(tn_list):.2f}\n")
-
-        report.write(f"\nAvg Overall Matching: {np.mean(file_overall_scores):.2%}\n")
-        report.write(f"Avg Exact Fields Matching: {np.mean(exact_match_scores):.2%}\n")
-        report.write(f"Avg Semantic Fields Matching: {np.mean(semantic_match_scores):.2%}\n")
-
-        report.write("\n" + "=" * 60 + "\n")
-        report.write("FIELD-WISE AVERAGE SIMILARITY\n")
-        report.write("-" * 50 + "\n")
-
-        for field in ALL_FIELDS:
-            if field_similarity_scores[field]:
-                report.write(
-                    f"{field}: {np.mean(field_similarity_scores[field]):.4f}\n"
-                )
+            evaluated_fields += 1
+            if field in EXACT_FIELDS:
+                exact_evaluated += 1
             else:
-                report.write(f"{field}: N/A\n")
+                semantic_evaluated += 1
+
+            field_results.append({
+                "field": field, "similarity": sim, "threshold": threshold, "status": status,
+                "comparator": comparator_name(field, field_comparators),
+            })
+
+        overall_match = (matched_fields / evaluated_fields) if evaluated_fields else 0
+        exact_match = (exact_matched / exact_evaluated) if exact_evaluated else 0
+        semantic_match = (semantic_matched / semantic_evaluated) if semantic_evaluated else 0
+
+        record = {
+            "kind": "field_match",
+            "file": entry["file"],
+            "tp": entry["tp"], "fp": entry["fp"], "fn": entry["fn"], "tn": entry["tn"],
+            "fields": field_results,
+            "overall_match": overall_match,
+            "exact_match": exact_match,
+            "semantic_match": semantic_match,
+        }
+        records.append(record)
+        if manifest is not None:
+            manifest.record("field_match", entry["file"], entry["input_hash"], model_name, version, output=record)
+
+    field_similarity_scores = defaultdict(list)
+    for record in records:
+        for result in record["fields"]:
+            field_similarity_scores[result["field"]].append(result["similarity"])
+
+    # overall averages for all files
+    average = {
+        "kind": "field_match_average",
+        "model": model_name,
+        "avg_tp": float(np.mean([record["tp"] for record in records])),
+        "avg_fp": float(np.mean([record["fp"] for record in records])),
+        "avg_fn": float(np.mean([record["fn"] for record in records])),
+        "avg_tn": float(np.mean([record["tn"] for record in records])),
+        "avg_overall_match": float(np.mean([record["overall_match"] for record in records])),
+        "avg_exact_match": float(np.mean([record["exact_match"] for record in records])),
+        "avg_semantic_match": float(np.mean([record["semantic_match"] for record in records])),
+        "field_similarity": {
+            field: float(np.mean(field_similarity_scores[field])) if field_similarity_scores[field] else None
+            for field in ALL_FIELDS
+        },
+    }
+
+    return records, average
+
+
+def format_field_match(record):
+
+    text = f"\nFILE: {record['file']}\n" + "-" * 50 + "\n"
+    for result in record["fields"]:
+        text += f"{result['field']} | similarity={result['similarity']:.3f} | threshold={result['threshold']} | {result['status']}\n"
+    text += f"\nFile Overall Matching: {record['overall_match']:.2%}\n"
+    text += f"Exact Fields Matching: {record['exact_match']:.2%}\n"
+    text += f"Semantic Fields Matching: {record['semantic_match']:.2%}\n"
+    return text
+
+
+def format_field_match_average(record):
+
+    text = "\n" + "=" * 60 + "\n"
+    text += "_*_* MODEL AVERAGES\n\n" #change model name
+
+    text += f"Avg TP: {record['avg_tp']:.2f}\n"
+    text += f"Avg FP: {record['avg_fp']:.2f}\n"
+    text += f"Avg FN: {record['avg_fn']:.2f}\n"
+    text += f"Avg TN: {record['avg_tn']:.2f}\n"
+
+    text += f"\nAvg Overall Matching: {record['avg_overall_match']:.2%}\n"
+    text += f"Avg Exact Fields Matching: {record['avg_exact_match']:.2%}\n"
+    text += f"Avg Semantic Fields Matching: {record['avg_semantic_match']:.2%}\n"
+
+    text += "\n" + "=" * 60 + "\n"
+    text += "FIELD-WISE AVERAGE SIMILARITY\n"
+    text += "-" * 50 + "\n"
+
+    for field, similarity in record["field_similarity"].items():
+        if similarity is not None:
+            text += f"{field}: {similarity:.4f}\n"
+        else:
+            text += f"{field}: N/A\n"
+    return text
+
+
+register_text_format("field_match", format_field_match)
+register_text_format("field_match_average", format_field_match_average)
+
+
+def evaluate_field_matching(ground_truth_dir: Path, prediction_dir: Path, output_file: Path, model_name: str = "all-MiniLM-L6-v2",
+                            report_formats=("text",), batch_size: int = EMBEDDING_BATCH_SIZE,
+                            embedding_cache_dir: Path = None, manifest: RunManifest = None, backend=None,
+                            field_comparators: dict = None, file_pairs=None):
+
+    records, average = field_matching_records(ground_truth_dir, prediction_dir, model_name, batch_size,
+                                              embedding_cache_dir, manifest, backend, field_comparators,
+                                              file_pairs)
+
+    with ReportSink(output_file, report_formats) as report:
+        for record in records:
+            report.add(record)
+        report.add(average)
+
+    return records, average
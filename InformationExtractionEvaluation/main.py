@@ -1,8 +1,15 @@
 from pathlib import Path
 import os
+import sys
 
-from IE import run_field_extraction
+sys.path.append(str(Path(__file__).resolve().parent.parent))  # shared modules at the repo root
+
+from IE import run_field_extraction, run_field_extraction_async, replay_field_extraction
 from IE_evaluation import evaluate_field_matching
+from run_manifest import RunManifest
+from response_cache import DiskResponseCache
+from embedding_backends import make_embedding_backend
+from field_comparators import DEFAULT_FIELD_COMPARATORS
 
 #Ground Truth (GT) is in JSON Format
 #should be changed
@@ -11,28 +18,84 @@ INPUT_FOLDER = Path("/scratch/project_2010972/sabina/LuvataUsecase2/data/transcr
 GROUND_TRUTH_DIR = Path("/scratch/project_2010972/sabina/LuvataUsecase2/data/GT") 
 PREDICTION_DIR = Path("/scratch/project_2010972/sabina/LuvataUsecase2/data/gpt4_mini") 
 OUTPUT_FILE = Path("ErrorReport.txt") 
+REPORT_FORMATS = ("text",)  # also "jsonl", "csv", "parquet"
+# the stores below are opt-in; a store is only as fresh as its version keys, so clear it after changing the code
+EMBEDDING_CACHE_DIR = None  # e.g. Path("embedding_cache"), reuses embeddings across runs
+# "sentence-transformers", "local-cpu" (int8 on CPU, e.g. {"threads": 8}) or "openai" (e.g. {"model": "text-embedding-3-small"})
+EMBEDDING_BACKEND = "sentence-transformers"
+EMBEDDING_BACKEND_OPTIONS = {"model_name": "all-MiniLM-L6-v2"}
+# field -> "exact", "normalized", "fuzzy", "datetime" or "embedding"; the model is only loaded for embedding fields
+FIELD_COMPARATORS = dict(DEFAULT_FIELD_COMPARATORS)
+MANIFEST_PATH = None  # e.g. Path("run_manifest.sqlite"), only redoes new, changed or failed files
+RESPONSE_CACHE_DIR = None  # e.g. Path("response_cache"), keeps the raw LLM replies
+RESPONSE_CACHE_MAX_BYTES = 512 * 2**20
+REPLAY_ONLY = False  # rebuild the JSON files from cached replies without calling the API (needs RESPONSE_CACHE_DIR)
 
 MODEL_NAME = "gpt-5"
 API_KEY = os.getenv("OPENAI_API_KEY")
+BASE_URL = os.getenv("OPENAI_BASE_URL")  # e.g. a local stub server for testing
 
-if API_KEY is None:
-    raise ValueError("Please set your OPENAI_API_KEY environment variable")
+# concurrent extraction; set EXTRACTION_CONCURRENCY = 1 for the sequential path
+EXTRACTION_CONCURRENCY = 8
+REQUESTS_PER_MINUTE = 500  # None = no limit
+TOKENS_PER_MINUTE = 200_000
+REQUEST_TIMEOUT = 120.0  # seconds per request
+MAX_RETRIES = 5
 
 if __name__ == "__main__":
+
+    if API_KEY is None and not REPLAY_ONLY:
+        raise ValueError("Please set your OPENAI_API_KEY environment variable")
+    if REPLAY_ONLY and RESPONSE_CACHE_DIR is None:
+        raise ValueError("REPLAY_ONLY needs RESPONSE_CACHE_DIR")
+
+    # only new, changed or failed transcripts are extracted and re-scored
+    manifest = RunManifest(MANIFEST_PATH) if MANIFEST_PATH is not None else None
+    cache = DiskResponseCache(RESPONSE_CACHE_DIR, RESPONSE_CACHE_MAX_BYTES) if RESPONSE_CACHE_DIR is not None else None
     
     print("Information Extraction (IE)..")
-    run_field_extraction(
-        input_dir=INPUT_FOLDER,
-        output_dir=PREDICTION_DIR,
-        model_name=MODEL_NAME,
-        api_key=API_KEY
-    )
+    if REPLAY_ONLY:
+        replay_field_extraction(
+            input_dir=INPUT_FOLDER,
+            output_dir=PREDICTION_DIR,
+            model_name=MODEL_NAME,
+            cache=cache
+        )
+    elif EXTRACTION_CONCURRENCY > 1:
+        run_field_extraction_async(
+            input_dir=INPUT_FOLDER,
+            output_dir=PREDICTION_DIR,
+            model_name=MODEL_NAME,
+            api_key=API_KEY,
+            concurrency=EXTRACTION_CONCURRENCY,
+            requests_per_minute=REQUESTS_PER_MINUTE,
+            tokens_per_minute=TOKENS_PER_MINUTE,
+            timeout=REQUEST_TIMEOUT,
+            max_retries=MAX_RETRIES,
+            base_url=BASE_URL,
+            manifest=manifest,
+            cache=cache
+        )
+    else:
+        run_field_extraction(
+            input_dir=INPUT_FOLDER,
+            output_dir=PREDICTION_DIR,
+            model_name=MODEL_NAME,
+            api_key=API_KEY,
+            manifest=manifest,
+            cache=cache
+        )
     print("IE completed.\n")
 
     print("IE evaluation...")
     evaluate_field_matching(
         ground_truth_dir=GROUND_TRUTH_DIR,
         prediction_dir=PREDICTION_DIR,
-        output_file=OUTPUT_FILE
+        output_file=OUTPUT_FILE,
+        report_formats=REPORT_FORMATS,
+        embedding_cache_dir=EMBEDDING_CACHE_DIR,
+        manifest=manifest,
+        backend=make_embedding_backend(EMBEDDING_BACKEND, **EMBEDDING_BACKEND_OPTIONS),
+        field_comparators=FIELD_COMPARATORS
     )
     print("IE Evaluation finished")
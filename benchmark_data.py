@@ -0,0 +1,160 @@
+from pathlib import Path
+import json
+import random
+from functools import lru_cache
+
+# Synthetic, seeded test data for the benchmarks: GT/hypothesis transcript pairs with a given length and error
+# rate, technical term lists, and IE ground truth / prediction JSON pairs. The same arguments always give the
+# same data, so metric values can be compared between runs as well as timings.
+
+_SYLLABLES = {
+    "fi": ["ka", "ta", "lo", "mi", "su", "vä", "kö", "ty", "ri", "ne", "hä", "jo", "pe", "sa", "lu", "tä", "ko", "vi"],
+    "en": ["ter", "con", "al", "pro", "ing", "ed", "tion", "er", "re", "in", "st", "or", "an", "mo", "ble", "ly"],
+}
+
+_DAYS_FI = ["ma", "ti", "ke", "to", "pe"]
+
+
+@lru_cache(maxsize=None)
+def vocabulary(language: str = "fi", size: int = 5000, seed: int = 0):
+    rng = random.Random(f"vocabulary/{language}/{seed}")
+    syllables = _SYLLABLES[language]
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))))
+    return tuple(sorted(words))
+
+
+# Zipf-like word frequencies, like real speech: a few very common words and a long tail
+def _sample_words(rng, words, n: int):
+    weights = [1.0 / (rank + 1) for rank in range(len(words))]
+    return rng.choices(words, weights=weights, k=n)
+
+
+def _misspell(rng, word: str):
+    if len(word) < 2:
+        return word + word
+    i = rng.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:] if rng.random() < 0.5 else word[:i] + word[i + 1:]
+
+
+# the hypothesis has about error_rate * n_words edits: half substitutions (a third of them misspellings),
+# a quarter deletions and a quarter insertions
+def transcript_pair(n_words: int, error_rate: float = 0.1, language: str = "fi", seed: int = 0):
+    rng = random.Random(f"transcript/{language}/{n_words}/{error_rate}/{seed}")
+    words = vocabulary(language)
+    gt = _sample_words(rng, words, n_words)
+
+    hypothesis = []
+    for word in gt:
+        if rng.random() >= error_rate:
+            hypothesis.append(word)
+            continue
+        edit = rng.random()
+        if edit < 0.5:
+            hypothesis.append(_misspell(rng, word) if rng.random() < 1 / 3 else rng.choice(words))
+        elif edit < 0.75:
+            continue
+        else:
+            hypothesis.extend([word, rng.choice(words)])
+
+    return _as_text(rng, gt), _as_text(rng, hypothesis)
+
+
+# lines of about 15 words with some capitals and punctuation, so the tokenizer has work to do
+def _as_text(rng, words):
+    lines = []
+    for start in range(0, len(words), 15):
+        line = words[start:start + 15]
+        if line:
+            line = [line[0].capitalize()] + line[1:]
+            lines.append(" ".join(line) + rng.choice([".", ",", "?", "!"]))
+    return "\n".join(lines) + "\n"
+
+
+# n_terms GT terms of 1-3 words; about found_rate of them are taken from the transcript, the rest are random
+def term_list(gt_text: str, n_terms: int, found_rate: float = 0.8, language: str = "fi", seed: int = 0):
+    rng = random.Random(f"terms/{n_terms}/{found_rate}/{seed}")
+    words = gt_text.lower().replace(".", " ").replace(",", " ").replace("?", " ").replace("!", " ").split()
+    vocab = vocabulary(language)
+    terms = []
+    for _ in range(n_terms):
+        length = rng.choice([1, 1, 2, 2, 3])
+        if words and rng.random() < found_rate:
+            start = rng.randrange(max(1, len(words) - length))
+            terms.append(" ".join(words[start:start + length]))
+        else:
+            terms.append(" ".join(rng.choice(vocab) for _ in range(length)))
+    return "\n".join(terms) + "\n"
+
+
+_NAMES = ["Matti Virtanen", "Anna Korhonen", "Juha Mäkinen", "Laura Nieminen", "Mikko Hämäläinen"]
+_ORGANISATIONS = ["Rakennus Oy", "Kunnossapito Ab", "Sähkötyö Oy", "Luvata Pori"]
+_SENTENCES = [
+    "trukki peruutti käytävällä ilman varoitusääntä",
+    "lattialla oli öljyä koneen vieressä",
+    "työntekijä liukastui portaissa",
+    "suojalasit puuttuivat hiontatyössä",
+    "kulkureitti oli tukittu kuormalavoilla",
+    "nostoliina oli kulunut ja se vaihdettiin",
+    "alueelle asennettiin lisävalaistus",
+    "asiasta keskusteltiin työvuoron alussa",
+]
+
+
+def _ie_value(rng, field: str):
+    if field == "Raportin tyyppi":
+        return rng.choice(["Vaaratilanne", "Turvallisuushavainto", "Tapaturma"])
+    if field == "Tarkkailijan nimi":
+        return rng.choice(_NAMES)
+    if field == "Tarkkailijaorganisaatio":
+        return rng.choice(_ORGANISATIONS)
+    if field in ("Tarkkailija on kesätyöntekijä", "Kuva", "Tapahtuma oli vakava"):
+        return rng.choice(["Kyllä", "Ei"])
+    if field == "Tapahtuma-aika":
+        return (f"{rng.choice(_DAYS_FI)} {rng.randint(1, 28)}.{rng.randint(1, 12)}.2024 "
+                f"klo {rng.randint(6, 22)}.{rng.randint(0, 59):02d}")
+    if field == "Sijaintitiedot":
+        return f"Halli {rng.randint(1, 9)}, linja {rng.randint(1, 20)}"
+    return ". ".join(rng.sample(_SENTENCES, rng.randint(1, 3))).capitalize() + "."
+
+
+# GT and predicted field dicts; each predicted value is kept, reworded, replaced or dropped
+def ie_pair(fields, noise: float = 0.3, seed: int = 0):
+    rng = random.Random(f"ie/{noise}/{seed}")
+    gt = {field: _ie_value(rng, field) for field in fields}
+    pred = {}
+    for field, value in gt.items():
+        draw = rng.random()
+        if draw >= noise:
+            pred[field] = value
+        elif draw < noise * 0.4:
+            pred[field] = value.lower().rstrip(".")
+        elif draw < noise * 0.8:
+            pred[field] = _ie_value(rng, field)
+    return gt, pred
+
+
+# the source text an extraction model would read for an IE pair
+def ie_transcript(gt: dict):
+    return "\n".join(f"{field}: {value}" for field, value in gt.items()) + "\n"
+
+
+# GT/hypothesis transcripts, term lists and IE JSON pairs under directory/{gt,tr,terms,ie_gt,ie_pred}
+def write_corpus(directory: Path, n_files: int, n_words: int, error_rate: float = 0.1, language: str = "fi",
+                 n_terms: int = 50, ie_fields=None, seed: int = 0):
+    directory = Path(directory)
+    for name in ("gt", "tr", "terms", "ie_gt", "ie_pred"):
+        (directory / name).mkdir(parents=True, exist_ok=True)
+    for i in range(n_files):
+        gt_text, tr_text = transcript_pair(n_words, error_rate, language, seed=seed * 100_003 + i)
+        (directory / "gt" / f"file{i:05d}.txt").write_text(gt_text, encoding="utf-8")
+        (directory / "tr" / f"file{i:05d}.txt").write_text(tr_text, encoding="utf-8")
+        (directory / "terms" / f"file{i:05d}.txt").write_text(
+            term_list(gt_text, n_terms, language=language, seed=seed * 100_003 + i), encoding="utf-8"
+        )
+        if ie_fields:
+            gt, pred = ie_pair(ie_fields, seed=seed * 100_003 + i)
+            (directory / "ie_gt" / f"file{i:05d}.json").write_text(json.dumps(gt, ensure_ascii=False), encoding="utf-8")
+            (directory / "ie_pred" / f"file{i:05d}.json").write_text(json.dumps(pred, ensure_ascii=False), encoding="utf-8")
+    return directory
@@ -0,0 +1,127 @@
+from pathlib import Path
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+sys.path.append(str(Path(__file__).resolve().parent / "InformationExtractionEvaluation"))
+
+from embedding_backends import make_embedding_backend
+from IE_evaluation import ALL_FIELDS, EXACT_FIELDS, EXACT_THRESHOLD, SEMANTIC_THRESHOLD
+
+# Compares embedding backends on the field values of a GT/prediction folder pair:
+# model load time, encoding throughput, and how often each backend gives the same PASS/ERROR
+# per field as the first (reference) backend.
+#
+#   python benchmark_embeddings.py GT_DIR PRED_DIR --backends sentence-transformers local-cpu:threads=4 openai
+#
+# Backend specs are name[:option=value,...]; integer and float values are converted.
+
+
+def parse_backend_spec(spec: str):
+    name, _, option_text = spec.partition(":")
+    options = {}
+    for item in filter(None, option_text.split(",")):
+        key, _, value = item.partition("=")
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        options[key] = value
+    return name, options
+
+
+def collect_field_pairs(ground_truth_dir: Path, prediction_dir: Path):
+    pairs = []
+    for gt_path in sorted(ground_truth_dir.glob("*.json")):
+        pred_path = prediction_dir / gt_path.name
+        if not pred_path.exists():
+            continue
+        gt = json.loads(gt_path.read_text(encoding="utf-8"))
+        pred = json.loads(pred_path.read_text(encoding="utf-8"))
+        for field in ALL_FIELDS:
+            gt_val = str(gt.get(field, "")).strip()
+            pred_val = str(pred.get(field, "")).strip()
+            if gt_val and pred_val:
+                pairs.append((field, gt_val, pred_val))
+    return pairs
+
+
+def run_backend(spec: str, pairs, repeat: int):
+
+    name, options = parse_backend_spec(spec)
+    backend = make_embedding_backend(name, **options)
+    texts = list(dict.fromkeys(text for _, gt_val, pred_val in pairs for text in (gt_val, pred_val)))
+
+    start = time.perf_counter()
+    backend.encode(texts[:1])  # loads the model / opens the connection
+    load_seconds = time.perf_counter() - start
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embeddings = backend.encode(texts)
+        timings.append(time.perf_counter() - start)
+
+    index = {text: row for row, text in enumerate(texts)}
+    gt_rows = embeddings[[index[gt_val] for _, gt_val, _ in pairs]]
+    pred_rows = embeddings[[index[pred_val] for _, _, pred_val in pairs]]
+    similarities = np.einsum("ij,ij->i", gt_rows, pred_rows)
+    thresholds = np.array([EXACT_THRESHOLD if field in EXACT_FIELDS else SEMANTIC_THRESHOLD for field, _, _ in pairs])
+
+    return {
+        "backend": spec,
+        "name": backend.name,
+        "texts": len(texts),
+        "load_seconds": load_seconds,
+        "encode_seconds": min(timings),
+        "texts_per_second": len(texts) / min(timings) if min(timings) > 0 else float("inf"),
+        "similarities": similarities,
+        "passed": similarities >= thresholds,
+    }
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ground_truth_dir", type=Path)
+    parser.add_argument("prediction_dir", type=Path)
+    parser.add_argument("--backends", nargs="+", default=["sentence-transformers", "local-cpu"],
+                        help="first one is the reference for agreement")
+    parser.add_argument("--repeat", type=int, default=3, help="timed encodes per backend (best is reported)")
+    parser.add_argument("--output", type=Path, default=None, help="also write the results as JSON")
+    args = parser.parse_args()
+
+    pairs = collect_field_pairs(args.ground_truth_dir, args.prediction_dir)
+    print(f"{len(pairs)} field pairs")
+
+    results = [run_backend(spec, pairs, args.repeat) for spec in args.backends]
+    reference = results[0]
+
+    print(f"\n{'backend':<40} {'load s':>8} {'encode s':>9} {'texts/s':>9} {'agree':>7} {'mean |dsim|':>12}")
+    for result in results:
+        result["agreement"] = float(np.mean(result["passed"] == reference["passed"])) if pairs else 1.0
+        result["mean_abs_similarity_diff"] = (
+            float(np.mean(np.abs(result["similarities"] - reference["similarities"]))) if pairs else 0.0
+        )
+        print(f"{result['backend']:<40} {result['load_seconds']:>8.2f} {result['encode_seconds']:>9.3f} "
+              f"{result['texts_per_second']:>9.0f} {result['agreement']:>7.2%} {result['mean_abs_similarity_diff']:>12.4f}")
+
+    # per field agreement, where the backends disagree most
+    for result in results[1:]:
+        print(f"\nPASS/ERROR agreement per field, {result['backend']} vs {reference['backend']}")
+        for field in ALL_FIELDS:
+            rows = [i for i, (pair_field, _, _) in enumerate(pairs) if pair_field == field]
+            if rows:
+                agree = np.mean(result["passed"][rows] == reference["passed"][rows])
+                print(f"{field}: {agree:.2%} ({len(rows)} pairs)")
+
+    if args.output is not None:
+        summary = [
+            {key: value for key, value in result.items() if key not in ("similarities", "passed")}
+            for result in results
+        ]
+        args.output.write_text(json.dumps(summary, indent=2), encoding="utf-8")
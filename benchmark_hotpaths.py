@@ -0,0 +1,308 @@
+from pathlib import Path
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from types import SimpleNamespace
+from datetime import datetime, timezone
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent
+sys.path.append(str(ROOT / "InformationExtractionEvaluation"))
+sys.path.append(str(ROOT / "IE_Eval_JudgeLLM"))
+
+import benchmark_data
+from embedding_backends import register_embedding_backend, make_embedding_backend, _normalize_rows
+from field_comparators import DEFAULT_FIELD_COMPARATORS
+
+# Benchmarks for the hot paths, on seeded synthetic data (benchmark_data.py), in the style of asv:
+# each benchmark has a parameter grid, a setup that builds its inputs, and a timed call whose result
+# (a metric value) is stored with the timing. Embedding and LLM calls go to local stubs, so nothing
+# needs a network or a model download.
+#
+#   python benchmark_hotpaths.py                      # all benchmarks, appended to benchmark_results.jsonl
+#   python benchmark_hotpaths.py --filter align --quick
+#   python benchmark_hotpaths.py --check-values      # exit code 1 if a metric value differs from the last run
+#
+# Each result line carries the commit, Python version and machine, so the file is a history; every run is
+# compared with the latest earlier result of the same benchmark and parameters.
+
+BENCHMARKS = []
+
+
+def benchmark(name: str, params):
+    def register(setup):
+        BENCHMARKS.append((name, params, setup))
+        return setup
+    return register
+
+
+# Stub backends
+
+# bag of hashed character trigrams; deterministic and fast, similar texts get similar vectors
+class HashEmbeddingBackend:
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            text = f"  {text.lower()} "
+            for i in range(len(text) - 2):
+                vectors[row, zlib.crc32(text[i:i + 3].encode("utf-8")) % self.dim] += 1.0
+        return _normalize_rows(vectors)
+
+
+register_embedding_backend("hash", HashEmbeddingBackend)
+
+
+# Responses API stand-in: "extracts" the "field: value" lines of benchmark_data.ie_transcript from the prompt
+class StubResponsesClient:
+
+    def __init__(self):
+        self.responses = self
+        self.calls = 0
+
+    def create(self, model: str, input: str, max_output_tokens: int, **options):
+        self.calls += 1
+        fields = {}
+        for line in input.splitlines():
+            field, separator, value = line.strip().partition(": ")
+            if separator and field in DEFAULT_FIELD_COMPARATORS:
+                fields[field] = value
+        return SimpleNamespace(output_text="Tulos: " + json.dumps(fields, ensure_ascii=False), usage=None)
+
+
+# Benchmarks; setup(workdir, **params) returns the call to time, whose return value is the metric value
+
+@benchmark("tokenize", [{"words": n} for n in (1_000, 10_000, 100_000)])
+def setup_tokenize(workdir, words):
+    from ErrorRateCalculation_sequenceMatching import clean_text_transcription
+    text, _ = benchmark_data.transcript_pair(words)
+    return lambda: len(clean_text_transcription(text))
+
+
+@benchmark("align", [{"words": n, "matcher": matcher} for matcher in ("levenshtein", "difflib")
+                     for n in (500, 2_000, 8_000)])
+def setup_align(workdir, words, matcher):
+    from ErrorRateCalculation_sequenceMatching import calSMatcherErros, clean_text_transcription
+    gt_text, tr_text = benchmark_data.transcript_pair(words, error_rate=0.1)
+    words1, words2 = clean_text_transcription(gt_text), clean_text_transcription(tr_text)
+    return lambda: [round(rate, 6) for rate in calSMatcherErros(words1, words2, matcher)]
+
+
+@benchmark("wer_file", [{"words": n, "streaming": streaming} for streaming in (False, True)
+                        for n in (10_000, 50_000)])
+def setup_wer_file(workdir, words, streaming):
+    from ErrorRateCalculation_sequenceMatching import evaluateDiffErros
+    gt_text, tr_text = benchmark_data.transcript_pair(words, error_rate=0.1)
+    gt_file, tr_file = workdir / f"wer_gt_{words}.txt", workdir / f"wer_tr_{words}.txt"
+    gt_file.write_text(gt_text, encoding="utf-8")
+    tr_file.write_text(tr_text, encoding="utf-8")
+
+    def run():
+        record = evaluateDiffErros(gt_file, tr_file, streaming=streaming, spelling=False)
+        return [round(record[key], 6) for key in ("wer", "deleted_rate", "added_rate")]
+    return run
+
+
+@benchmark("techterms", [{"terms": n, "words": 10_000} for n in (10, 100, 1_000)])
+def setup_techterms(workdir, terms, words):
+    from ErrorRateCalculation_sequenceMatching import evaluateTechTermsError, clean_text_transcription
+    from ErrorRateCalculation_levenshtein import Vocabulary
+    from ErrorRateCalculation_terms import TermDictionary
+    gt_text, tr_text = benchmark_data.transcript_pair(words, error_rate=0.1)
+    terms_file, tr_file = workdir / f"terms_{terms}.txt", workdir / f"terms_tr_{terms}.txt"
+    terms_file.write_text(benchmark_data.term_list(gt_text, terms), encoding="utf-8")
+    tr_file.write_text(tr_text, encoding="utf-8")
+    # shared dictionary as in main.py: the term file is parsed once, the transcript is scanned every call
+    # the record is not appended to a report, so a growing report file does not end up in the timing
+    term_dictionary = TermDictionary(clean_text_transcription, Vocabulary())
+
+    def run():
+        record = evaluateTechTermsError(terms_file, tr_file, term_dictionary=term_dictionary)
+        return [record["total_terms"], record["not_found_count"]]
+    return run
+
+
+# cold: an empty verdict cache every call, so every distinct word goes to the dictionary
+@benchmark("spelling", [{"words": n, "language": language, "cache": cache} for language in ("fi", "en")
+                        for cache in ("cold", "warm") for n in (1_000, 10_000)])
+def setup_spelling(workdir, words, language, cache):
+    from ErrorRateCalculation_sequenceMatching import calSpellErros, calSpellErros_En, clean_text_transcription
+    from ErrorRateCalculation_spelling import configure_spell_cache
+    _, tr_text = benchmark_data.transcript_pair(words, error_rate=0.1, language=language)
+    tokens = clean_text_transcription(tr_text, language)
+    check = calSpellErros if language == "fi" else calSpellErros_En
+
+    def run():
+        if cache == "cold":
+            configure_spell_cache()
+        rate, errors = check(tokens)
+        return [round(rate, 6), len(errors)]
+    configure_spell_cache()
+    return run
+
+
+def _ie_folders(workdir, files):
+    from IE_evaluation import ALL_FIELDS
+    directory = workdir / f"ie_{files}"
+    if not directory.exists():
+        benchmark_data.write_corpus(directory, files, n_words=0, n_terms=0, ie_fields=ALL_FIELDS)
+    return directory / "ie_gt", directory / "ie_pred"
+
+
+@benchmark("field_match", [{"files": n} for n in (10, 100, 1_000)])
+def setup_field_match(workdir, files):
+    from IE_evaluation import field_matching_records
+    gt_dir, pred_dir = _ie_folders(workdir, files)
+    backend = make_embedding_backend("hash")
+
+    def run():
+        _, average = field_matching_records(gt_dir, pred_dir, backend=backend)
+        return [round(average["avg_overall_match"], 6), round(average["avg_semantic_match"], 6)]
+    return run
+
+
+@benchmark("custom_eval", [{"files": n} for n in (10, 100, 1_000)])
+def setup_custom_eval(workdir, files):
+    import Custom_evaluation
+    gt_dir, pred_dir = _ie_folders(workdir, files)
+    file_pairs = [(gt_file, pred_dir / gt_file.name) for gt_file in sorted(gt_dir.glob("*.json"))]
+
+    def run():
+        Custom_evaluation.configure_embedding_backend("hash")
+        Custom_evaluation.embedding_store = None
+        records = Custom_evaluation.C_evaluate_records(file_pairs)
+        return round(sum(record["overall_match"] for record in records) / len(records), 6)
+    return run
+
+
+# prompt building, the stubbed API call and reply parsing; with a warm cache no call is made
+@benchmark("extract", [{"cache": cache} for cache in ("none", "warm")])
+def setup_extract(workdir, cache):
+    from IE import extract_fields_from_text, FIELDS
+    from response_cache import MemoryResponseCache
+    gt, _ = benchmark_data.ie_pair(FIELDS)
+    txt_path = workdir / "extract.txt"
+    txt_path.write_text(benchmark_data.ie_transcript(gt), encoding="utf-8")
+    client = StubResponsesClient()
+    replies = MemoryResponseCache() if cache == "warm" else None
+    extract_fields_from_text(txt_path, client, "stub-model", replies)
+    return lambda: sorted(extract_fields_from_text(txt_path, client, "stub-model", replies).items())
+
+
+# Runner
+
+def measure(run, repeat: int, min_time: float = 0.05):
+    value = run()  # warm-up, and the metric value that is recorded
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number)
+    return value, samples, number
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def result_key(result):
+    return result["benchmark"], json.dumps(result["params"], sort_keys=True)
+
+
+def previous_results(path: Path):
+    latest = {}
+    if path is not None and path.exists():
+        for line in path.read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                result = json.loads(line)
+                latest[result_key(result)] = result
+    return latest
+
+
+def value_digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", nargs="+", default=None, help="run benchmarks whose name contains one of these")
+    parser.add_argument("--quick", action="store_true", help="smallest parameter set of each benchmark only")
+    parser.add_argument("--repeat", type=int, default=5, help="timed samples per benchmark (min and median kept)")
+    parser.add_argument("--output", type=Path, default=Path("benchmark_results.jsonl"), help="results history")
+    parser.add_argument("--no-save", action="store_true", help="compare with the history but do not append")
+    parser.add_argument("--check-values", action="store_true", help="exit code 1 if a metric value changed")
+    args = parser.parse_args()
+
+    previous = previous_results(args.output)
+    run_info = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+    }
+
+    results = []
+    changed = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for name, params, setup in BENCHMARKS:
+            if args.filter and not any(part in name for part in args.filter):
+                continue
+            for param in params[:1] if args.quick else params:
+                label = f"{name}(" + ", ".join(f"{key}={value}" for key, value in param.items()) + ")"
+                try:
+                    value, samples, number = measure(setup(workdir, **param), args.repeat)
+                except ImportError as e:
+                    print(f"{label:<58} skipped: {e}")
+                    continue
+
+                result = {
+                    **run_info, "benchmark": name, "params": param,
+                    "min": min(samples), "median": statistics.median(samples), "repeat": args.repeat,
+                    "number": number, "value": value, "value_digest": value_digest(value),
+                }
+                results.append(result)
+
+                line = f"{label:<58} {result['min'] * 1e3:10.3f} ms  median {result['median'] * 1e3:10.3f} ms"
+                earlier = previous.get(result_key(result))
+                if earlier is not None:
+                    line += f"  x{result['min'] / earlier['min']:.2f} vs {earlier['commit']}"
+                    if earlier["value_digest"] != result["value_digest"]:
+                        line += "  VALUE CHANGED"
+                        changed.append(label)
+                print(line, flush=True)
+
+    if not args.no_save and results:
+        with open(args.output, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    if changed:
+        print("\nMetric values differ from the last run: " + ", ".join(changed))
+    sys.exit(1 if args.check_values and changed else 0)
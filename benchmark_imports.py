@@ -0,0 +1,88 @@
+from pathlib import Path
+import sys
+import argparse
+import subprocess
+
+# Import-time guard for the entry points. Each entry module is imported in a fresh interpreter with
+# -X importtime. The check fails if a heavy backend is loaded at import, or if the import takes longer than
+# the budget. Heavy backends must only be imported by the stage or backend that uses them.
+#
+#   python benchmark_imports.py            # exit code 1 on a violation
+#   python benchmark_imports.py --budget 0.5 --top 10
+
+ROOT = Path(__file__).resolve().parent
+
+# (directory, module); the directory is put first on sys.path, as when running `python main.py` there
+ENTRY_POINTS = [
+    (ROOT, "main"),
+    (ROOT / "InformationExtractionEvaluation", "main"),
+    (ROOT / "IE_Eval_JudgeLLM", "main"),
+    (ROOT, "evaluate"),
+]
+
+HEAVY_MODULES = [
+    "torch", "tensorflow", "transformers", "sentence_transformers", "onnxruntime",
+    "deepeval", "instructor", "google.generativeai", "sklearn", "openai", "pyarrow",
+    "spellchecker", "pyvoikko",
+]
+
+
+def measure_import(directory: Path, module: str):
+
+    code = f"import sys; sys.path[:0] = [{str(directory)!r}, {str(ROOT)!r}]; import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=directory, capture_output=True, text=True,
+    )
+
+    # lines look like "import time:   self [us] | cumulative | imported package"
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+
+    errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+    return result.returncode, timings, errors
+
+
+def heavy_loaded(timings):
+    return sorted({
+        heavy for heavy in HEAVY_MODULES
+        for name in timings if name == heavy or name.startswith(heavy + ".")
+    })
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed per entry point import")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports listed per entry point")
+    args = parser.parse_args()
+
+    failed = False
+    for directory, module in ENTRY_POINTS:
+        label = str((directory / f"{module}.py").relative_to(ROOT))
+        returncode, timings, errors = measure_import(directory, module)
+        if returncode != 0:
+            print(f"{label}: import failed\n" + "\n".join(errors[-5:]))
+            failed = True
+            continue
+
+        # the entry module's cumulative time covers everything it imports
+        total = timings.get(module, (0, 0))[1] / 1e6
+        heavy = heavy_loaded(timings)
+        status = "ok"
+        if heavy or total > args.budget:
+            status = "FAIL"
+            failed = True
+
+        print(f"{label}: {total:.3f}s {status}")
+        if heavy:
+            print(f"  heavy modules loaded at import: {', '.join(heavy)}")
+        slowest = sorted(timings.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+        for name, (_, cumulative) in slowest:
+            print(f"  {cumulative / 1e3:8.1f} ms  {name}")
+
+    sys.exit(1 if failed else 0)
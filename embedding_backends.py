@@ -0,0 +1,139 @@
+import os
+import time
+import random
+import numpy as np
+import instrumentation
+
+# Embedding backends share one interface: backend.name (also the EmbeddingStore key) and
+# backend.encode(texts) -> float32 array with L2-normalised rows, in input order.
+# Heavy libraries (openai, sentence_transformers, torch) are imported when a backend first encodes.
+#
+#   "openai"                 OpenAI embeddings API (network), batched requests with retry
+#   "sentence-transformers"  SentenceTransformer on its default device
+#   "local-cpu"              SentenceTransformer on CPU, int8 dynamic quantisation, fixed thread count
+
+
+def _normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.size == 0:
+        return vectors.reshape(len(vectors), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class OpenAIEmbeddingBackend:
+
+    def __init__(self, model: str = "text-embedding-ada-002", batch_size: int = 256,
+                 max_retries: int = 6, retry_base_delay: float = 1.0):
+        self.name = model
+        self.model = model
+        self.batch_size = batch_size  # inputs per embeddings request
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.client = None
+
+    def _client(self):
+        if self.client is None:
+            from openai import OpenAI
+            # OPENAI_BASE_URL can point this at a local mock embedding server;
+            # the client's own retries are off, _with_retry does the backoff
+            self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", "sk-proj"), base_url=os.getenv("OPENAI_BASE_URL"),
+                                 max_retries=0)
+        return self.client
+
+    # retries rate limits and transient errors with jittered exponential backoff
+    def _with_retry(self, call):
+        from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(60.0, self.retry_base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"!Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def encode(self, texts):
+        client = self._client()
+        instrumentation.count("embedding_texts", len(texts))
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            chunk = list(texts[start:start + self.batch_size])
+            with instrumentation.timer("embedding_request"):
+                response = self._with_retry(lambda: client.embeddings.create(model=self.model, input=chunk))
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                instrumentation.count("embedding_tokens", usage.total_tokens or 0)
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return _normalize_rows(vectors)
+
+
+class SentenceTransformerBackend:
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 256, device: str = None):
+        self.name = model_name
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.device = device
+        self.model = None
+
+    def load_model(self):
+        if self.model is None:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name, device=self.device)
+        return self.model
+
+    @instrumentation.timed("embedding_encode")
+    def encode(self, texts):
+        instrumentation.count("embedding_texts", len(texts))
+        return self.load_model().encode(
+            list(texts),
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        ).astype(np.float32, copy=False)
+
+
+# CPU-only SentenceTransformer for nodes without GPU or network access.
+# quantize=True applies int8 dynamic quantisation to the Linear layers (no export step, no extra dependency).
+# The model must already be in the local Hugging Face cache on air-gapped nodes.
+class LocalCPUBackend(SentenceTransformerBackend):
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 256, threads: int = None,
+                 quantize: bool = True):
+        super().__init__(model_name, batch_size, device="cpu")
+        self.threads = threads
+        self.quantize = quantize
+        # quantised vectors differ slightly, so they get their own store key
+        self.name = f"{model_name}-cpu-int8" if quantize else model_name
+
+    def load_model(self):
+        if self.model is None:
+            import torch
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            model = super().load_model()
+            if self.quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.model = model.eval()
+        return self.model
+
+
+EMBEDDING_BACKENDS = {
+    "openai": OpenAIEmbeddingBackend,
+    "sentence-transformers": SentenceTransformerBackend,
+    "local-cpu": LocalCPUBackend,
+}
+
+
+def register_embedding_backend(name: str, factory):
+    EMBEDDING_BACKENDS[name] = factory
+
+
+def make_embedding_backend(name: str, **options):
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    return EMBEDDING_BACKENDS[name](**options)
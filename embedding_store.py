@@ -0,0 +1,163 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import re
+import unicodedata
+import numpy as np
+
+# Embedding vectors keyed by (model name, hash of the normalised text).
+# One float32 matrix per model is memory-mapped from <directory>/<model>.f32, with a JSON side index
+# mapping text hash -> row. When max_entries is reached the least recently used rows are reused.
+# A store is meant to be used by one process at a time; call save() to persist the index.
+# The saved index never points at a row holding another text's vector: evicting rewrites it before
+# the rows are reused, and new rows only enter it on the next save().
+
+INITIAL_CAPACITY = 1024
+
+
+def normalize_text(text: str):
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+def text_key(text: str):
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+
+    def __init__(self, directory: Path, model_name: str, max_entries: int = 200_000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.max_entries = max_entries
+
+        safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", model_name)
+        self.matrix_path = self.directory / f"{safe_name}.f32"
+        self.index_path = self.directory / f"{safe_name}.index.json"
+
+        self.dim = None
+        self.capacity = 0
+        self.rows = {}       # key -> row
+        self.last_used = {}  # key -> tick
+        self.free_rows = []
+        self.tick = 0
+        self.matrix = None
+        self.dirty = False
+
+        if self.index_path.exists():
+            index = json.loads(self.index_path.read_text(encoding="utf-8"))
+            self.dim = index["dim"]
+            self.capacity = index["capacity"]
+            self.tick = index["tick"]
+            for key, (row, used) in index["entries"].items():
+                self.rows[key] = row
+                self.last_used[key] = used
+            taken = set(self.rows.values())
+            self.free_rows = [row for row in range(self.capacity - 1, -1, -1) if row not in taken]
+            self._open()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, text):
+        return text_key(text) in self.rows
+
+    def _open(self):
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _grow(self, needed: int):
+        new_capacity = max(INITIAL_CAPACITY, self.capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= self.capacity:
+            return
+
+        if self.matrix is not None:
+            self.matrix.flush()
+            del self.matrix
+        with open(self.matrix_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.free_rows = list(range(new_capacity - 1, self.capacity - 1, -1)) + self.free_rows
+        self.capacity = new_capacity
+        self._open()
+
+    def _evict(self, count: int):
+        oldest = sorted(self.last_used, key=self.last_used.get)[:count]
+        for key in oldest:
+            self.free_rows.append(self.rows.pop(key))
+            del self.last_used[key]
+        # the index on disk may still map the evicted texts to these rows
+        self.dirty = True
+        self.save()
+
+    def get(self, text):
+        key = text_key(text)
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        self.tick += 1
+        self.last_used[key] = self.tick
+        self.dirty = True
+        return np.array(self.matrix[row])
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+
+        keys = [text_key(text) for text in texts]
+        new_keys = [key for key in dict.fromkeys(keys) if key not in self.rows]
+        self._grow(len(self.rows) + len(new_keys))
+        shortage = len(new_keys) - len(self.free_rows)
+        if shortage > 0:
+            self._evict(shortage)
+
+        for key, vector in zip(keys, vectors):
+            row = self.rows.get(key)
+            if row is None:
+                if not self.free_rows:
+                    continue
+                row = self.free_rows.pop()
+                self.rows[key] = row
+            self.matrix[row] = vector
+            self.tick += 1
+            self.last_used[key] = self.tick
+        self.dirty = True
+
+    # returns the vectors of texts in order; encode(missing_texts) -> vectors is called once for cache misses
+    def embed(self, texts, encode):
+
+        vectors = [self.get(text) for text in texts]
+        missing = list(dict.fromkeys(
+            normalize_text(text) for text, vector in zip(texts, vectors) if vector is None
+        ))
+        if missing:
+            encoded = np.asarray(encode(missing), dtype=np.float32)
+            self.put_many(missing, encoded)
+            by_text = dict(zip(missing, encoded))
+            vectors = [
+                vector if vector is not None else by_text[normalize_text(text)]
+                for text, vector in zip(texts, vectors)
+            ]
+        if not vectors:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.vstack(vectors)
+
+    def save(self):
+        if not self.dirty:
+            return
+        if self.matrix is not None:
+            self.matrix.flush()
+        index = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "tick": self.tick,
+            "entries": {key: [row, self.last_used[key]] for key, row in self.rows.items()},
+        }
+        tmp_path = self.index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(index), encoding="utf-8")
+        os.replace(tmp_path, self.index_path)
+        self.dirty = False
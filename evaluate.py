@@ -0,0 +1,346 @@
+from pathlib import Path
+import os
+import sys
+import argparse
+import multiprocessing
+from pipeline import FileIndex, Stage, run_stages
+from report_sink import ReportSink
+import instrumentation
+
+ROOT = Path(__file__).resolve().parent
+sys.path.append(str(ROOT / "InformationExtractionEvaluation"))
+sys.path.append(str(ROOT / "IE_Eval_JudgeLLM"))
+
+# One CLI for all evaluations. The stages form a dependency graph over shared file discovery:
+# each folder is scanned once and files are paired by stem. Independent stages run at the same time.
+#
+#   python evaluate.py --gt-transcripts GT --transcripts TR --gt-terms TERMS --workers wer=8 spelling=4
+#   python evaluate.py --stages extract field-match judge --ie-transcripts IN --ie-gt GT --ie-predictions PRED
+#
+#   extract      transcripts -> <stem>_form.json (LLM)            --ie-transcripts, --ie-predictions
+#   wer          WER / deleted / added per transcript            --gt-transcripts, --transcripts
+#   spelling     spelling errors per transcript                  --transcripts
+#   techterms    GT technical terms not found in transcript      --gt-terms, --transcripts
+#   field-match  IE field presence and similarity (after extract) --ie-gt, --ie-predictions
+#   custom-eval  IE custom evaluation (after extract)            --ie-gt, --ie-predictions
+#   judge        GEval judge of the extraction (after extract)   --ie-gt, --ie-predictions
+#
+# Without --stages every stage whose folders are given runs. Reports go to --output-dir/<stage>_report.txt
+# (plus the other --report-formats), stage timings to --output-dir/pipeline_report.txt.
+# The heavy libraries of a stage are imported when it runs.
+#
+# --metrics-json / --metrics-prom switch on the instrumentation (instrumentation.py): latency histograms,
+# call counts, bytes read and API tokens per stage, plus per-file totals in the JSON. --profile-dir writes
+# a cProfile (or pyinstrument) profile per stage; stages then run one at a time so each profile is its own.
+
+
+# extraction outputs are <stem>_form.json and GT files may use either name
+def ie_stem(stem: str):
+    return stem[:-len("_form")] if stem.endswith("_form") else stem
+
+
+def build_stages(args):
+
+    output_dir = args.output_dir
+
+    def report_path(name):
+        return output_dir / f"{name.replace('-', '_')}_report.txt"
+
+    def open_manifest():
+        # one SQLite connection per stage thread
+        from run_manifest import RunManifest
+        return RunManifest(args.manifest) if args.manifest is not None else None
+
+    # local-cpu thread count and quantisation come from the CLI; other backends take their defaults
+    def embedding_backend(default):
+        name = args.embedding_backend or default
+        options = {}
+        if name == "local-cpu":
+            options = {"threads": args.embedding_threads, "quantize": not args.embedding_no_quantize}
+        return name, options
+
+    # EmbeddingStore is single-process and not safe for concurrent use, and field-match and custom-eval
+    # run at the same time; each stage keeps its own store under --embedding-cache
+    def embedding_cache(stage):
+        return args.embedding_cache / stage if args.embedding_cache is not None else None
+
+    def ie_pairs(index):
+        pairs, missing = index.pair(args.ie_gt, args.ie_predictions, ".json", ".json", key=ie_stem)
+        for gt_file in missing:
+            print(f"Prediction missing for {gt_file.name}")
+        return pairs
+
+    def extract(index, workers):
+        from IE import run_field_extraction, run_field_extraction_async, replay_field_extraction
+        from response_cache import DiskResponseCache
+
+        text_files = list(index.files(args.ie_transcripts, ".txt").values())
+        cache = DiskResponseCache(args.response_cache) if args.response_cache is not None else None
+        manifest = open_manifest()
+        api_key = os.getenv("OPENAI_API_KEY")
+        try:
+            if args.replay:
+                replay_field_extraction(args.ie_transcripts, args.ie_predictions, args.model, cache, text_files)
+            elif api_key is None:
+                raise ValueError("Please set your OPENAI_API_KEY environment variable")
+            elif workers > 1:
+                run_field_extraction_async(
+                    args.ie_transcripts, args.ie_predictions, args.model, api_key,
+                    concurrency=workers, base_url=os.getenv("OPENAI_BASE_URL"), manifest=manifest, cache=cache,
+                    text_files=text_files
+                )
+            else:
+                run_field_extraction(args.ie_transcripts, args.ie_predictions, args.model, api_key,
+                                     manifest=manifest, cache=cache, text_files=text_files)
+        finally:
+            if manifest is not None:
+                manifest.close()
+        # the evaluators must see the new predictions
+        index.invalidate(args.ie_predictions)
+
+    def wer(index, workers):
+        from ErrorRateCalculation_parallel import runDiffErros
+
+        pairs, missing = index.pair(args.gt_transcripts, args.transcripts)
+        for gt_file in missing:
+            print(f"!!!! Missing transcription file for {gt_file.name}")
+
+        with ReportSink(report_path("wer"), args.report_formats) as report:
+            totals = runDiffErros(
+                [(gt_file.name, gt_file, tr_file) for gt_file, tr_file in pairs], report, args.language,
+                args.matcher, workers=workers, chunksize=args.chunksize, streaming=args.streaming, spelling=False,
+                alignment=args.alignment, batched=args.batched
+            )
+            if totals["gt_words"]:
+                report.add({
+                    "kind": "wer_average",
+                    "gt_words": totals["gt_words"],
+                    "transcription_words": totals["transcription_words"],
+                    "wer": totals["wer"] / totals["gt_words"] * 100,
+                    "deleted_rate": totals["deleted"] / totals["gt_words"] * 100,
+                    "added_rate": totals["added"] / totals["gt_words"] * 100,
+                })
+            if args.alignment:
+                for record in totals["confusions"].records(args.confusion_top):
+                    report.add(record)
+
+    def spelling(index, workers):
+        from ErrorRateCalculation_parallel import runSpellErros
+
+        files = [(name + ".txt", path) for name, path in index.files(args.transcripts, ".txt").items()]
+        with ReportSink(report_path("spelling"), args.report_formats) as report:
+            totals = runSpellErros(
+                files, report, args.language, workers=workers, chunksize=args.chunksize,
+                spell_cache_path=args.spell_cache, streaming=args.streaming
+            )
+            if totals["transcription_words"]:
+                report.add({
+                    "kind": "spelling_average",
+                    "transcription_words": totals["transcription_words"],
+                    "spelling_rate": totals["spellingError"] / totals["transcription_words"] * 100,
+                })
+
+    def techterms(index, workers):
+        from ErrorRateCalculation_sequenceMatching import evaluateTechTermsError, clean_text_transcription
+        from ErrorRateCalculation_levenshtein import Vocabulary
+        from ErrorRateCalculation_terms import TermDictionary
+
+        pairs, missing = index.pair(args.gt_terms, args.transcripts)
+        for gt_file in missing:
+            print(f"!!!!!Missing transcription terms file for {gt_file.name}")
+
+        # own vocabulary: the WER stage may be assigning word IDs in another thread
+        term_dictionary = TermDictionary(clean_text_transcription, Vocabulary())
+        for gt_file in index.files(args.gt_terms, ".txt").values():
+            term_dictionary.load_file(gt_file)
+
+        total_terms = not_found = 0
+        with ReportSink(report_path("techterms"), args.report_formats) as report:
+            for gt_file, tr_file in pairs:
+                try:
+                    with instrumentation.file_scope(gt_file.name):
+                        record = evaluateTechTermsError(gt_file, tr_file, term_dictionary=term_dictionary)
+                    report.add(record)
+                    total_terms += record["total_terms"]
+                    not_found += record["not_found_count"]
+                except Exception as e:
+                    print(f"Error processing {gt_file.name}: {e}")
+            report.add({
+                "kind": "techterms_average",
+                "total_terms": total_terms,
+                "not_found_count": not_found,
+                "not_found_rate": not_found / total_terms * 100 if total_terms > 0 else None,
+                "distinct_terms": len(term_dictionary),
+                "most_missed": term_dictionary.most_missed(20),
+            })
+
+    def field_match(index, workers):
+        from IE_evaluation import evaluate_field_matching
+        from embedding_backends import make_embedding_backend
+
+        name, options = embedding_backend("sentence-transformers")
+        manifest = open_manifest()
+        try:
+            evaluate_field_matching(
+                args.ie_gt, args.ie_predictions, report_path("field-match"),
+                report_formats=args.report_formats, embedding_cache_dir=embedding_cache("field-match"),
+                manifest=manifest, backend=make_embedding_backend(name, **options),
+                file_pairs=ie_pairs(index)
+            )
+        finally:
+            if manifest is not None:
+                manifest.close()
+
+    def custom_eval(index, workers):
+        from Custom_evaluation import (C_evaluate_records, CUSTOM_DETAIL_FORMAT, configure_embedding_backend,
+                                       configure_embedding_store)
+
+        name, options = embedding_backend("openai")
+        configure_embedding_backend(name, **options)
+        store = configure_embedding_store(embedding_cache("custom-eval"))
+        manifest = open_manifest()
+        try:
+            records = C_evaluate_records(ie_pairs(index), threshold=args.threshold, manifest=manifest)
+        finally:
+            if manifest is not None:
+                manifest.close()
+        if store is not None:
+            store.save()
+        with ReportSink(report_path("custom-eval"), args.report_formats, CUSTOM_DETAIL_FORMAT) as report:
+            for record in records:
+                report.add(record)
+
+    def judge(index, workers):
+        from JudgeLLM import G_evaluate_records, VerdictStore
+
+        verdicts = VerdictStore(args.judge_verdicts, args.judge_verdict_mode) if args.judge_verdicts else None
+        manifest = open_manifest()
+        try:
+            records = G_evaluate_records(ie_pairs(index), threshold=args.threshold, concurrency=workers,
+                                         manifest=manifest, verdicts=verdicts)
+        finally:
+            if manifest is not None:
+                manifest.close()
+        with ReportSink(report_path("judge"), args.report_formats) as report:
+            for record in records:
+                report.add(record)
+
+    return {
+        "extract": Stage("extract", extract, workers=8, inputs=("ie_transcripts", "ie_predictions")),
+        "wer": Stage("wer", wer, workers=1, inputs=("gt_transcripts", "transcripts")),
+        "spelling": Stage("spelling", spelling, workers=1, inputs=("transcripts",)),
+        "techterms": Stage("techterms", techterms, inputs=("gt_terms", "transcripts")),
+        "field-match": Stage("field-match", field_match, requires=("extract",), inputs=("ie_gt", "ie_predictions")),
+        "custom-eval": Stage("custom-eval", custom_eval, requires=("extract",), inputs=("ie_gt", "ie_predictions")),
+        "judge": Stage("judge", judge, requires=("extract",), workers=8, inputs=("ie_gt", "ie_predictions")),
+    }
+
+
+STAGE_NAMES = ("extract", "wer", "spelling", "techterms", "field-match", "custom-eval", "judge")
+
+
+def parse_workers(items, stages):
+    workers = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        if name not in stages or stages[name].workers is None:
+            raise SystemExit(f"--workers: {name} has no worker pool "
+                             f"(one of {', '.join(n for n in stages if stages[n].workers is not None)})")
+        workers[name] = int(value)
+    return workers
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Transcription and information extraction evaluation")
+    parser.add_argument("--stages", nargs="+", choices=STAGE_NAMES, default=None,
+                        help="default: every stage whose folders are given")
+    parser.add_argument("--gt-transcripts", type=Path, default=None, help="ground truth transcripts (*.txt)")
+    parser.add_argument("--transcripts", type=Path, default=None, help="transcripts to evaluate (*.txt)")
+    parser.add_argument("--gt-terms", type=Path, default=None, help="technical term lists (*.txt)")
+    parser.add_argument("--ie-transcripts", type=Path, default=None, help="transcripts to extract from (*.txt)")
+    parser.add_argument("--ie-gt", type=Path, default=None, help="ground truth IE JSON files")
+    parser.add_argument("--ie-predictions", type=Path, default=None, help="extracted JSON files (written by extract)")
+    parser.add_argument("--output-dir", type=Path, default=Path("reports"))
+    parser.add_argument("--report-formats", nargs="+", default=["text"], help="text, jsonl, csv and/or parquet")
+    parser.add_argument("--workers", nargs="+", default=[], metavar="STAGE=N",
+                        help="pool size per stage: processes for wer/spelling, requests in flight for extract/judge")
+    parser.add_argument("--parallel-stages", type=int, default=None, help="stages running at once (default: all)")
+    parser.add_argument("--language", default="fi", choices=("fi", "en"))
+    parser.add_argument("--matcher", default="levenshtein", choices=("levenshtein", "difflib"))
+    parser.add_argument("--chunksize", type=int, default=16, help="files per worker task")
+    parser.add_argument("--streaming", action="store_true", help="read and align long transcripts in segments")
+    parser.add_argument("--batched", action="store_true",
+                        help="wer: align the files in NumPy batches, one share per worker "
+                             "(levenshtein, not with --streaming or --alignment)")
+    parser.add_argument("--alignment", action="store_true",
+                        help="wer: keep each file's alignment and report the most frequent substitutions, "
+                             "deletions and insertions")
+    parser.add_argument("--confusion-top", type=int, default=50, help="rows per confusion table")
+    parser.add_argument("--spell-cache", type=Path, default=None, help="SQLite file for spell verdicts")
+    parser.add_argument("--manifest", type=Path, default=None, help="SQLite run manifest for the IE stages")
+    parser.add_argument("--model", default="gpt-5", help="extraction model")
+    parser.add_argument("--response-cache", type=Path, default=None, help="directory for raw extraction replies")
+    parser.add_argument("--replay", action="store_true", help="extract from cached replies only")
+    parser.add_argument("--embedding-backend", default=None,
+                        help="default: sentence-transformers for field-match, openai for custom-eval")
+    parser.add_argument("--embedding-threads", type=int, default=None, help="local-cpu: torch threads")
+    parser.add_argument("--embedding-no-quantize", action="store_true", help="local-cpu: keep float32 weights")
+    parser.add_argument("--embedding-cache", type=Path, default=None,
+                        help="embedding stores, one subdirectory per stage")
+    parser.add_argument("--threshold", type=float, default=0.85, help="custom-eval and judge pass threshold")
+    parser.add_argument("--judge-verdicts", type=Path, default=None, help="directory of stored judge verdicts")
+    parser.add_argument("--judge-verdict-mode", default="use", choices=("use", "replay", "refresh"))
+    parser.add_argument("--metrics-json", type=Path, default=None, help="write instrumentation metrics as JSON")
+    parser.add_argument("--metrics-prom", type=Path, default=None, help="write them as a Prometheus textfile")
+    parser.add_argument("--profile-dir", type=Path, default=None, help="write a profile per stage")
+    parser.add_argument("--profiler", default="cprofile", choices=("cprofile", "pyinstrument"))
+    args = parser.parse_args()
+
+    if args.batched and (args.matcher != "levenshtein" or args.streaming or args.alignment):
+        parser.error("--batched needs --matcher levenshtein and cannot be combined with --streaming or --alignment")
+    if args.embedding_backend != "local-cpu" and (args.embedding_threads is not None or args.embedding_no_quantize):
+        parser.error("--embedding-threads and --embedding-no-quantize need --embedding-backend local-cpu")
+
+    stages = build_stages(args)
+    workers = parse_workers(args.workers, stages)
+
+    def configured(name):
+        return all(getattr(args, option) is not None for option in stages[name].inputs)
+
+    if args.stages is None:
+        selected = [name for name in STAGE_NAMES if configured(name)]
+    else:
+        selected = list(dict.fromkeys(args.stages))
+        for name in selected:
+            if not configured(name):
+                options = ", ".join("--" + option.replace("_", "-") for option in stages[name].inputs)
+                parser.error(f"stage {name} needs {options}")
+    if not selected:
+        parser.error("no stage has its folders given")
+
+    # worker processes are started from stage threads; forking a threaded process is not safe
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        multiprocessing.set_start_method("forkserver")
+
+    args.output_dir.mkdir(parents=True, exist_ok=True)
+    instrumentation.enable(args.metrics_json is not None or args.metrics_prom is not None)
+    parallel = args.parallel_stages
+    if args.profile_dir is not None:
+        args.profile_dir.mkdir(parents=True, exist_ok=True)
+        parallel = 1
+    timings = run_stages(stages, selected, FileIndex(), workers, parallel, args.profile_dir, args.profiler)
+
+    if args.metrics_json is not None:
+        instrumentation.write_json(args.metrics_json)
+    if args.metrics_prom is not None:
+        instrumentation.write_prometheus(args.metrics_prom)
+
+    with ReportSink(args.output_dir / "pipeline_report.txt", args.report_formats) as report:
+        report.section("STAGE TIMINGS\n")
+        for record in timings:
+            report.add(record)
+    for record in timings:
+        print(record["stage"], record["status"], f"{record['seconds']:.2f}s" if record["seconds"] is not None else "")
+
+    sys.exit(0 if all(record["status"] == "ok" for record in timings) else 1)
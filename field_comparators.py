@@ -0,0 +1,137 @@
+import re
+import hashlib
+import unicodedata
+from difflib import SequenceMatcher
+
+# Per-field value comparison for the IE evaluators. A comparator maps (gt_value, pred_value) to a
+# similarity in [0, 1] that is checked against the field threshold as before.
+# "embedding" is not a function here: those pairs are collected and handed to the evaluator's batched
+# embedding call, which is only made (and the model only loaded) if some field uses it.
+
+
+def normalize_value(value):
+    text = unicodedata.normalize("NFC", str(value)).casefold()
+    text = " ".join(text.split())
+    return text.strip(" .,;:!?\"'()[]")
+
+
+def compare_exact(gt_value, pred_value):
+    return 1.0 if str(gt_value).strip() == str(pred_value).strip() else 0.0
+
+
+def compare_normalized(gt_value, pred_value):
+    return 1.0 if normalize_value(gt_value) == normalize_value(pred_value) else 0.0
+
+
+def compare_fuzzy(gt_value, pred_value):
+    return SequenceMatcher(None, normalize_value(gt_value), normalize_value(pred_value), autojunk=False).ratio()
+
+
+_DATE_FI = re.compile(r"\b(\d{1,2})\.\s*(\d{1,2})\.\s*(\d{2,4})\b")
+_DATE_ISO = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})")
+# "12.03." is a date without a year, so a dot separated time needs "klo" before it or no dot after it
+_TIME = re.compile(r"(\bklo\.?\s*)?(?<!\d)(\d{1,2})([:.])(\d{2})(?!\d)(\.?)", re.IGNORECASE)
+
+
+# (year, month, day) and (hour, minute) found in a Finnish or ISO style value, either may be None
+# e.g. "12.3.2024 klo 14.30", "ma 12.03.24 klo 9:05", "2024-03-12T14:30"; "12.03." has no time
+def parse_date_time(value):
+    text = str(value)
+    date = None
+    match = _DATE_ISO.search(text)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        date = (year, month, day)
+    else:
+        match = _DATE_FI.search(text)
+        if match:
+            day, month, year = (int(part) for part in match.groups())
+            date = (year + 2000 if year < 100 else year, month, day)
+    if match:
+        text = text[:match.start()] + " " + text[match.end():]
+
+    time = None
+    for match in _TIME.finditer(text):
+        klo, hour, separator, minute, trailing_dot = match.groups()
+        if not klo and separator == "." and trailing_dot:
+            continue
+        hour, minute = int(hour), int(minute)
+        if hour < 24 and minute < 60:
+            time = (hour, minute)
+            break
+    return date, time
+
+
+# share of the GT date/time parts that the prediction gets right; free text falls back to fuzzy
+def compare_datetime(gt_value, pred_value):
+    gt_date, gt_time = parse_date_time(gt_value)
+    if gt_date is None and gt_time is None:
+        return compare_fuzzy(gt_value, pred_value)
+    pred_date, pred_time = parse_date_time(pred_value)
+    parts = [(gt_part, pred_part) for gt_part, pred_part in ((gt_date, pred_date), (gt_time, pred_time)) if gt_part]
+    return sum(gt_part == pred_part for gt_part, pred_part in parts) / len(parts)
+
+
+COMPARATORS = {
+    "exact": compare_exact,
+    "normalized": compare_normalized,
+    "fuzzy": compare_fuzzy,
+    "datetime": compare_datetime,
+    "embedding": None,
+}
+
+
+def register_comparator(name: str, comparator):
+    COMPARATORS[name] = comparator
+
+
+# short categorical values are compared as strings, free text with embeddings
+DEFAULT_FIELD_COMPARATORS = {
+    "Raportin tyyppi": "normalized",
+    "Tarkkailijan nimi": "fuzzy",
+    "Tarkkailijaorganisaatio": "fuzzy",
+    "Tarkkailija on kesätyöntekijä": "normalized",
+    "Tapahtuma-aika": "datetime",
+    "Sijaintitiedot": "fuzzy",
+    "Kuva": "normalized",
+    "Tapahtuma oli vakava": "normalized",
+    "Tapahtuma-alueen kuvaus": "embedding",
+    "Mahdolliset seuraukset": "embedding",
+    "Toteutetut toimenpiteet": "embedding",
+    "Ehdotus": "embedding",
+}
+
+
+def comparator_name(field: str, field_comparators: dict = None):
+    field_comparators = field_comparators if field_comparators is not None else DEFAULT_FIELD_COMPARATORS
+    name = field_comparators.get(field, "embedding")
+    if name not in COMPARATORS:
+        raise ValueError(f"Unknown comparator for {field}: {name}")
+    return name
+
+
+# short hash of the field -> comparator mapping, for run manifest versions
+def comparator_signature(field_comparators: dict = None):
+    field_comparators = field_comparators if field_comparators is not None else DEFAULT_FIELD_COMPARATORS
+    text = ";".join(f"{field}={name}" for field, name in sorted(field_comparators.items()))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+# similarities for (field, gt_value, pred_value) triples, in order
+# embed_pairs([(gt, pred), ...]) -> similarities is called once, only for the embedding fields
+def score_field_pairs(field_pairs, embed_pairs, field_comparators: dict = None):
+
+    similarities = [0.0] * len(field_pairs)
+    embedded = []
+    for i, (field, gt_value, pred_value) in enumerate(field_pairs):
+        comparator = COMPARATORS[comparator_name(field, field_comparators)]
+        if comparator is None:
+            embedded.append(i)
+        else:
+            similarities[i] = comparator(gt_value, pred_value)
+
+    if embedded:
+        embedded_similarities = embed_pairs([field_pairs[i][1:] for i in embedded])
+        for i, similarity in zip(embedded, embedded_similarities):
+            similarities[i] = float(similarity)
+    return similarities
@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import threading
+import functools
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+from inspect import iscoroutinefunction
+
+# Timers and counters for the hot paths (tokenizing, alignment, spell checks, term scans, embedding and LLM calls).
+# Off by default: a @timed function then costs one flag check per call. enable() switches them on for the process;
+# worker processes are enabled by their initializer and their metrics are merged into the parent with merge().
+#
+# Every observation is labelled with the current stage (stage_scope) and, when set, the current file (file_scope).
+# write_json / write_prometheus export call counts, latency histograms, per-file totals and the counters
+# (bytes read, API tokens, texts embedded, ...).
+
+# upper bounds in seconds, Prometheus style; the last bucket is +Inf
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_stage = contextvars.ContextVar("instrumentation_stage", default=None)
+_file = contextvars.ContextVar("instrumentation_file", default=None)
+
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timers = {}  # (stage, name) -> [bucket counts, seconds, calls]
+        self.counters = {}  # (stage, name) -> value
+        self.files = {}  # (stage, file) -> {name: [calls, seconds]}
+
+    def observe(self, name: str, seconds: float):
+        stage = _stage.get()
+        file = _file.get()
+        with self._lock:
+            timer = self.timers.get((stage, name))
+            if timer is None:
+                timer = self.timers[(stage, name)] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            bucket = 0
+            while bucket < len(BUCKETS) and seconds > BUCKETS[bucket]:
+                bucket += 1
+            timer[0][bucket] += 1
+            timer[1] += seconds
+            timer[2] += 1
+            if file is not None:
+                totals = self.files.setdefault((stage, file), {}).setdefault(name, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+
+    def count(self, name: str, value=1):
+        key = (_stage.get(), name)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "timers": {key: [list(timer[0]), timer[1], timer[2]] for key, timer in self.timers.items()},
+                "counters": dict(self.counters),
+                "files": {key: {name: list(totals) for name, totals in names.items()}
+                          for key, names in self.files.items()},
+            }
+
+    def drain(self):
+        with self._lock:
+            snapshot = {"timers": self.timers, "counters": self.counters, "files": self.files}
+            self.timers, self.counters, self.files = {}, {}, {}
+        return snapshot
+
+    # adds a snapshot from a worker process; its unlabelled observations get the current stage
+    def merge(self, snapshot):
+        stage = _stage.get()
+        with self._lock:
+            for (key_stage, name), (buckets, seconds, calls) in snapshot["timers"].items():
+                timer = self.timers.setdefault((key_stage or stage, name), [[0] * (len(BUCKETS) + 1), 0.0, 0])
+                timer[0] = [a + b for a, b in zip(timer[0], buckets)]
+                timer[1] += seconds
+                timer[2] += calls
+            for (key_stage, name), value in snapshot["counters"].items():
+                key = (key_stage or stage, name)
+                self.counters[key] = self.counters.get(key, 0) + value
+            for (key_stage, file), names in snapshot["files"].items():
+                target = self.files.setdefault((key_stage or stage, file), {})
+                for name, (calls, seconds) in names.items():
+                    totals = target.setdefault(name, [0, 0.0])
+                    totals[0] += calls
+                    totals[1] += seconds
+
+
+metrics = Metrics()
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def count(name: str, value=1):
+    if _enabled:
+        metrics.count(name, value)
+
+
+# size of a file the evaluation reads, counted as bytes_read
+def record_read(path):
+    if _enabled:
+        metrics.count("bytes_read", os.path.getsize(path))
+
+
+@contextmanager
+def timer(name: str):
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe(name, time.perf_counter() - start)
+
+
+# decorator for sync and async functions
+def timed(name: str):
+
+    def decorate(function):
+        if iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    metrics.observe(name, time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                metrics.observe(name, time.perf_counter() - start)
+        return wrapper
+
+    return decorate
+
+
+@contextmanager
+def stage_scope(name: str):
+    token = _stage.set(name)
+    try:
+        yield
+    finally:
+        _stage.reset(token)
+
+
+# observations inside are also added to the file's totals (and its wall time to "file")
+@contextmanager
+def file_scope(name: str):
+    if not _enabled:
+        yield
+        return
+    token = _file.set(str(name))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe("file", time.perf_counter() - start)
+        _file.reset(token)
+
+
+def _histogram(buckets, seconds, calls):
+    cumulative = 0
+    bounds = {}
+    for bound, bucket_count in zip(list(BUCKETS) + ["+Inf"], buckets):
+        cumulative += bucket_count
+        bounds[str(bound)] = cumulative
+    return {"calls": calls, "seconds": seconds, "mean_seconds": seconds / calls if calls else 0.0, "buckets": bounds}
+
+
+def report(snapshot=None):
+    snapshot = snapshot if snapshot is not None else metrics.snapshot()
+    stages = {}
+
+    def section(stage):
+        return stages.setdefault(stage or "-", {"timers": {}, "counters": {}, "files": {}})
+
+    for (stage, name), (buckets, seconds, calls) in sorted(snapshot["timers"].items(), key=lambda item: str(item[0])):
+        section(stage)["timers"][name] = _histogram(buckets, seconds, calls)
+    for (stage, name), value in sorted(snapshot["counters"].items(), key=lambda item: str(item[0])):
+        section(stage)["counters"][name] = value
+    for (stage, file), names in sorted(snapshot["files"].items(), key=lambda item: str(item[0])):
+        section(stage)["files"][file] = {
+            name: {"calls": calls, "seconds": seconds} for name, (calls, seconds) in sorted(names.items())
+        }
+    return {"buckets": list(BUCKETS), "stages": stages}
+
+
+def write_json(path: Path, snapshot=None):
+    Path(path).write_text(json.dumps(report(snapshot), indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def _labels(**labels):
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+    return ",".join(f'{key}="{value}"' for key, value in escaped.items())
+
+
+# node_exporter textfile collector format; per-file totals are left to the JSON output
+def write_prometheus(path: Path, snapshot=None, prefix: str = "evaluation"):
+    snapshot = snapshot if snapshot is not None else metrics.snapshot()
+    lines = [
+        f"# HELP {prefix}_call_seconds Latency of instrumented calls.",
+        f"# TYPE {prefix}_call_seconds histogram",
+    ]
+    for (stage, name), (buckets, seconds, calls) in sorted(snapshot["timers"].items(), key=lambda item: str(item[0])):
+        cumulative = 0
+        for bound, bucket_count in zip(list(BUCKETS) + ["+Inf"], buckets):
+            cumulative += bucket_count
+            lines.append(f"{prefix}_call_seconds_bucket{{{_labels(stage=stage or '-', name=name, le=bound)}}} {cumulative}")
+        lines.append(f"{prefix}_call_seconds_sum{{{_labels(stage=stage or '-', name=name)}}} {seconds}")
+        lines.append(f"{prefix}_call_seconds_count{{{_labels(stage=stage or '-', name=name)}}} {calls}")
+    lines += [
+        f"# HELP {prefix}_total Counters of the evaluation run (bytes read, API tokens, ...).",
+        f"# TYPE {prefix}_total counter",
+    ]
+    for (stage, name), value in sorted(snapshot["counters"].items(), key=lambda item: str(item[0])):
+        lines.append(f"{prefix}_total{{{_labels(stage=stage or '-', name=name)}}} {value}")
+
+    # written next to the target and renamed, so the collector never reads a partial file
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+# cProfile covers the calling thread only; pyinstrument (imported here) samples the calling thread
+# and its async tasks. The output is a .prof file for pstats/snakeviz, or an HTML page for pyinstrument.
+@contextmanager
+def profile(path: Path = None, profiler: str = "cprofile"):
+    if path is None:
+        yield
+        return
+    if profiler == "cprofile":
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(str(path))
+    elif profiler == "pyinstrument":
+        from pyinstrument import Profiler
+        sampler = Profiler(async_mode="enabled")
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            Path(path).write_text(sampler.output_html(), encoding="utf-8")
+    else:
+        raise ValueError(f"Unknown profiler: {profiler}")
@@ -1,10 +1,12 @@
 from pathlib import Path
 import os
-import torch
-from ErrorRateCalculation_sequenceMatching import calTechTermsError, calDiffErros
-from ErrorRateCalculation_jiwer import calculate_diff_errors
-
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+import argparse
+from ErrorRateCalculation_sequenceMatching import evaluateTechTermsError, clean_text_transcription
+from ErrorRateCalculation_levenshtein import shared_vocabulary
+from ErrorRateCalculation_terms import TermDictionary
+from ErrorRateCalculation_parallel import runDiffErros
+from report_sink import ReportSink
+import instrumentation
 
 # need to change the location based on user's folders' addresses
 
@@ -28,28 +30,26 @@ new_transcription_folder_QADentalTool_En = Path(
     )
 '''
 
-if __name__ == "__main__":
-    
+
+def run_evaluation(args):
+
     transcription_language = "fi" #or en
+    wer_matcher = "levenshtein" #or difflib
+
+    # everything is buffered and written once per stage
+    report = ReportSink(errorReport, args.report_formats)
 
     #For Finnish Clips
     # Spelling mistakes and standard Erros
     
     print("Starting WER and Spelling Error Calculation for Finnish Clips", flush=True)
 
-    total_GTwords = 0
-    total_Transcriptionwords = 0
-    total_wer = 0
-    total_deleted = 0
-    total_added = 0
-    total_spellingError = 0
-    
     GTfiles_list_folder = GroundTruth_Transcription_FOLDER #change for english
     transcriptionFiles_Path = new_transcription_folder_QADentalTool_Fi #change for english
 
-    with open(errorReport, "a", encoding="utf-8") as f:
-        f.write("\n\n\nFinnish Clips - ***** Model WER & Spelling Mistakes\n\n")
+    report.section("\n\n\nFinnish Clips - ***** Model WER & Spelling Mistakes\n\n")
 
+    file_pairs = []
     for file in os.listdir(GTfiles_list_folder):
         if file.endswith(".txt"):
             gtFile = os.path.join(GTfiles_list_folder, file)
@@ -57,36 +57,37 @@ if __name__ == "__main__":
             if not os.path.exists(transcriptionFile):
                 print(f"!!!! Missing transcription file: {transcriptionFile}")
                 continue
-
-            try:
-                _GT_words, _Transcription_words, wer, deleted_rate, added_rate, SpellingError_rate = calDiffErros(
-                    gtFile, transcriptionFile, errorReport, transcription_language
-                )
-                '''
-                _GT_words, _Transcription_words, wer, deleted_rate, added_rate, SpellingError_rate = calculate_diff_errors(
-                    gtFile, transcriptionFile, errorReport, transcription_language
-                )
-                '''
-                total_GTwords += _GT_words
-                total_Transcriptionwords += _Transcription_words
-                total_wer += wer * _GT_words / 100
-                total_deleted += deleted_rate * _GT_words / 100
-                total_added += added_rate * _GT_words / 100
-                total_spellingError += SpellingError_rate * _Transcription_words / 100
-
-            except Exception as e:
-                print(f"Error processing {file}: {e}")
+            file_pairs.append((file, gtFile, transcriptionFile))
+
+    with instrumentation.stage_scope("wer"):
+        totals = runDiffErros(
+            file_pairs, report, transcription_language, wer_matcher,
+            workers=args.workers, chunksize=args.chunksize, spell_cache_path=args.spell_cache,
+            streaming=args.streaming, alignment=args.alignment, batched=args.batched
+        )
+    total_GTwords = totals["gt_words"]
+    total_Transcriptionwords = totals["transcription_words"]
+    total_wer = totals["wer"]
+    total_deleted = totals["deleted"]
+    total_added = totals["added"]
+    total_spellingError = totals["spellingError"]
 
     print("avg", total_wer/total_GTwords)
    
     # Report average
-    with open(errorReport, "a", encoding="utf-8") as f:
-        f.write("AVERAGES FOR WER & SPELLING\n")
-        f.write(f"Average WER: {total_wer/total_GTwords*100:.2f}%\n")
-        f.write(f"Average Deleted Rate: {total_deleted/total_GTwords*100:.2f}%\n")
-        f.write(f"Average Added Rate: {total_added/total_GTwords*100:.2f}%\n")
-        f.write(f"Average Spelling Errors: {total_spellingError/total_Transcriptionwords*100:.2f}%\n")
-        f.write("="*40 + "\n")
+    report.add({
+        "kind": "wer_average",
+        "gt_words": total_GTwords,
+        "transcription_words": total_Transcriptionwords,
+        "wer": total_wer/total_GTwords*100,
+        "deleted_rate": total_deleted/total_GTwords*100,
+        "added_rate": total_added/total_GTwords*100,
+        "spelling_rate": total_spellingError/total_Transcriptionwords*100,
+    })
+    if args.alignment:
+        for record in totals["confusions"].records(args.confusion_top):
+            report.add(record)
+    report.flush()
     print("\nAll standard eror calculataion done")
 
 
@@ -98,8 +99,10 @@ if __name__ == "__main__":
     total_GTterms = 0
     GTterms_not_found = 0
 
-    with open(errorReport, "a", encoding="utf-8") as f:
-        f.write("\n\nFinnish Clips - **** Technical Terms Error Rate\n\n")
+    # all GT term lists are parsed once, files then refer to their terms by ID
+    term_dictionary = TermDictionary.from_folder(GTterms_list_folder, clean_text_transcription, shared_vocabulary)
+
+    report.section("\n\nFinnish Clips - **** Technical Terms Error Rate\n\n")
 
     for file in os.listdir(GTterms_list_folder):
         if file.endswith(".txt"):
@@ -110,19 +113,59 @@ if __name__ == "__main__":
                 continue
 
             try:
-                gt_count, missing_count = calTechTermsError(gt_terms_file, trans_terms_file, errorReport)
-                total_GTterms += gt_count
-                GTterms_not_found += missing_count
+                with instrumentation.stage_scope("techterms"), instrumentation.file_scope(file):
+                    record = report.add(evaluateTechTermsError(
+                        gt_terms_file, trans_terms_file, term_dictionary=term_dictionary
+                    ))
+                total_GTterms += record["total_terms"]
+                GTterms_not_found += record["not_found_count"]
             except Exception as e:
                 print(f"Error processing {file}: {e}")
 
     # Report average
-    with open(errorReport, "a", encoding="utf-8") as f:
-        if total_GTterms > 0:
-            f.write(f"Total Technical Term: {total_GTterms}\n")
-            f.write(f"Average Not found Technical Terms Error Rate: {GTterms_not_found/total_GTterms*100:.2f}%\n")
-        else:
-            f.write("Average Not found Technical Terms Error Rate: N/A\n")
-        f.write("="*40 + "\n")
+    report.add({
+        "kind": "techterms_average",
+        "total_terms": total_GTterms,
+        "not_found_count": GTterms_not_found,
+        "not_found_rate": GTterms_not_found/total_GTterms*100 if total_GTterms > 0 else None,
+        "distinct_terms": len(term_dictionary),
+        "most_missed": term_dictionary.most_missed(20),
+    })
+    report.flush()
 
     print("\nTechnical terms error rate calculation done")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="processes for the WER/spelling stage")
+    parser.add_argument("--chunksize", type=int, default=16, help="files per worker task")
+    parser.add_argument("--spell-cache", type=Path, default=None, help="SQLite file for spell verdicts shared across runs")
+    parser.add_argument("--streaming", action="store_true", help="read and align long transcripts in segments")
+    parser.add_argument("--batched", action="store_true",
+                        help="align the files in NumPy batches, one share per worker (not with --streaming or --alignment)")
+    parser.add_argument("--alignment", action="store_true",
+                        help="keep each file's alignment and report the most frequent substitutions, deletions and insertions")
+    parser.add_argument("--confusion-top", type=int, default=50, help="rows per confusion table")
+    parser.add_argument("--report-formats", nargs="+", default=["text"], help="text, jsonl, csv and/or parquet")
+    parser.add_argument("--metrics-json", type=Path, default=None, help="write instrumentation metrics as JSON")
+    parser.add_argument("--metrics-prom", type=Path, default=None, help="write them as a Prometheus textfile")
+    parser.add_argument("--profile", type=Path, default=None, help="write a profile of the whole run")
+    parser.add_argument("--profiler", default="cprofile", choices=("cprofile", "pyinstrument"))
+    args = parser.parse_args()
+    if args.batched and (args.streaming or args.alignment):
+        parser.error("--batched cannot be combined with --streaming or --alignment")
+
+    # timers and counters only run when a metrics output is asked for
+    instrumentation.enable(args.metrics_json is not None or args.metrics_prom is not None)
+
+    # the profile and the metrics are written even if a stage fails
+    try:
+        with instrumentation.profile(args.profile, args.profiler):
+            run_evaluation(args)
+    finally:
+        if args.metrics_json is not None:
+            instrumentation.write_json(args.metrics_json)
+        if args.metrics_prom is not None:
+            instrumentation.write_prometheus(args.metrics_prom)
@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from report_sink import register_text_format
+import instrumentation
+
+# Stage graph for evaluate.py. Every stage is a function run(index, workers) with the names of the
+# stages it needs. Stages whose requirements are done run concurrently in threads; the stage itself
+# decides how to use its `workers` (processes for WER/spelling, requests in flight for the LLM stages).
+# Requirements outside the selected stages are assumed done by an earlier run (e.g. predictions on disk).
+# Instrumentation metrics are labelled with the stage; with profile_dir each stage also writes its own profile.
+
+
+# Each folder is scanned once per run and the result is shared by all stages;
+# files are looked up and paired by stem.
+class FileIndex:
+
+    def __init__(self):
+        self._scans = {}
+        self._lock = threading.Lock()
+
+    # {suffix: {stem: path}} of the regular files directly in folder
+    def scan(self, folder: Path):
+        folder = Path(folder)
+        with self._lock:
+            if folder not in self._scans:
+                entries = {}
+                if folder.is_dir():
+                    with os.scandir(folder) as it:
+                        for entry in it:
+                            if entry.is_file():
+                                path = Path(entry.path)
+                                entries.setdefault(path.suffix, {})[path.stem] = path
+                self._scans[folder] = entries
+            return self._scans[folder]
+
+    # for folders a stage writes into (e.g. the extraction output)
+    def invalidate(self, folder: Path):
+        with self._lock:
+            self._scans.pop(Path(folder), None)
+
+    def files(self, folder: Path, suffix: str = ".txt"):
+        return dict(sorted(self.scan(folder).get(suffix, {}).items()))
+
+    # (left, right) paths with the same key in both folders, plus the left keys without a partner
+    # key maps a stem to the pairing key, e.g. to drop the "_form" of extraction outputs
+    def pair(self, left_folder: Path, right_folder: Path, left_suffix: str = ".txt", right_suffix: str = ".txt",
+             key=None):
+        key = key or (lambda stem: stem)
+        left = {key(stem): path for stem, path in self.files(left_folder, left_suffix).items()}
+        right = {key(stem): path for stem, path in self.files(right_folder, right_suffix).items()}
+        pairs = [(left[name], right[name]) for name in sorted(left) if name in right]
+        missing = [left[name] for name in sorted(left) if name not in right]
+        return pairs, missing
+
+
+class Stage:
+
+    def __init__(self, name: str, run, requires=(), workers: int = None, inputs=()):
+        self.name = name
+        self.run = run
+        self.requires = tuple(requires)
+        self.workers = workers  # default pool size; None for stages without a pool
+        self.inputs = tuple(inputs)  # option names that must be set for the stage to run
+
+
+# stage names in an order where every stage comes after the selected stages it requires
+def stage_order(stages: dict, selected):
+    selected = list(selected)
+    order = []
+    visiting = set()
+
+    def visit(name, path):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError("Stage dependency cycle: " + " -> ".join(path + [name]))
+        visiting.add(name)
+        for required in stages[name].requires:
+            if required in selected:
+                visit(required, path + [name])
+        visiting.discard(name)
+        order.append(name)
+
+    for name in selected:
+        visit(name, [])
+    return order
+
+
+# runs the selected stages, at most `parallel` at once; a failed stage skips the stages that require it
+# returns one stage_timing record per stage, in stage_order
+def run_stages(stages: dict, selected, index: FileIndex, workers: dict = None, parallel: int = None,
+               profile_dir: Path = None, profiler: str = "cprofile"):
+
+    order = stage_order(stages, selected)
+    workers = workers or {}
+    records = {}
+    started = time.perf_counter()
+
+    def run(name):
+        stage = stages[name]
+        stage_workers = workers.get(name, stage.workers)
+        start = time.perf_counter()
+        print(f"[{name}] started" + (f" ({stage_workers} workers)" if stage_workers else ""), flush=True)
+        profile_path = None
+        if profile_dir is not None:
+            profile_path = Path(profile_dir) / f"{name}.{'prof' if profiler == 'cprofile' else 'html'}"
+        with instrumentation.stage_scope(name), instrumentation.profile(profile_path, profiler):
+            stage.run(index, stage_workers)
+        return start, time.perf_counter(), stage_workers
+
+    pending = list(order)
+    running = {}
+    with ThreadPoolExecutor(max_workers=parallel or max(1, len(order))) as executor:
+        while pending or running:
+            for name in list(pending):
+                required = [other for other in stages[name].requires if other in order]
+                if any(records.get(other, {}).get("status") in ("failed", "skipped") for other in required):
+                    pending.remove(name)
+                    records[name] = {"kind": "stage_timing", "stage": name, "status": "skipped",
+                                     "workers": workers.get(name, stages[name].workers),
+                                     "start": None, "seconds": None, "error": "required stage did not finish"}
+                    print(f"[{name}] skipped")
+                elif all(records.get(other, {}).get("status") == "ok" for other in required):
+                    pending.remove(name)
+                    running[executor.submit(run, name)] = name
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    start, end, stage_workers = future.result()
+                    records[name] = {"kind": "stage_timing", "stage": name, "status": "ok", "workers": stage_workers,
+                                     "start": start - started, "seconds": end - start, "error": None}
+                    print(f"[{name}] done in {end - start:.2f}s", flush=True)
+                except Exception as e:
+                    records[name] = {"kind": "stage_timing", "stage": name, "status": "failed",
+                                     "workers": workers.get(name, stages[name].workers),
+                                     "start": None, "seconds": None, "error": f"{type(e).__name__}: {e}"}
+                    print(f"[{name}] failed: {type(e).__name__}: {e}", flush=True)
+
+    return [records[name] for name in order]
+
+
+def format_stage_timing(record):
+    if record["status"] != "ok":
+        return f"{record['stage']:<12} {record['status']:<8} {record['error']}\n"
+    workers = record["workers"] if record["workers"] else "-"
+    return (
+        f"{record['stage']:<12} {record['status']:<8} start {record['start']:8.2f}s  "
+        f"took {record['seconds']:8.2f}s  workers {workers}\n"
+    )
+
+
+register_text_format("stage_timing", format_stage_timing)
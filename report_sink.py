@@ -0,0 +1,168 @@
+from pathlib import Path
+import csv
+import json
+
+# Evaluation functions return result records (dicts with a "kind" key).
+# A ReportSink buffers them and writes every configured format once on flush().
+
+# kind -> function(record) -> text block, as in the original .txt reports
+TEXT_FORMATTERS = {
+    "section": lambda record: record["title"],
+}
+
+# kinds that only lay out the text report (headings); the CSV and Parquet tables leave them out
+TEXT_ONLY_KINDS = {"section"}
+
+
+def register_text_format(kind: str, formatter, text_only: bool = False):
+    TEXT_FORMATTERS[kind] = formatter
+    if text_only:
+        TEXT_ONLY_KINDS.add(kind)
+
+
+def _plain(value):
+    # numpy scalars and paths in records
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _rows_by_kind(records):
+    rows = {}
+    for record in records:
+        if record.get("kind") in TEXT_ONLY_KINDS:
+            continue
+        row = {}
+        for key, value in record.items():
+            if isinstance(value, (list, tuple, set)):
+                value = "; ".join(str(item) for item in value)
+            elif isinstance(value, dict):
+                value = json.dumps(value, ensure_ascii=False, default=_plain)
+            elif hasattr(value, "item"):
+                value = value.item()
+            row[key] = value
+        rows.setdefault(record.get("kind", "record"), []).append(row)
+    return rows
+
+
+def write_text(records, path: Path, sink):
+    blocks = []
+    for record in records:
+        formatter = sink.text_formatters.get(record.get("kind")) or TEXT_FORMATTERS.get(record.get("kind"))
+        if formatter is not None:
+            blocks.append(formatter(record))
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(blocks))
+
+
+def write_jsonl(records, path: Path, sink):
+    with open(path.with_suffix(".jsonl"), "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=_plain) + "\n")
+
+
+def _columns(rows, columns=()):
+    return list(dict.fromkeys([*columns, *(key for row in rows for key in row)]))
+
+
+# one table per record kind: <report>_<kind>.csv
+# appending keeps the existing header; columns it does not have yet are added by rewriting the file
+def write_csv(records, path: Path, sink):
+    for kind, rows in _rows_by_kind(records).items():
+        table_path = path.with_name(f"{path.stem}_{kind}.csv")
+        header = []
+        if table_path.exists():
+            with open(table_path, "r", encoding="utf-8", newline="") as f:
+                header = next(csv.reader(f), [])
+        columns = _columns(rows, header)
+
+        if header and columns != header:
+            with open(table_path, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.DictReader(f)) + rows
+            header = []
+        with open(table_path, "a" if header else "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            if not header:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+# explicit schema over every column of the rows, so columns of later records are kept;
+# columns of an existing file keep their type
+def _parquet_schema(rows, existing=None):
+    import pyarrow as pa
+
+    fields = []
+    for column in _columns(rows, existing.names if existing is not None else ()):
+        field_type = existing.field(column).type if existing is not None and column in existing.names else None
+        if field_type is None or pa.types.is_null(field_type):
+            field_type = pa.array([row.get(column) for row in rows]).type
+        fields.append(pa.field(column, field_type))
+    return pa.schema(fields)
+
+
+# one table per record kind: <report>_<kind>.parquet (needs pyarrow)
+def write_parquet(records, path: Path, sink):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for kind, rows in _rows_by_kind(records).items():
+        table_path = path.with_name(f"{path.stem}_{kind}.parquet")
+        existing = None
+        if table_path.exists():
+            existing_table = pq.read_table(table_path)
+            existing = existing_table.schema
+            rows = existing_table.to_pylist() + rows
+        schema = _parquet_schema(rows, existing)
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), table_path)
+
+
+WRITERS = {
+    "text": write_text,
+    "jsonl": write_jsonl,
+    "csv": write_csv,
+    "parquet": write_parquet,
+}
+
+
+def register_writer(name: str, writer):
+    WRITERS[name] = writer
+
+
+class ReportSink:
+
+    def __init__(self, path: Path, formats=("text",), text_formatters: dict = None):
+        self.path = Path(path)
+        self.formats = tuple(formats)
+        self.text_formatters = text_formatters or {}
+        self.records = []
+        for name in self.formats:
+            if name not in WRITERS:
+                raise ValueError(f"Unknown report format: {name}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def add(self, record):
+        self.records.append(record)
+        return record
+
+    def section(self, title: str):
+        return self.add({"kind": "section", "title": title})
+
+    def flush(self):
+        if not self.records:
+            return
+        for name in self.formats:
+            WRITERS[name](self.records, self.path, self)
+        self.records = []
+
+
+# writes one record as text right away (for the single-file helper functions)
+def append_record(record, path: Path, text_formatters: dict = None):
+    sink = ReportSink(path, ("text",), text_formatters)
+    sink.add(record)
+    sink.flush()
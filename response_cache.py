@@ -0,0 +1,107 @@
+from pathlib import Path
+import gzip
+import hashlib
+import json
+import os
+import time
+
+# Cache of raw LLM replies, keyed by (model, prompt hash, max_output_tokens).
+# Any object with get(key) -> entry or None and put(key, entry) can be used as a backend;
+# DiskResponseCache keeps one gzip-compressed JSON file per entry under <directory>/<key[:2]>/.
+# When the total size passes max_bytes the least recently used files are deleted.
+
+
+def prompt_hash(prompt: str):
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def response_key(model: str, prompt: str, max_output_tokens: int):
+    return hashlib.sha256(f"{model}\0{prompt_hash(prompt)}\0{max_output_tokens}".encode("utf-8")).hexdigest()
+
+
+def make_entry(model: str, prompt: str, max_output_tokens: int, reply: str, **extra):
+    return {
+        "model": model,
+        "prompt_hash": prompt_hash(prompt),
+        "max_output_tokens": max_output_tokens,
+        "reply": reply,
+        "created": time.time(),
+        **extra,
+    }
+
+
+class MemoryResponseCache:
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def put(self, key: str, entry: dict):
+        self.entries[key] = entry
+
+
+class DiskResponseCache:
+
+    def __init__(self, directory: Path, max_bytes: int = 256 * 2**20):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+        # path -> (size, last used); file mtimes carry the LRU order between runs
+        self.files = {}
+        for path in self.directory.glob("*/*.json.gz"):
+            stat = path.stat()
+            self.files[path] = (stat.st_size, stat.st_mtime)
+        self.total_bytes = sum(size for size, _ in self.files.values())
+
+    def __len__(self):
+        return len(self.files)
+
+    def _path(self, key: str):
+        return self.directory / key[:2] / f"{key}.json.gz"
+
+    def get(self, key: str):
+        path = self._path(key)
+        if path not in self.files:
+            return None
+        try:
+            entry = json.loads(gzip.decompress(path.read_bytes()).decode("utf-8"))
+        except (OSError, ValueError):
+            self._remove(path)
+            return None
+        now = time.time()
+        os.utime(path, (now, now))
+        self.files[path] = (self.files[path][0], now)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = gzip.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"))
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+        old_size = self.files.get(path, (0, 0))[0]
+        self.files[path] = (len(data), time.time())
+        self.total_bytes += len(data) - old_size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _remove(self, path: Path):
+        size, _ = self.files.pop(path)
+        self.total_bytes -= size
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    # drops the oldest entries until the cache is back under 90% of max_bytes
+    def _evict(self):
+        target = self.max_bytes * 0.9
+        for path in sorted(self.files, key=lambda p: self.files[p][1]):
+            if self.total_bytes <= target:
+                break
+            self._remove(path)
@@ -0,0 +1,89 @@
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+import time
+
+# Remembers what each pipeline stage has already done, so a re-run only redoes new, changed or failed inputs.
+# One row per (stage, key): hash of the input files, model, prompt/evaluator version, status and the stored output.
+# Stages: "extract" (one transcript -> *_form.json), "field_match", "custom_eval", "judge" (one GT/prediction pair).
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+
+
+def file_hash(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(Path(path).read_bytes())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class RunManifest:
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(self.path))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "stage TEXT, key TEXT, input_hash TEXT, model TEXT, version TEXT, "
+            "status TEXT, output TEXT, updated REAL, PRIMARY KEY (stage, key))"
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entry(self, stage: str, key: str):
+        row = self.connection.execute(
+            "SELECT input_hash, model, version, status, output, updated FROM entries WHERE stage = ? AND key = ?",
+            (stage, key),
+        ).fetchone()
+        if row is None:
+            return None
+        input_hash, model, version, status, output, updated = row
+        return {
+            "input_hash": input_hash, "model": model, "version": version, "status": status,
+            "output": json.loads(output) if output is not None else None, "updated": updated,
+        }
+
+    # True if the stage already succeeded on exactly this input with the same model and version
+    def is_current(self, stage: str, key: str, input_hash: str, model: str, version: str):
+        entry = self.entry(stage, key)
+        return (
+            entry is not None
+            and entry["status"] == STATUS_OK
+            and entry["input_hash"] == input_hash
+            and entry["model"] == model
+            and entry["version"] == version
+        )
+
+    # stored output of an up-to-date entry, otherwise None
+    def reusable(self, stage: str, key: str, input_hash: str, model: str, version: str):
+        if not self.is_current(stage, key, input_hash, model, version):
+            return None
+        return self.entry(stage, key)["output"]
+
+    # committed right away, so a crash loses at most the input in progress
+    def record(self, stage: str, key: str, input_hash: str, model: str, version: str,
+               status: str = STATUS_OK, output=None):
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (stage, key, input_hash, model, version, status,
+                 json.dumps(output, ensure_ascii=False) if output is not None else None, time.time()),
+            )
+
+    def status_counts(self, stage: str):
+        rows = self.connection.execute(
+            "SELECT status, COUNT(*) FROM entries WHERE stage = ? GROUP BY status", (stage,)
+        ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,81 @@
+import sys
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT, ROOT / "InformationExtractionEvaluation", ROOT / "IE_Eval_JudgeLLM"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+
+# Local stand-in for the OpenAI HTTP API, for tests that run the real openai client.
+# A test sets routes[path] = function(body) -> (status, payload), e.g. routes["/embeddings"];
+# a None status drops the connection without a reply. Every request is kept in requests as (path, body).
+class StubAPIServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubAPIHandler)
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def paths(self):
+        with self.lock:
+            return [path for path, _body in self.requests]
+
+
+class StubAPIHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        path = self.path.removeprefix("/v1")
+        with self.server.lock:
+            self.server.requests.append((path, body))
+        route = self.server.routes.get(path)
+        status, payload = route(body) if route is not None else (404, {"error": {"message": f"no route {path}"}})
+        if status is None:
+            self.close_connection = True
+            return
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up first (a request timeout)
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def api_error(status: int, message: str = "error"):
+    return status, {"error": {"message": message, "type": "stub_error", "code": None}}
+
+
+# a running StubAPIServer, with OPENAI_BASE_URL and OPENAI_API_KEY pointing the openai client at it
+@pytest.fixture
+def openai_stub(monkeypatch):
+    pytest.importorskip("openai")
+    server = StubAPIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
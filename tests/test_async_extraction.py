@@ -0,0 +1,202 @@
+import re
+import json
+import time
+import asyncio
+import threading
+import pytest
+import IE
+from IE import a_run_field_extraction, RateLimiter, FIELDS
+from run_manifest import RunManifest, STATUS_OK, STATUS_FAILED
+from conftest import api_error
+
+_TEXT = re.compile(r'"""\s*(.*?)\s*"""', re.S)
+
+
+def _response(text, model):
+    return {
+        "id": "resp_stub", "object": "response", "created_at": 0, "model": model, "status": "completed",
+        "output": [{
+            "type": "message", "id": "msg_stub", "role": "assistant", "status": "completed",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True, "tool_choice": "auto", "tools": [],
+        "usage": {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15,
+                  "input_tokens_details": {"cached_tokens": 0}, "output_tokens_details": {"reasoning_tokens": 0}},
+    }
+
+
+# /v1/responses of the stub server: replies with the transcript's "field: value" line as JSON.
+# failures[name] are the replies to the first requests for that transcript: (status, payload), or a number of
+# seconds to wait before answering normally; delays[name] is how long its normal reply takes.
+class ResponsesRoute:
+
+    def __init__(self):
+        self.failures = {}
+        self.delays = {}
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, body):
+        name = _TEXT.search(body["input"]).group(1).split(":", 1)[1].strip()
+        with self.lock:
+            self.calls.append(name)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            failure = self.failures[name].pop(0) if self.failures.get(name) else None
+        try:
+            if isinstance(failure, tuple):
+                return failure
+            time.sleep(failure if failure is not None else self.delays.get(name, 0.001))
+            return 200, _response(json.dumps({"Tarkkailijan nimi": name}), body["model"])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def responses(openai_stub):
+    route = ResponsesRoute()
+    openai_stub.routes["/responses"] = route
+    route.base_url = openai_stub.base_url
+    return route
+
+
+@pytest.fixture
+def backoff(monkeypatch):
+    # the jitter factors asked for are recorded; each backoff then lasts 10 ms times 2 ** attempt
+    jitter = []
+
+    def uniform(low, high):
+        jitter.append((low, high))
+        return 0.01
+
+    monkeypatch.setattr(IE.random, "uniform", uniform)
+    return jitter
+
+
+def _transcripts(tmp_path, names):
+    input_dir = tmp_path / "in"
+    input_dir.mkdir()
+    for name in names:
+        (input_dir / f"{name}.txt").write_text(f"Tarkkailijan nimi: {name}\n", encoding="utf-8")
+    return input_dir
+
+
+def _run(input_dir, output_dir, responses, **options):
+    asyncio.run(a_run_field_extraction(input_dir, output_dir, "model", "sk-test", base_url=responses.base_url,
+                                       **options))
+
+
+def test_every_output_gets_its_own_reply_whatever_the_completion_order(tmp_path, responses):
+    names = [f"file{i}" for i in range(8)]
+    responses.delays = {name: 0.01 * (8 - i) for i, name in enumerate(names)}
+    input_dir = _transcripts(tmp_path, names)
+
+    _run(input_dir, tmp_path / "out", responses, concurrency=8)
+
+    assert sorted(responses.calls) == names
+    for name in names:
+        output = json.loads((tmp_path / "out" / f"{name}_form.json").read_text(encoding="utf-8"))
+        assert output["Tarkkailijan nimi"] == name
+        assert set(output) == set(FIELDS)
+
+
+def test_concurrency_is_bounded_by_the_semaphore(tmp_path, responses):
+    names = [f"file{i}" for i in range(10)]
+    responses.delays = {name: 0.05 for name in names}
+
+    _run(_transcripts(tmp_path, names), tmp_path / "out", responses, concurrency=3)
+
+    assert len(responses.calls) == 10
+    assert responses.max_in_flight == 3
+
+
+def test_rate_limits_server_errors_and_timeouts_are_retried_with_jitter(tmp_path, responses, backoff):
+    responses.failures = {
+        "a": [api_error(429), api_error(503)],
+        "b": [1.0],  # longer than the request timeout
+        "c": [(None, None)],  # connection dropped
+    }
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+
+    _run(_transcripts(tmp_path, ["a", "b", "c", "d"]), tmp_path / "out", responses, concurrency=4, timeout=0.3,
+         manifest=manifest)
+
+    assert responses.calls.count("a") == 3
+    assert responses.calls.count("b") == 2
+    assert responses.calls.count("c") == 2
+    assert responses.calls.count("d") == 1
+    assert backoff == [(0.5, 1.0)] * 4
+    for name in ("a", "b", "c", "d"):
+        assert json.loads((tmp_path / "out" / f"{name}_form.json").read_text())["Tarkkailijan nimi"] == name
+        assert manifest.entry("extract", f"{name}.txt")["status"] == STATUS_OK
+
+
+def test_a_file_backing_off_does_not_hold_a_concurrency_slot(tmp_path, responses, backoff):
+    responses.failures = {"a": [api_error(429)] * 2}
+
+    _run(_transcripts(tmp_path, ["a", "b", "c"]), tmp_path / "out", responses, concurrency=1)
+
+    # b and c, already waiting for the slot, are sent while a waits for its retry
+    assert responses.calls == ["a", "b", "c", "a", "a"]
+
+
+def test_a_file_that_keeps_failing_is_saved_empty_and_marked_failed(tmp_path, responses, backoff):
+    responses.failures = {"a": [api_error(429)] * 10}
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+
+    _run(_transcripts(tmp_path, ["a", "b"]), tmp_path / "out", responses, max_retries=2, manifest=manifest)
+
+    assert responses.calls.count("a") == 3
+    assert (tmp_path / "out" / "a_form.json").read_text() == "{}"
+    assert manifest.entry("extract", "a.txt")["status"] == STATUS_FAILED
+    assert manifest.entry("extract", "b.txt")["status"] == STATUS_OK
+
+
+def test_other_errors_are_not_retried(tmp_path, responses, backoff):
+    responses.failures = {"a": [api_error(400, "bad request")]}
+
+    _run(_transcripts(tmp_path, ["a"]), tmp_path / "out", responses)
+
+    assert responses.calls == ["a"]
+    assert backoff == []
+
+
+def test_only_failed_files_are_extracted_again(tmp_path, responses, backoff):
+    responses.failures = {"a": [api_error(429)] * 2}
+    manifest = RunManifest(tmp_path / "manifest.sqlite")
+    input_dir = _transcripts(tmp_path, ["a", "b"])
+
+    _run(input_dir, tmp_path / "out", responses, max_retries=1, manifest=manifest)
+    _run(input_dir, tmp_path / "out", responses, max_retries=1, manifest=manifest)
+
+    assert responses.calls.count("b") == 1
+    assert responses.calls.count("a") == 3
+    assert manifest.entry("extract", "a.txt")["status"] == STATUS_OK
+
+
+def test_rate_limiter_waits_for_the_token_budget():
+
+    async def acquire_all():
+        limiter = RateLimiter(tokens_per_minute=6000)
+        await limiter.acquire(6000)
+        start = time.monotonic()
+        await limiter.acquire(20)  # the bucket refills at 100 tokens per second
+        return time.monotonic() - start
+
+    assert 0.15 <= asyncio.run(acquire_all()) < 1.0
+
+
+def test_rate_limiter_spaces_requests():
+
+    async def acquire_all():
+        limiter = RateLimiter(requests_per_minute=600)
+        limiter.request_budget = 0
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire(1)
+        return time.monotonic() - start
+
+    assert 0.25 <= asyncio.run(acquire_all()) < 1.0
@@ -0,0 +1,81 @@
+import random
+from array import array
+import pytest
+from ErrorRateCalculation_corpus import compute_corpus_wer, corpus_counts
+from ErrorRateCalculation_levenshtein import levenshtein_counts, Vocabulary
+from ErrorRateCalculation_parallel import runDiffErros
+from report_sink import ReportSink
+
+WORDS = "auki kiinni hammas ien paikka kruunu juuri kanava puudutus röntgen".split()
+
+
+def _random_encoded(seed, count, max_words=40):
+    rnd = random.Random(seed)
+    encoded = []
+    for _ in range(count):
+        vocabulary = rnd.randint(1, 8)
+        ids1 = array("I", [rnd.randrange(vocabulary) for _ in range(rnd.randint(0, max_words))])
+        ids2 = array("I", [rnd.randrange(vocabulary) for _ in range(rnd.randint(0, max_words))])
+        encoded.append((ids1, ids2))
+    return encoded
+
+
+@pytest.mark.parametrize("max_batch_cells", [2 ** 26, 4000, 200])
+def test_batched_counts_match_levenshtein_counts(max_batch_cells):
+    # the smaller limits split the pairs over many batches and send the largest ones to the single-pair engine
+    encoded = _random_encoded(max_batch_cells, 600)
+
+    counts = corpus_counts(encoded, max_batch_cells)
+
+    assert counts == [levenshtein_counts(ids1, ids2) for ids1, ids2 in encoded]
+
+
+def test_corpus_totals_are_micro_averaged():
+    pairs = [("a b c d", "a x c d e"), ("a b", ""), ("", "a"), ("sama teksti", "sama teksti")]
+
+    per_file, totals = compute_corpus_wer(pairs, Vocabulary())
+
+    assert [(f["substitutions"], f["deletions"], f["insertions"]) for f in per_file] == [
+        (1, 0, 1), (0, 2, 0), (0, 0, 1), (0, 0, 0)
+    ]
+    assert per_file[0]["wer"] == 50
+    assert totals["gt_words"] == 8
+    assert (totals["substitutions"], totals["deletions"], totals["insertions"]) == (1, 2, 2)
+    assert totals["wer"] == pytest.approx(5 / 8 * 100)
+
+
+def _write_corpus(tmp_path, n_files):
+    rnd = random.Random(3)
+    (tmp_path / "gt").mkdir()
+    (tmp_path / "tr").mkdir()
+    file_pairs = []
+    for k in range(n_files):
+        gt = [rnd.choice(WORDS) for _ in range(rnd.randint(0, 60))]
+        tr = [word if rnd.random() < 0.8 else rnd.choice(WORDS) for word in gt if rnd.random() < 0.9]
+        tr[rnd.randint(0, len(tr)):0] = [rnd.choice(WORDS) for _ in range(rnd.randint(0, 3))]
+        name = f"clip{k}.txt"
+        (tmp_path / "gt" / name).write_text(" ".join(gt), encoding="utf-8")
+        (tmp_path / "tr" / name).write_text(" ".join(tr), encoding="utf-8")
+        file_pairs.append((name, tmp_path / "gt" / name, tmp_path / "tr" / name))
+    return file_pairs
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batched_wer_stage_gives_the_same_records_and_totals(tmp_path, workers):
+    file_pairs = _write_corpus(tmp_path, 25)
+    # a missing transcription only fails its own file
+    file_pairs.append(("missing.txt", tmp_path / "gt" / "clip0.txt", tmp_path / "tr" / "missing.txt"))
+
+    reports = {}
+    for batched in (False, True):
+        report = ReportSink(tmp_path / f"report_{batched}.txt")
+        totals = runDiffErros(file_pairs, report, spelling=False, workers=workers, batched=batched)
+        reports[batched] = (report.records, totals)
+
+    assert reports[True] == reports[False]
+    assert len(reports[True][0]) == 25
+
+
+def test_batched_wer_needs_the_levenshtein_matcher(tmp_path):
+    with pytest.raises(ValueError):
+        runDiffErros([], ReportSink(tmp_path / "report.txt"), matcher="difflib", batched=True)
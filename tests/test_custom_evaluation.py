@@ -0,0 +1,124 @@
+import json
+import base64
+import hashlib
+import numpy as np
+import pytest
+import Custom_evaluation
+from Custom_evaluation import C_evaluate_records, SEMANTIC_FIELDS
+from embedding_backends import OpenAIEmbeddingBackend
+from conftest import api_error
+
+
+def _vector(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [1.0] + [byte / 255 for byte in digest[:7]]
+
+
+# /v1/embeddings of the stub server: failures[i] is the reply to the i-th request (None = answer)
+class EmbeddingsRoute:
+
+    def __init__(self):
+        self.failures = []
+        self.inputs = []
+
+    def __call__(self, body):
+        self.inputs.append(list(body["input"]))
+        if self.failures:
+            failure = self.failures.pop(0)
+            if failure is not None:
+                return failure
+        data = []
+        for i, text in enumerate(body["input"]):
+            vector = _vector(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.array(vector, dtype=np.float32).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        # answered out of order, as the API may; the backend sorts by index
+        return 200, {"object": "list", "data": data[::-1], "model": body["model"],
+                     "usage": {"prompt_tokens": len(data), "total_tokens": len(data)}}
+
+
+@pytest.fixture
+def backend(openai_stub, monkeypatch):
+    route = EmbeddingsRoute()
+    openai_stub.routes["/embeddings"] = route
+    backend = OpenAIEmbeddingBackend(batch_size=3, max_retries=3, retry_base_delay=0.5)
+    monkeypatch.setattr(Custom_evaluation, "embedding_backend", backend)
+    monkeypatch.setattr(Custom_evaluation, "embedding_store", None)
+    delays = []
+    monkeypatch.setattr("embedding_backends.time.sleep", delays.append)
+    route.backend, route.delays = backend, delays
+    return route
+
+
+def _write_pairs(tmp_path, n_files):
+    pairs = []
+    for i in range(n_files):
+        gt = {field: f"{field} {i} gt" for field in SEMANTIC_FIELDS}
+        pred = {field: (f"{field} {i} gt" if i % 2 == 0 else f"{field} {i} pred") for field in SEMANTIC_FIELDS}
+        gt_file, pred_file = tmp_path / f"file{i}.json", tmp_path / f"file{i}_form.json"
+        gt_file.write_text(json.dumps(gt), encoding="utf-8")
+        pred_file.write_text(json.dumps(pred), encoding="utf-8")
+        pairs.append((gt_file, pred_file))
+    return pairs
+
+
+def test_values_are_embedded_in_batches_and_records_keep_file_order(tmp_path, backend):
+    pairs = _write_pairs(tmp_path, 5)
+
+    records = C_evaluate_records(pairs[::-1])
+
+    texts = [text for request in backend.inputs for text in request]
+    assert all(len(request) <= 3 for request in backend.inputs)
+    assert len(backend.inputs) == -(-len(texts) // 3)
+    # each distinct value goes out once: even files repeat their GT values
+    assert len(texts) == len(set(texts)) == 5 * 4 + 2 * 4
+    assert [record["pred_file"] for record in records] == [pred.name for _, pred in pairs[::-1]]
+    for record in records:
+        i = int(record["file"][len("file"):-len(".json")])
+        similarities = [result["similarity"] for result in record["fields"] if "similarity" in result]
+        if i % 2 == 0:
+            assert similarities == pytest.approx([1.0] * 4)
+        else:
+            assert all(similarity < 1.0 for similarity in similarities)
+
+
+def test_transient_errors_are_retried_with_jittered_backoff(tmp_path, backend):
+    backend.failures = [api_error(429), api_error(503), None, (None, None)]
+
+    records = C_evaluate_records(_write_pairs(tmp_path, 1))
+
+    # 4 distinct values in 2 batches, plus two retries of the first batch and one of the second
+    # (a rate limit, a server error and a dropped connection); the client itself does not retry
+    requests = backend.inputs
+    assert len(requests) == 5
+    assert requests[0] == requests[1] == requests[2]
+    assert requests[3] == requests[4]
+    assert len(backend.delays) == 3
+    for delay, attempt in zip(backend.delays, (0, 1, 0)):
+        assert 0.5 * 2 ** attempt * 0.5 <= delay <= 0.5 * 2 ** attempt
+    similarities = [result["similarity"] for result in records[0]["fields"] if "similarity" in result]
+    assert similarities == pytest.approx([1.0] * 4)
+
+
+def test_retries_give_up_after_max_retries(tmp_path, backend):
+    from openai import RateLimitError
+    backend.failures = [api_error(429)] * 10
+
+    with pytest.raises(RateLimitError):
+        C_evaluate_records(_write_pairs(tmp_path, 1))
+    assert len(backend.inputs) == backend.backend.max_retries + 1
+
+
+def test_other_errors_are_not_retried(tmp_path, backend):
+    from openai import BadRequestError
+    backend.failures = [api_error(400, "bad request")]
+
+    with pytest.raises(BadRequestError):
+        C_evaluate_records(_write_pairs(tmp_path, 1))
+    assert len(backend.inputs) == 1
+
+
+def test_cosine_of_identical_vectors_is_one():
+    rows = np.array([_vector("a"), _vector("b")])
+    assert Custom_evaluation._cosine_rows(rows, rows) == pytest.approx([1.0, 1.0])
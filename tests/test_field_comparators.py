@@ -0,0 +1,90 @@
+import pytest
+from field_comparators import (
+    compare_exact, compare_normalized, compare_fuzzy, compare_datetime, parse_date_time, score_field_pairs,
+    comparator_name, COMPARATORS,
+)
+
+
+def test_exact_only_ignores_surrounding_whitespace():
+    assert compare_exact(" Kyllä\n", "Kyllä") == 1.0
+    assert compare_exact("Kyllä", "kyllä") == 0.0
+    assert compare_exact(1, "1") == 1.0
+
+
+def test_normalized_ignores_case_spacing_and_punctuation():
+    assert compare_normalized("Vaaratilanne.", "  vaaratilanne ") == 1.0
+    assert compare_normalized("Matti  Meikäläinen", "matti meikäläinen") == 1.0
+    # composed and decomposed ä are the same letter
+    assert compare_normalized("Kes\u00e4", "Kesa\u0308") == 1.0
+    assert compare_normalized("Kyllä", "Ei") == 0.0
+
+
+def test_fuzzy_is_a_similarity_ratio_of_the_normalized_values():
+    assert compare_fuzzy("Helsinki, Pasila", "helsinki pasila") == pytest.approx(30 / 31)
+    assert compare_fuzzy("Rakennusliike Oy", "Rakennusliike Oy.") == 1.0
+    assert 0.5 < compare_fuzzy("Matti Meikäläinen", "Mati Meikäläinen") < 1.0
+    assert compare_fuzzy("abc", "xyz") == 0.0
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("12.3.2024 klo 14.30", ((2024, 3, 12), (14, 30))),
+    ("ma 12.03.24 klo 9:05", ((2024, 3, 12), (9, 5))),
+    ("2024-03-12T14:30", ((2024, 3, 12), (14, 30))),
+    ("klo 14.30.", (None, (14, 30))),
+    ("14.30", (None, (14, 30))),
+    # a Finnish date without a year is not a time
+    ("12.03.", (None, None)),
+    ("ke 12.03. klo 14.30", (None, (14, 30))),
+    ("25.61", (None, None)),
+    ("aamupäivällä", (None, None)),
+])
+def test_parse_date_time(value, expected):
+    assert parse_date_time(value) == expected
+
+
+def test_datetime_scores_the_share_of_gt_parts_right():
+    assert compare_datetime("12.3.2024 klo 14.30", "2024-03-12T14:30") == 1.0
+    assert compare_datetime("12.3.2024 klo 14.30", "12.3.2024 klo 15.00") == 0.5
+    assert compare_datetime("12.3.2024", "13.3.2024 klo 8.00") == 0.0
+    assert compare_datetime("klo 9.05", "12.3.2024 klo 9:05") == 1.0
+
+
+def test_datetime_does_not_match_a_yearless_date_as_a_time():
+    # "12.03." used to be read as 12:03, matching a wrong time and hiding the right one
+    assert compare_datetime("klo 12.03", "12.03.") == 0.0
+    assert compare_datetime("ke 12.03. klo 14.30", "klo 14.30") == 1.0
+    # without a date or time in the GT the values are compared as text
+    assert compare_datetime("12.03.", "12.03.") == 1.0
+
+
+def test_embedding_fields_are_scored_in_one_batch_in_order():
+    calls = []
+
+    def embed_pairs(pairs):
+        calls.append(pairs)
+        return [0.25 * (i + 1) for i in range(len(pairs))]
+
+    similarities = score_field_pairs([
+        ("Ehdotus", "Lisää kaiteita", "Kaiteet lisätään"),
+        ("Kuva", "Kyllä", "kyllä"),
+        ("Mahdolliset seuraukset", "Putoaminen", "Kaatuminen"),
+    ], embed_pairs)
+
+    assert COMPARATORS["embedding"] is None
+    assert calls == [[("Lisää kaiteita", "Kaiteet lisätään"), ("Putoaminen", "Kaatuminen")]]
+    assert similarities == [0.25, 1.0, 0.5]
+
+
+def test_no_embedding_call_without_embedding_fields():
+
+    def embed_pairs(pairs):
+        raise AssertionError("embeddings were requested")
+
+    assert score_field_pairs([("Kuva", "Ei", "ei")], embed_pairs) == [1.0]
+    assert score_field_pairs([("Ehdotus", "a", "a")], embed_pairs, {"Ehdotus": "exact"}) == [1.0]
+
+
+def test_unknown_comparators_are_rejected():
+    assert comparator_name("Uusi kenttä") == "embedding"
+    with pytest.raises(ValueError):
+        comparator_name("Kuva", {"Kuva": "regex"})
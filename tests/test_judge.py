@@ -0,0 +1,104 @@
+import json
+import asyncio
+import pytest
+import JudgeLLM
+from JudgeLLM import G_evaluate_records, VerdictStore
+
+
+# judge model adapter stand-in; the GEval metric below does the "judging"
+class FakeModel:
+
+    def __init__(self):
+        self.closed = 0
+
+    def get_model_name(self):
+        return JudgeLLM.JUDGE_MODEL_NAME
+
+    async def a_close(self):
+        self.closed += 1
+
+
+# scores a file by the "score" value of its GT; a GT with "fail" raises like an API error would
+class FakeMetric:
+
+    calls = []
+
+    def __init__(self, model, threshold):
+        self.reason = None
+
+    async def a_measure(self, test_case):
+        gt_data, _extracted = test_case
+        FakeMetric.calls.append(gt_data["name"])
+        await asyncio.sleep(0.01 * gt_data.get("delay", 0))
+        if gt_data.get("fail"):
+            raise RuntimeError("503 from the judge")
+        self.reason = f"judged {gt_data['name']}"
+        return gt_data["score"]
+
+
+@pytest.fixture
+def judge(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setitem(JudgeLLM._judge_model, "model", model)
+    monkeypatch.setattr(JudgeLLM, "_judge_metric", FakeMetric)
+    monkeypatch.setattr(JudgeLLM, "_judge_test_case", lambda gt_data, extracted: (gt_data, extracted))
+    FakeMetric.calls = []
+    return model
+
+
+def _pairs(tmp_path, gts):
+    pairs = []
+    for i, gt in enumerate(gts):
+        gt_file, pred_file = tmp_path / f"file{i}.json", tmp_path / f"file{i}_form.json"
+        gt_file.write_text(json.dumps({"name": f"file{i}", **gt}), encoding="utf-8")
+        pred_file.write_text(json.dumps({"Kuva": "Ei"}), encoding="utf-8")
+        pairs.append((gt_file, pred_file))
+    return pairs
+
+
+def test_a_failing_file_gets_an_error_record_and_the_rest_are_kept(tmp_path, judge):
+    pairs = _pairs(tmp_path, [{"score": 0.9, "delay": 3}, {"fail": True}, {"score": 0.5, "delay": 1}])
+
+    records = G_evaluate_records(pairs, threshold=0.85, concurrency=2)
+
+    assert [record["kind"] for record in records] == ["judge", "judge_error", "judge"]
+    assert records[0]["passed"] and not records[2]["passed"]
+    assert records[1]["file"] == "file1.json" and "503" in records[1]["error"]
+    assert judge.closed == 1
+
+
+def test_failed_files_are_judged_again_on_the_next_run(tmp_path, judge):
+    verdicts = VerdictStore(tmp_path / "verdicts")
+    pairs = _pairs(tmp_path, [{"score": 0.9}, {"fail": True}])
+
+    G_evaluate_records(pairs, threshold=0.85, verdicts=verdicts)
+    G_evaluate_records(pairs, threshold=0.85, verdicts=verdicts)
+
+    assert FakeMetric.calls == ["file0", "file1", "file1"]
+
+
+def test_a_replay_miss_still_stops_the_run(tmp_path, judge):
+    pairs = _pairs(tmp_path, [{"score": 0.9}, {"score": 0.7}])
+    G_evaluate_records(pairs[:1], threshold=0.85, verdicts=VerdictStore(tmp_path / "verdicts"))
+
+    with pytest.raises(LookupError):
+        G_evaluate_records(pairs, threshold=0.85, verdicts=VerdictStore(tmp_path / "verdicts", "replay"))
+    assert FakeMetric.calls == ["file0"]
+
+
+def test_replay_never_builds_the_judge_model(tmp_path, judge, monkeypatch):
+    pairs = _pairs(tmp_path, [{"score": 0.9}, {"score": 0.7}])
+    G_evaluate_records(pairs, threshold=0.85, verdicts=VerdictStore(tmp_path / "verdicts"))
+
+    # a fresh process: no adapter yet, and building one (deepeval, the SDKs, credentials) is not allowed
+    monkeypatch.delitem(JudgeLLM._judge_model, "model")
+
+    def no_model():
+        raise AssertionError("the judge model was built")
+
+    monkeypatch.setattr(JudgeLLM, "judge_model", no_model)
+    records = G_evaluate_records(pairs, threshold=0.8, verdicts=VerdictStore(tmp_path / "verdicts", "replay"))
+
+    assert [record["passed"] for record in records] == [True, False]
+    assert [record["reason"] for record in records] == ["judged file0", "judged file1"]
+    assert FakeMetric.calls == ["file0", "file1"]
@@ -0,0 +1,104 @@
+import random
+from array import array
+import pytest
+import ErrorRateCalculation_levenshtein
+from ErrorRateCalculation_levenshtein import levenshtein_counts, calLevenshteinErros, Vocabulary, EQUAL, SUB, DEL, INS
+
+
+# full-matrix DP, walked back from (n, m) preferring match/substitution, then deletion, then insertion.
+# strip_affixes=True aligns a matching prefix and suffix as matches first, as the engine does
+def reference_alignment(ids1, ids2, strip_affixes: bool = True):
+    if strip_affixes:
+        start = 0
+        while start < min(len(ids1), len(ids2)) and ids1[start] == ids2[start]:
+            start += 1
+        suffix = 0
+        while (suffix < min(len(ids1), len(ids2)) - start
+               and ids1[len(ids1) - 1 - suffix] == ids2[len(ids2) - 1 - suffix]):
+            suffix += 1
+        middle = reference_alignment(ids1[start:len(ids1) - suffix], ids2[start:len(ids2) - suffix], False)
+        return [EQUAL] * start + middle + [EQUAL] * suffix
+
+    n, m = len(ids1), len(ids2)
+    d = [[i + j if i == 0 or j == 0 else 0 for j in range(m + 1)] for i in range(n + 1)]
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            cost = 0 if ids1[i - 1] == ids2[j - 1] else 1
+            d[i][j] = min(d[i - 1][j - 1] + cost, d[i - 1][j] + 1, d[i][j - 1] + 1)
+
+    ops = []
+    i, j = n, m
+    while i > 0 and j > 0:
+        cost = 0 if ids1[i - 1] == ids2[j - 1] else 1
+        if d[i - 1][j - 1] + cost == d[i][j]:
+            ops.append(SUB if cost else EQUAL)
+            i, j = i - 1, j - 1
+        elif d[i - 1][j] + 1 == d[i][j]:
+            ops.append(DEL)
+            i -= 1
+        else:
+            ops.append(INS)
+            j -= 1
+    ops += [DEL] * i + [INS] * j
+    return ops[::-1]
+
+
+def _expand(ops, runs):
+    return [op for op, length in zip(ops, runs) for _ in range(length)]
+
+
+def _random_pairs(seed, count, max_words=30, max_vocabulary=6):
+    rnd = random.Random(seed)
+    for _ in range(count):
+        vocabulary = rnd.randint(1, max_vocabulary)
+        ids1 = array("I", [rnd.randrange(vocabulary) for _ in range(rnd.randint(0, max_words))])
+        ids2 = array("I", [rnd.randrange(vocabulary) for _ in range(rnd.randint(0, max_words))])
+        yield ids1, ids2
+
+
+def test_counts_and_alignment_match_the_reference_dp():
+    for ids1, ids2 in _random_pairs(0, 2000):
+        expected = reference_alignment(ids1, ids2)
+        num_subs, num_del, num_ins, (ops, runs) = levenshtein_counts(ids1, ids2, opcodes=True)
+        assert _expand(ops, runs) == expected
+        assert (num_subs, num_del, num_ins) == (expected.count(SUB), expected.count(DEL), expected.count(INS))
+        # the matching affixes never change the counts
+        unstripped = reference_alignment(ids1, ids2, strip_affixes=False)
+        assert (num_subs, num_del, num_ins) == (unstripped.count(SUB), unstripped.count(DEL), unstripped.count(INS))
+        assert levenshtein_counts(ids1, ids2) == (num_subs, num_del, num_ins)
+
+
+@pytest.mark.parametrize("block", [1, 2, 3, 7])
+def test_checkpointed_traceback_gives_the_same_alignment(monkeypatch, block):
+    monkeypatch.setattr(ErrorRateCalculation_levenshtein, "_block_columns", lambda n, m: block)
+    for ids1, ids2 in _random_pairs(block, 500):
+        num_subs, num_del, num_ins, (ops, runs) = levenshtein_counts(ids1, ids2, opcodes=True)
+        assert _expand(ops, runs) == reference_alignment(ids1, ids2)
+
+
+def test_long_inputs_keep_only_block_checkpoints(monkeypatch):
+    blocks = []
+
+    def block_columns(n, m):
+        blocks.append(ErrorRateCalculation_levenshtein.isqrt(m))
+        return blocks[-1]
+
+    monkeypatch.setattr(ErrorRateCalculation_levenshtein, "_block_columns", block_columns)
+    rnd = random.Random(1)
+    ids1 = array("I", [rnd.randrange(50) for _ in range(400)])
+    ids2 = array("I", [rnd.randrange(50) if k % 5 == 0 else token_id for k, token_id in enumerate(ids1)])
+    del ids2[100:120]
+    ids2[300:300] = array("I", [7] * 15)
+
+    num_subs, num_del, num_ins, (ops, runs) = levenshtein_counts(ids1, ids2, opcodes=True)
+
+    assert len(blocks) == 1 and blocks[0] * 4 < len(ids2)
+    assert _expand(ops, runs) == reference_alignment(ids1, ids2)
+
+
+def test_rates_are_per_gt_word():
+    wer, deleted_rate, added_rate, counts = calLevenshteinErros(
+        "a b c d".split(), "a x c d e".split(), Vocabulary()
+    )
+    assert counts == (1, 0, 1)
+    assert (wer, deleted_rate, added_rate) == (50, 0, 25)
@@ -0,0 +1,45 @@
+import csv
+import pytest
+from report_sink import ReportSink
+
+
+def _read_csv(path):
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_sections_stay_in_the_text_report_only(tmp_path):
+    with ReportSink(tmp_path / "report.txt", ("text", "csv", "jsonl")) as report:
+        report.section("Finnish Clips\n")
+        report.add({"kind": "spelling", "file": "a.txt", "transcription_words": 3, "spelling_rate": 0.0,
+                    "spelling_errors": []})
+
+    assert (tmp_path / "report.txt").read_text(encoding="utf-8").startswith("Finnish Clips\n")
+    assert sorted(path.name for path in tmp_path.glob("*.csv")) == ["report_spelling.csv"]
+    assert len((tmp_path / "report.jsonl").read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_appended_csv_rows_keep_every_column(tmp_path):
+    with ReportSink(tmp_path / "report.txt", ("csv",)) as report:
+        report.add({"kind": "wer", "file": "a.txt", "wer": 10.0})
+    with ReportSink(tmp_path / "report.txt", ("csv",)) as report:
+        report.add({"kind": "wer", "file": "b.txt", "wer": 20.0, "spelling_rate": 5.0})
+
+    rows = _read_csv(tmp_path / "report_wer.csv")
+    assert [row["file"] for row in rows] == ["a.txt", "b.txt"]
+    assert [row["spelling_rate"] for row in rows] == ["", "5.0"]
+
+
+def test_parquet_tables_leave_out_sections(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    with ReportSink(tmp_path / "report.txt", ("parquet",)) as report:
+        report.section("Heading\n")
+        report.add({"kind": "wer", "file": "a.txt", "wer": 10.0})
+    with ReportSink(tmp_path / "report.txt", ("parquet",)) as report:
+        report.add({"kind": "wer", "file": "b.txt", "wer": 20.0, "deleted_rate": 1.0})
+
+    assert sorted(path.name for path in tmp_path.glob("*.parquet")) == ["report_wer.parquet"]
+    assert pq.read_table(tmp_path / "report_wer.parquet").to_pylist() == [
+        {"file": "a.txt", "kind": "wer", "wer": 10.0, "deleted_rate": None},
+        {"file": "b.txt", "kind": "wer", "wer": 20.0, "deleted_rate": 1.0},
+    ]